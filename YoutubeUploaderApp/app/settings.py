@@ -150,6 +150,60 @@ LOGOUT_REDIRECT_URL = 'uploader:login'
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET', '')
 
+# Przetwarzanie wideo
+# Liczba równoległych procesów FFmpeg przy cięciu jednego wideo (1 = sekwencyjnie)
+VIDEO_PROCESSING_WORKERS = int(os.getenv('VIDEO_PROCESSING_WORKERS', os.cpu_count() or 1))
+# Silnik cięcia: 'segments' (osobny FFmpeg na segment) lub 'single_pass' (jedno dekodowanie źródła)
+VIDEO_PROCESSING_ENGINE = os.getenv('VIDEO_PROCESSING_ENGINE', 'segments')
+# Granice shortów: 'content' (cięcie w ciszy / na zmianie sceny) lub 'fixed' (stała długość)
+VIDEO_SEGMENT_PLANNER = os.getenv('VIDEO_SEGMENT_PLANNER', 'content')
+# Plik pośredni: źródło kodowane raz do 9:16 z krótkim GOP, kolejne cięcia kopiują strumień
+VIDEO_MEZZANINE_ENABLED = os.getenv('VIDEO_MEZZANINE_ENABLED', 'False') == 'True'
+VIDEO_MEZZANINE_GOP = float(os.getenv('VIDEO_MEZZANINE_GOP', 1))
+
+# Cache zakodowanych segmentów (klucz: hash źródła, fragment, kadrowanie, profil)
+ENCODE_CACHE_ENABLED = os.getenv('ENCODE_CACHE_ENABLED', 'True') == 'True'
+ENCODE_CACHE_DIR = os.getenv('ENCODE_CACHE_DIR', str(MEDIA_ROOT / 'encode_cache'))
+ENCODE_CACHE_MAX_SIZE_MB = int(os.getenv('ENCODE_CACHE_MAX_SIZE_MB', 10240))
+# Maksymalny odstęp (s) między skanami limitu rozmiaru cache
+ENCODE_CACHE_EVICT_INTERVAL = int(os.getenv('ENCODE_CACHE_EVICT_INTERVAL', 300))
+
+# Wznawialny upload w kawałkach: sugerowany rozmiar kawałka i czas życia porzuconych sesji
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24))
+# Cięcie shortów MP4 (faststart) w trakcie uploadu w kawałkach; przerwij, gdy upload stoi tyle sekund
+VIDEO_PROGRESSIVE_PROCESSING = os.getenv('VIDEO_PROGRESSIVE_PROCESSING', 'False') == 'True'
+VIDEO_PROGRESSIVE_WAIT_TIMEOUT = int(os.getenv('VIDEO_PROGRESSIVE_WAIT_TIMEOUT', 600))
+
+# Minimalny odstęp (s) między zapisami postępu przetwarzania do bazy
+VIDEO_PROGRESS_WRITE_INTERVAL = float(os.getenv('VIDEO_PROGRESS_WRITE_INTERVAL', 2))
+
+# Kolejka przetwarzania (python manage.py run_workers)
+# Maksymalne obciążenie węzła: VIDEO_WORKER_COUNT * VIDEO_PROCESSING_WORKERS procesów FFmpeg
+VIDEO_WORKER_COUNT = int(os.getenv('VIDEO_WORKER_COUNT', 1))
+VIDEO_JOB_MAX_ATTEMPTS = int(os.getenv('VIDEO_JOB_MAX_ATTEMPTS', 3))
+# Zadanie bez heartbeatu przez tyle sekund uznawane jest za osierocone
+VIDEO_JOB_HEARTBEAT_TIMEOUT = int(os.getenv('VIDEO_JOB_HEARTBEAT_TIMEOUT', 300))
+# Profil kodowania: 'auto' (dobór do kolejki) lub quality / balanced / fast / fastest
+VIDEO_ENCODE_PROFILE = os.getenv('VIDEO_ENCODE_PROFILE', 'auto')
+# Docelowy czas (s) opróżnienia kolejki - po przekroczeniu wybierany jest szybszy profil
+VIDEO_ENCODE_LATENCY_TARGET = int(os.getenv('VIDEO_ENCODE_LATENCY_TARGET', 1800))
+ENCODER_CALIBRATION_MAX_AGE_DAYS = int(os.getenv('ENCODER_CALIBRATION_MAX_AGE_DAYS', 7))
+
+# Tokeny YouTube wygasające w ciągu tylu sekund są odświeżane z wyprzedzeniem
+# (run_workers co minutę lub refresh_youtube_tokens z crona)
+YT_TOKEN_REFRESH_MARGIN = int(os.getenv('YT_TOKEN_REFRESH_MARGIN', 600))
+# Statystyki shorta starsze niż tyle sekund są odświeżane w tle przy wejściu na stronę
+SHORT_STATS_TTL = int(os.getenv('SHORT_STATS_TTL', 900))
+# Dzienny limit jednostek YouTube Data API na konto (projekt Google Cloud użytkownika)
+YT_DAILY_QUOTA = int(os.getenv('YT_DAILY_QUOTA', 10000))
+
+# Watchdog FFmpeg: zabij proces bez postępu przez FFMPEG_STALL_TIMEOUT sekund
+# lub trwający dłużej niż FFMPEG_TIMEOUT_BASE + FFMPEG_TIMEOUT_FACTOR * długość materiału
+FFMPEG_STALL_TIMEOUT = int(os.getenv('FFMPEG_STALL_TIMEOUT', 120))
+FFMPEG_TIMEOUT_BASE = int(os.getenv('FFMPEG_TIMEOUT_BASE', 300))
+FFMPEG_TIMEOUT_FACTOR = float(os.getenv('FFMPEG_TIMEOUT_FACTOR', 10))
+
 # Logging
 LOGGING = {
     'version': 1,
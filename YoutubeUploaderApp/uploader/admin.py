@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Role, YTAccount, Video, Short, ShortSuggestion
+from .models import User, Role, YTAccount, Video, Short, ShortSuggestion, MediaProbe, ProcessingJob, UploadSession, EncoderCalibration, YTQuotaUsage
 
 
 @admin.register(Role)
@@ -40,7 +40,7 @@ class YTAccountAdmin(admin.ModelAdmin):
             'fields': ('user', 'channel_name', 'channel_id')
         }),
         ('Tokeny OAuth', {
-            'fields': ('access_token', 'refresh_token', 'token_expiry'),
+            'fields': ('access_token', 'refresh_token', 'token_expiry', 'token_refresh_lease'),
             'classes': ('collapse',)
         }),
         ('Daty', {
@@ -135,3 +135,39 @@ class ShortSuggestionAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related('short', 'short__video')
+
+
+@admin.register(MediaProbe)
+class MediaProbeAdmin(admin.ModelAdmin):
+    list_display = ('path', 'file_size', 'updated_at')
+    search_fields = ('path',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('video', 'status', 'encode_profile', 'attempts', 'worker_id', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('video__title', 'worker_id')
+    readonly_fields = ('created_at', 'updated_at', 'claimed_at', 'finished_at')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'status', 'offset', 'size', 'updated_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('filename', 'user__username')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(EncoderCalibration)
+class EncoderCalibrationAdmin(admin.ModelAdmin):
+    list_display = ('host', 'profile', 'fps', 'measured_at')
+    list_filter = ('host',)
+
+
+@admin.register(YTQuotaUsage)
+class YTQuotaUsageAdmin(admin.ModelAdmin):
+    list_display = ('yt_account', 'day', 'units', 'exhausted', 'updated_at')
+    list_filter = ('day', 'exhausted')
+    search_fields = ('yt_account__channel_name',)
@@ -0,0 +1,274 @@
+"""
+Wznawialny upload plików wideo w kawałkach (protokół w stylu tus)
+
+1. Utworzenie sesji - dane wideo, nazwa i rozmiar pliku
+2. Zapytanie o offset - ile bajtów serwer ma już trwale zapisane
+3. Wysłanie kawałka z nagłówkiem Upload-Offset - idempotentne, ponowne
+   wysłanie tego samego kawałka niczego nie psuje; 410 oznacza sesję
+   zakończoną lub przerwaną (trzeba zacząć od nowa)
+4. Zatwierdzenie - plik trafia atomowo pod docelową nazwę, powstaje
+   Video i zadanie w kolejce przetwarzania
+
+Kawałki są zapisywane od razu w docelowym katalogu storage (plik `.part`),
+więc po zatwierdzeniu nic nie jest kopiowane. Przy VIDEO_PROGRESSIVE_PROCESSING
+wideo MP4 typu faststart trafia do kolejki, gdy tylko dotrze atom moov
+(patrz progressive.py).
+"""
+import os
+import logging
+from datetime import timedelta
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from django.conf import settings
+from .models import UploadSession, Video
+from .probe_cache import file_sha256
+from .upload_handlers import HEADER_SIZE, detect_video_format, reserve_video_path
+from .video_processing import find_duplicate_source
+from .job_queue import enqueue_video_processing
+from . import progressive
+
+logger = logging.getLogger(__name__)
+
+# Rozmiar bloku przy przepisywaniu strumienia żądania na dysk
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Błąd protokołu uploadu - status HTTP i bieżący offset dla klienta"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _partial_path(session):
+    return progressive.partial_path(session)
+
+
+def get_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def create_session(user, filename, size, video_data):
+    """
+    Rozpoczyna upload: rezerwuje docelową nazwę pliku i tworzy pusty plik `.part`.
+
+    Args:
+        video_data: Pola Video ustawiane po zatwierdzeniu (title, description,
+                    target_duration, max_shorts_count, crop_mode)
+    """
+    stored_name, path = reserve_video_path(filename)
+    # Docelowy rozmiar od razu (plik rzadki) - indeks MP4 wskazuje wtedy
+    # pozycje danych, które jeszcze nie dotarły (przetwarzanie progresywne)
+    with open(f'{path}.part', 'wb') as f:
+        f.truncate(size)
+
+    session = UploadSession.objects.create(
+        user=user,
+        filename=filename,
+        stored_name=stored_name,
+        size=size,
+        video_data=video_data,
+    )
+    logger.info(f"Upload session {session.id} started: {filename} ({size} bytes)")
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Zapisuje kawałek pliku od pozycji `offset`.
+
+    Kawałek może zaczynać się najpóźniej na bieżącym offsecie sesji (bez
+    dziur). Zapis na pozycji jest idempotentny - powtórzony kawałek
+    nadpisuje te same bajty. Offset w bazie rośnie dopiero po fsync,
+    więc zawsze oznacza dane trwale zapisane na dysku.
+
+    Args:
+        stream: Obiekt z metodą read() (np. HttpRequest)
+        length: Liczba bajtów kawałka (Content-Length)
+
+    Returns:
+        int: Nowy offset sesji
+    """
+    if session.status != 'uploading':
+        # 410 - klient nie może tego naprawić ponowieniem, musi zacząć nową sesję
+        raise UploadError('Upload został już zakończony lub przerwany.', status=410, offset=session.offset)
+    if offset > session.offset:
+        raise UploadError('Nieciągły kawałek - sprawdź offset.', status=409, offset=session.offset)
+    if offset + length > session.size:
+        raise UploadError('Kawałek wykracza poza zadeklarowany rozmiar pliku.', status=400, offset=session.offset)
+
+    written = 0
+    with open(_partial_path(session), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            if offset + written == 0 and len(data) >= HEADER_SIZE and detect_video_format(data) is None:
+                # Nie wideo - nie ma sensu przyjmować reszty pliku
+                abort_session(session)
+                raise UploadError('Plik nie jest prawidłowym plikiem wideo.', status=415, offset=0)
+            f.write(data)
+            written += len(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    end = offset + written
+    # Warunkowy UPDATE - równoległe powtórzenie kawałka nie cofnie offsetu
+    UploadSession.objects.filter(
+        pk=session.pk, status='uploading', offset__gte=offset, offset__lt=end
+    ).update(offset=end, updated_at=timezone.now())
+    session.refresh_from_db(fields=['offset', 'status', 'updated_at'])
+
+    if progressive.is_enabled() and session.video_id is None and session.status == 'uploading':
+        try:
+            start_progressive(session)
+        except Exception as e:
+            logger.error(f"Cannot start progressive processing for upload {session.id}: {str(e)}")
+
+    if written < length:
+        raise UploadError('Przerwany transfer kawałka.', status=400, offset=session.offset)
+    return session.offset
+
+
+def _build_video(session, **fields):
+    """Video z danych formularza zapisanych w sesji"""
+    data = session.video_data
+    return Video(
+        user=session.user,
+        title=data.get('title', session.filename),
+        description=data.get('description', ''),
+        target_duration=data.get('target_duration', 60),
+        max_shorts_count=data.get('max_shorts_count', 10),
+        video_file=session.stored_name,
+        status='uploaded',
+        **fields
+    )
+
+
+def start_progressive(session):
+    """
+    Tworzy wideo i dodaje je do kolejki przed końcem uploadu, jeśli plik
+    to MP4 z atomem moov na początku i moov jest już w całości na dysku.
+
+    Returns:
+        Video lub None
+    """
+    if progressive.moov_available(_partial_path(session), session.offset) is not True:
+        return None
+
+    video = _build_video(session)
+    video.file_size = session.size
+    video.save()
+    # Równoległy kawałek mógł już uruchomić przetwarzanie tej sesji
+    claimed = UploadSession.objects.filter(pk=session.pk, video__isnull=True).update(video=video)
+    if not claimed:
+        video.delete()
+        return None
+    session.video = video
+
+    enqueue_video_processing(video, session.video_data.get('crop_mode', 'center'))
+    logger.info(f"Upload session {session.id}: progressive processing of video {video.id} "
+                f"started at {session.offset}/{session.size} bytes")
+    return video
+
+
+def commit_session(session):
+    """
+    Kończy upload: sprawdza kompletność i nagłówek, liczy SHA-256, przenosi
+    plik atomowo pod docelową nazwę, tworzy Video i dodaje je do kolejki.
+    Ponowne zatwierdzenie zakończonej sesji zwraca to samo wideo.
+
+    Returns:
+        Video: Utworzone wideo
+    """
+    if session.status == 'completed':
+        return session.video
+    if session.status == 'aborted':
+        raise UploadError('Upload został przerwany.', status=410, offset=session.offset)
+    if not session.is_complete():
+        raise UploadError('Plik nie został jeszcze w całości wysłany.', status=409, offset=session.offset)
+
+    # Tylko jedno zatwierdzenie może przejść dalej
+    claimed = UploadSession.objects.filter(pk=session.pk, status='uploading').update(status='committing')
+    if not claimed:
+        session.refresh_from_db()
+        if session.status == 'completed':
+            return session.video
+        if session.status == 'aborted':
+            raise UploadError('Upload został przerwany.', status=410, offset=session.offset)
+        raise UploadError('Upload jest już zatwierdzany.', status=409, offset=session.offset)
+
+    partial_path = _partial_path(session)
+    try:
+        with open(partial_path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if detect_video_format(header) is None:
+            raise UploadError('Plik nie jest prawidłowym plikiem wideo.', status=415, offset=session.offset)
+
+        sha256 = file_sha256(partial_path)
+        os.replace(partial_path, default_storage.path(session.stored_name))
+    except Exception:
+        abort_session(session)
+        raise
+
+    if session.video_id:
+        # Przetwarzanie progresywne już trwa (lub się zakończyło)
+        video = session.video
+        video.source_sha256 = sha256
+        video.save(update_fields=['source_sha256', 'updated_at'])
+        session.status = 'completed'
+        session.save(update_fields=['status', 'updated_at'])
+        if video.status == 'failed':
+            enqueue_video_processing(video, session.video_data.get('crop_mode', 'center'))
+        logger.info(f"Upload session {session.id} committed (progressive video {video.id})")
+        return video
+
+    data = session.video_data
+    video = _build_video(session, source_sha256=sha256)
+
+    # Ten sam plik już jest na dysku - współdziel go zamiast trzymać kopię
+    duplicate = find_duplicate_source(sha256)
+    if duplicate:
+        default_storage.delete(session.stored_name)
+        video.video_file = duplicate.video_file.name
+        logger.info(f"Upload session {session.id} is a duplicate of video {duplicate.id}")
+    video.save()
+
+    session.video = video
+    session.status = 'completed'
+    session.save(update_fields=['video', 'status', 'updated_at'])
+
+    enqueue_video_processing(video, data.get('crop_mode', 'center'))
+    logger.info(f"Upload session {session.id} committed as video {video.id}")
+    return video
+
+
+def abort_session(session):
+    """Przerywa upload i usuwa zapisane dane (także zarezerwowaną nazwę)"""
+    for path in (_partial_path(session), default_storage.path(session.stored_name)):
+        if os.path.exists(path):
+            os.remove(path)
+    session.status = 'aborted'
+    session.save(update_fields=['status', 'updated_at'])
+    logger.info(f"Upload session {session.id} aborted at {session.offset}/{session.size} bytes")
+
+
+def purge_expired_sessions(max_age_hours=None):
+    """Przerywa sesje porzucone dłużej niż UPLOAD_SESSION_TTL_HOURS"""
+    if max_age_hours is None:
+        max_age_hours = getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+
+    expired = UploadSession.objects.filter(
+        Q(status='uploading') | Q(status='committing'),
+        updated_at__lt=cutoff
+    )
+    count = 0
+    for session in expired:
+        abort_session(session)
+        count += 1
+    return count
@@ -0,0 +1,177 @@
+"""
+Cache zakodowanych segmentów adresowany zawartością
+
+Klucz to SHA-256 z (hash źródła, start, długość, tryb kadrowania, profil
+kodowania), więc ponowienia, ponowne uploady tego samego pliku i ten sam
+materiał od różnych użytkowników nie są kodowane drugi raz. Trafienia są
+dowiązywane twardo (lub kopiowane) do katalogu shorta. Rozmiar cache jest
+ograniczony - przy przekroczeniu usuwane są najdawniej używane wpisy
+(czas modyfikacji odświeżany przy każdym trafieniu). Katalog cache jest
+skanowany dopiero, gdy od ostatniego skanu dopisano dziesiątą część limitu
+lub minęło ENCODE_CACHE_EVICT_INTERVAL sekund, a nie po każdym zapisie.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+from pathlib import Path
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Zmiana wersji unieważnia wszystkie wpisy (np. po zmianie sposobu kodowania)
+CACHE_VERSION = 1
+
+_evict_lock = threading.Lock()
+
+# Bajty dopisane od ostatniego skanu i jego czas (monotoniczny) - stan procesu
+_written_since_scan = 0
+_last_scan = None
+
+
+def is_enabled():
+    return getattr(settings, 'ENCODE_CACHE_ENABLED', False)
+
+
+def get_cache_dir():
+    return Path(getattr(settings, 'ENCODE_CACHE_DIR', Path(settings.MEDIA_ROOT) / 'encode_cache'))
+
+
+def make_key(source_hash, start_time, duration, crop_mode, profile):
+    """
+    Klucz wpisu: SHA-256 z parametrów, które wyznaczają zawartość pliku wynikowego.
+
+    Args:
+        source_hash: SHA-256 zawartości pliku źródłowego
+        start_time, duration: Fragment w sekundach
+        crop_mode: Tryb kadrowania
+        profile: Argumenty kodowania (lista lub tekst)
+    """
+    payload = json.dumps([
+        CACHE_VERSION,
+        source_hash,
+        round(float(start_time), 3),
+        round(float(duration), 3),
+        crop_mode,
+        profile,
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _entry_path(key):
+    return get_cache_dir() / key[:2] / f'{key}.mp4'
+
+
+def _link_or_copy(source, destination):
+    """Dowiązanie twarde (atomowo przez plik tymczasowy), kopia gdy inny system plików"""
+    temp_path = f'{destination}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+def fetch(key, output_path):
+    """
+    Umieszcza wpis z cache w output_path.
+
+    Returns:
+        bool: True przy trafieniu
+    """
+    entry = _entry_path(key)
+    try:
+        # Odśwież czas użycia (LRU)
+        os.utime(entry)
+        _link_or_copy(entry, output_path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Encode cache read failed for {key}: {str(e)}")
+        return False
+
+    logger.info(f"Encode cache hit {key[:12]} -> {output_path}")
+    return True
+
+
+def get_max_bytes():
+    return getattr(settings, 'ENCODE_CACHE_MAX_SIZE_MB', 10240) * 1024 * 1024
+
+
+def store(key, output_path):
+    """Dodaje gotowy plik do cache i pilnuje limitu rozmiaru"""
+    global _written_since_scan
+
+    entry = _entry_path(key)
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(output_path, entry)
+        size = entry.stat().st_size
+    except OSError as e:
+        logger.warning(f"Encode cache write failed for {key}: {str(e)}")
+        return False
+
+    with _evict_lock:
+        _written_since_scan += size
+
+    if _eviction_due():
+        evict()
+    return True
+
+
+def _eviction_due():
+    """Czy od ostatniego skanu dopisano 1/10 limitu lub minął interwał"""
+    with _evict_lock:
+        if _last_scan is None or _written_since_scan >= get_max_bytes() // 10:
+            return True
+        interval = getattr(settings, 'ENCODE_CACHE_EVICT_INTERVAL', 300)
+        return time.monotonic() - _last_scan >= interval
+
+
+def evict(max_bytes=None):
+    """
+    Usuwa najdawniej używane wpisy, aż rozmiar cache zmieści się w limicie.
+
+    Wpisy dowiązane twardo do katalogów shortów (st_nlink > 1) są pomijane -
+    ich usunięcie nie zwalnia miejsca na dysku.
+    """
+    global _written_since_scan, _last_scan
+
+    if max_bytes is None:
+        max_bytes = get_max_bytes()
+
+    with _evict_lock:
+        _written_since_scan = 0
+        _last_scan = time.monotonic()
+
+        entries = []
+        total = 0
+        for entry in get_cache_dir().glob('*/*.mp4'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink > 1:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        if total <= max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, entry in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        logger.info(f"Encode cache evicted {removed} entries")
+        return removed
@@ -0,0 +1,178 @@
+"""
+Profile kodowania shortów dobierane do długości kolejki
+
+Przy starcie workerów mierzona jest szybkość kodowania (klatki/s) każdego
+profilu na bieżącym węźle (testsrc2 w rozdzielczości shorta). Przy pobraniu
+zadania szacowany jest czas opróżnienia kolejki - jeśli przekracza
+VIDEO_ENCODE_LATENCY_TARGET, wybierany jest szybszy preset, a gdy kolejka
+maleje, wraca się do wolniejszego (lepsza jakość przy tym samym bitrate).
+"""
+import socket
+import subprocess
+import threading
+import time
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import EncoderCalibration, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+# Od najwolniejszego (najlepsza jakość) do najszybszego: (preset x264, crf)
+ENCODE_PROFILES = {
+    'quality': ('slow', 22),
+    'balanced': ('medium', 23),
+    'fast': ('veryfast', 23),
+    'fastest': ('ultrafast', 25),
+}
+DEFAULT_PROFILE = 'balanced'
+
+# Materiał testowy kalibracji - rozdzielczość i klatkaż typowego shorta
+CALIBRATION_SIZE = '1080x1920'
+CALIBRATION_RATE = 30
+CALIBRATION_SECONDS = 4
+
+# Klatkaż przyjmowany przy szacowaniu pracy w kolejce
+ASSUMED_FPS = 30
+
+# Powrót do wolniejszego profilu dopiero przy zapasie (histereza)
+DOWNGRADE_MARGIN = 0.7
+
+_current_profile = None
+_profile_lock = threading.Lock()
+
+
+def get_profile_args(profile):
+    """Zwraca (preset, crf) profilu (nieznany profil = domyślny)"""
+    return ENCODE_PROFILES.get(profile) or ENCODE_PROFILES[DEFAULT_PROFILE]
+
+
+def _host():
+    return socket.gethostname()
+
+
+def measure_profile_fps(profile, seconds=CALIBRATION_SECONDS):
+    """Koduje syntetyczny materiał profilem i zwraca zmierzone klatki/s"""
+    preset, crf = get_profile_args(profile)
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-f', 'lavfi',
+        '-i', f'testsrc2=size={CALIBRATION_SIZE}:rate={CALIBRATION_RATE}',
+        '-t', str(seconds),
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-crf', str(crf),
+        '-f', 'null', '-'
+    ]
+    started = time.monotonic()
+    subprocess.run(cmd, capture_output=True, check=True, timeout=seconds * 120)
+    elapsed = max(time.monotonic() - started, 1e-3)
+    return seconds * CALIBRATION_RATE / elapsed
+
+
+def calibrate(force=False):
+    """
+    Mierzy szybkość profili na tym węźle (jeśli pomiar jest starszy niż
+    ENCODER_CALIBRATION_MAX_AGE_DAYS albo force=True).
+
+    Returns:
+        dict: profil -> klatki/s
+    """
+    host = _host()
+    max_age = timedelta(days=getattr(settings, 'ENCODER_CALIBRATION_MAX_AGE_DAYS', 7))
+    existing = {c.profile: c for c in EncoderCalibration.objects.filter(host=host)}
+
+    results = {}
+    for profile in ENCODE_PROFILES:
+        calibration = existing.get(profile)
+        if calibration and not force and timezone.now() - calibration.measured_at < max_age:
+            results[profile] = calibration.fps
+            continue
+        try:
+            fps = measure_profile_fps(profile)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logger.error(f"Encoder calibration of profile '{profile}' failed: {str(e)}")
+            continue
+        EncoderCalibration.objects.update_or_create(
+            host=host, profile=profile,
+            defaults={'fps': fps, 'measured_at': timezone.now()}
+        )
+        results[profile] = fps
+        logger.info(f"Encoder calibration {host} {profile}: {fps:.1f} fps")
+    return results
+
+
+def get_calibration():
+    """Zmierzone klatki/s profili na tym węźle"""
+    return dict(EncoderCalibration.objects.filter(host=_host()).values_list('profile', 'fps'))
+
+
+def backlog_seconds():
+    """Sekundy materiału do zakodowania w zadaniach oczekujących i wykonywanych"""
+    jobs = ProcessingJob.objects.filter(status__in=('queued', 'running')).values_list(
+        'video__duration', 'video__target_duration', 'video__max_shorts_count'
+    )
+    total = 0
+    for duration, target_duration, max_shorts_count in jobs:
+        # Kodowane są co najwyżej max_shorts_count shortów po target_duration
+        limit = target_duration * max_shorts_count
+        total += min(duration, limit) if duration else limit
+    return total
+
+
+def estimate_drain_time(profile, backlog, calibration, parallelism):
+    """Szacowany czas (s) opróżnienia kolejki profilem"""
+    fps = calibration.get(profile)
+    if not fps:
+        return None
+    return backlog * ASSUMED_FPS / (fps * max(1, parallelism))
+
+
+def select_profile(parallelism=1):
+    """
+    Dobiera profil do bieżącej kolejki: najwolniejszy, który mieści się
+    w VIDEO_ENCODE_LATENCY_TARGET, a gdy żaden - najszybszy. Przejście na
+    wolniejszy profil wymaga zapasu (histereza), żeby profil nie skakał.
+    Stały profil można wymusić przez VIDEO_ENCODE_PROFILE.
+
+    Args:
+        parallelism: Liczba działających workerów opróżniających kolejkę
+    """
+    global _current_profile
+
+    configured = getattr(settings, 'VIDEO_ENCODE_PROFILE', 'auto')
+    if configured != 'auto':
+        if configured not in ENCODE_PROFILES:
+            logger.warning(f"Unknown VIDEO_ENCODE_PROFILE '{configured}', using '{DEFAULT_PROFILE}'")
+            return DEFAULT_PROFILE
+        return configured
+
+    calibration = get_calibration()
+    if not calibration:
+        return DEFAULT_PROFILE
+
+    target = getattr(settings, 'VIDEO_ENCODE_LATENCY_TARGET', 1800)
+    backlog = backlog_seconds()
+
+    with _profile_lock:
+        profiles = list(ENCODE_PROFILES)
+        current_index = profiles.index(_current_profile or DEFAULT_PROFILE)
+
+        selected = profiles[-1]
+        for index, profile in enumerate(profiles):
+            drain_time = estimate_drain_time(profile, backlog, calibration, parallelism)
+            if drain_time is None:
+                continue
+            # Wolniejszy niż obecny profil tylko z zapasem
+            limit = target * DOWNGRADE_MARGIN if index < current_index else target
+            if drain_time <= limit:
+                selected = profile
+                break
+
+        if selected != _current_profile:
+            logger.info(f"Encode profile {_current_profile or DEFAULT_PROFILE} -> {selected} "
+                        f"(backlog {backlog:.0f}s of media)")
+        _current_profile = selected
+        return selected
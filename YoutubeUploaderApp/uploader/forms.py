@@ -3,6 +3,11 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from .models import User, Video, Short, Role
 
 
+# Limity pliku źródłowego (formularz i upload w kawałkach)
+MAX_VIDEO_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
+VIDEO_FILE_EXTENSIONS = ['.mp4', '.mov', '.avi', '.wmv', '.flv', '.mkv']
+
+
 class UserRegistrationForm(UserCreationForm):
     """Formularz rejestracji użytkownika"""
     email = forms.EmailField(
@@ -115,18 +120,65 @@ class VideoUploadForm(forms.ModelForm):
         video = self.cleaned_data.get('video_file')
         if video:
             # Sprawdź rozmiar (maksymalnie 2GB)
-            if video.size > 2 * 1024 * 1024 * 1024:  # 2 GB
+            if video.size > MAX_VIDEO_FILE_SIZE:
                 raise forms.ValidationError('Plik jest zbyt duży. Maksymalny rozmiar to 2GB.')
             
             # Sprawdź rozszerzenie
-            valid_extensions = ['.mp4', '.mov', '.avi', '.wmv', '.flv', '.mkv']
             ext = video.name.lower().split('.')[-1]
-            if f'.{ext}' not in valid_extensions:
-                raise forms.ValidationError(f'Nieprawidłowy format pliku. Dozwolone formaty: {", ".join(valid_extensions)}')
+            if f'.{ext}' not in VIDEO_FILE_EXTENSIONS:
+                raise forms.ValidationError(f'Nieprawidłowy format pliku. Dozwolone formaty: {", ".join(VIDEO_FILE_EXTENSIONS)}')
+            
+            # Nagłówek pliku rozpoznany podczas uploadu (DirectToStorageUploadHandler)
+            if hasattr(video, 'detected_format') and video.detected_format is None:
+                raise forms.ValidationError('Plik nie jest prawidłowym plikiem wideo.')
         
         return video
 
 
+class UploadSessionForm(forms.ModelForm):
+    """Formularz rozpoczęcia uploadu w kawałkach - dane wideo bez samego pliku"""
+    
+    filename = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1)
+    
+    class Meta:
+        model = Video
+        fields = ['title', 'description', 'target_duration', 'max_shorts_count']
+    
+    def clean_size(self):
+        size = self.cleaned_data['size']
+        if size > MAX_VIDEO_FILE_SIZE:
+            raise forms.ValidationError('Plik jest zbyt duży. Maksymalny rozmiar to 2GB.')
+        return size
+    
+    def clean_filename(self):
+        filename = self.cleaned_data['filename']
+        ext = filename.lower().split('.')[-1]
+        if f'.{ext}' not in VIDEO_FILE_EXTENSIONS:
+            raise forms.ValidationError(f'Nieprawidłowy format pliku. Dozwolone formaty: {", ".join(VIDEO_FILE_EXTENSIONS)}')
+        return filename
+
+
+class VideoRecutForm(forms.ModelForm):
+    """Formularz ponownego cięcia wideo z nowymi parametrami"""
+    
+    class Meta:
+        model = Video
+        fields = ['target_duration', 'max_shorts_count']
+        widgets = {
+            'target_duration': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 15,
+                'max': 180
+            }),
+            'max_shorts_count': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 1,
+                'max': 50
+            })
+        }
+
+
 class ShortEditForm(forms.ModelForm):
     """Formularz do edycji metadanych shorta"""
     
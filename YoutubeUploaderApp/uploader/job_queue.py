@@ -0,0 +1,293 @@
+"""
+Kolejka zadań przetwarzania wideo oparta na bazie danych
+
+Web tylko dodaje zadania (enqueue_video_processing), a przetwarzaniem
+zajmują się workery uruchamiane przez `python manage.py run_workers`,
+więc można je trzymać na osobnych maszynach i ograniczyć zużycie CPU.
+"""
+import os
+import socket
+import threading
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .models import ProcessingJob, Video
+from .encoder_profiles import select_profile
+from .probe_cache import check_ffmpeg_installed
+
+logger = logging.getLogger(__name__)
+
+# Opóźnienie kolejnej próby rośnie wykładniczo: 30s, 60s, 120s...
+RETRY_BASE_DELAY = 30
+
+# Co ile sekund worker potwierdza, że zadanie nadal jest przetwarzane
+HEARTBEAT_INTERVAL = 30
+
+# Liczba wątków workerów uruchomionych w tym procesie (start_workers)
+_pool_size = 0
+
+
+def get_worker_count():
+    """Zwraca liczbę workerów z ustawień (domyślnie 1)"""
+    return max(1, int(getattr(settings, 'VIDEO_WORKER_COUNT', 1) or 1))
+
+
+def make_worker_id(index=0):
+    """Tworzy identyfikator workera: host:pid:numer"""
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def live_worker_count():
+    """
+    Workery opróżniające kolejkę: pula tego procesu oraz workery innych
+    procesów i węzłów, które niedawno potwierdziły pracę nad zadaniem.
+    """
+    local_prefix = make_worker_id('')
+    alive_since = timezone.now() - timedelta(seconds=2 * HEARTBEAT_INTERVAL)
+    remote = ProcessingJob.objects.filter(
+        status='running',
+        heartbeat_at__gte=alive_since
+    ).exclude(worker_id__startswith=local_prefix).values('worker_id').distinct().count()
+    return (_pool_size or get_worker_count()) + remote
+
+
+def _is_dead_local_worker(worker_id):
+    """Worker z tego hosta, którego proces już nie istnieje"""
+    try:
+        host, pid, _ = worker_id.rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Proces istnieje, ale należy do innego użytkownika
+        return False
+    return False
+
+
+def enqueue_video_processing(video, crop_mode='center'):
+    """Dodaje wideo do kolejki przetwarzania"""
+    job = ProcessingJob.objects.create(
+        video=video,
+        crop_mode=crop_mode,
+        max_attempts=getattr(settings, 'VIDEO_JOB_MAX_ATTEMPTS', 3),
+    )
+    video.processing_message = 'W kolejce do przetwarzania...'
+    video.save(update_fields=['processing_message', 'updated_at'])
+    logger.info(f"Enqueued processing job {job.id} for video {video.id}")
+    return job
+
+
+def claim_next_job(worker_id):
+    """
+    Atomowo pobiera najstarsze oczekujące zadanie.
+    
+    Pobranie to warunkowy UPDATE (status='queued' -> 'running'), więc przy
+    wielu workerach tylko jeden z nich dostanie dane zadanie - działa także
+    na SQLite, które nie obsługuje SELECT ... FOR UPDATE.
+    """
+    now = timezone.now()
+    candidates = ProcessingJob.objects.filter(
+        status='queued',
+        run_after__lte=now
+    ).order_by('created_at').values_list('pk', flat=True)[:10]
+    
+    for job_id in candidates:
+        claimed = ProcessingJob.objects.filter(pk=job_id, status='queued').update(
+            status='running',
+            worker_id=worker_id,
+            claimed_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return ProcessingJob.objects.select_related('video').get(pk=job_id)
+    return None
+
+
+def _heartbeat(job_id, stop_event):
+    """Okresowo odświeża heartbeat_at zadania, dopóki trwa jego przetwarzanie"""
+    try:
+        while not stop_event.wait(HEARTBEAT_INTERVAL):
+            ProcessingJob.objects.filter(pk=job_id, status='running').update(heartbeat_at=timezone.now())
+    except Exception as e:
+        logger.error(f"Heartbeat for job {job_id} failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def _fail_or_requeue(job, error, retry=True):
+    """Ponawia zadanie (z opóźnieniem) albo oznacza je i wideo jako nieudane"""
+    job.last_error = error
+    
+    if retry and job.can_retry():
+        delay = RETRY_BASE_DELAY * 2 ** max(job.attempts - 1, 0)
+        job.status = 'queued'
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        Video.objects.filter(pk=job.video_id).update(
+            processing_message=f'Ponowienie za {delay} s po błędzie: {error}'[:255],
+        )
+    else:
+        job.status = 'failed'
+        job.finished_at = timezone.now()
+        Video.objects.filter(pk=job.video_id).update(
+            status='failed',
+            processing_message=f'Błąd: {error}'[:255],
+        )
+    job.save(update_fields=['status', 'last_error', 'run_after', 'finished_at', 'updated_at'])
+
+
+def run_job(job):
+    """Wykonuje zadanie i zapisuje jego stan (z ponowieniem przy błędzie)"""
+    from .video_processing import process_video
+    
+    # Web tylko kolejkuje - brak FFmpeg na tym workerze nie minie przy ponowieniu
+    if not check_ffmpeg_installed():
+        logger.error(f"Worker {job.worker_id} cannot run job {job.id}: FFmpeg is not installed")
+        _fail_or_requeue(
+            job,
+            'FFmpeg nie jest zainstalowany na workerze! Zobacz plik FFMPEG_INSTALL.md w głównym katalogu projektu.',
+            retry=False,
+        )
+        return False
+    
+    # Profil wybierany przy pierwszej próbie - ponowienia kodują tak samo
+    if not job.encode_profile:
+        job.encode_profile = select_profile(parallelism=live_worker_count())
+        job.save(update_fields=['encode_profile', 'updated_at'])
+    
+    logger.info(f"Worker {job.worker_id} running job {job.id} (video {job.video_id}, attempt {job.attempts}, "
+                f"profile {job.encode_profile})")
+    
+    heartbeat_stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job.id, heartbeat_stop), daemon=True)
+    heartbeat.start()
+    
+    try:
+        # Ponowienie wznawia pracę - gotowe segmenty i miniatury są pomijane
+        process_video(job.video_id, crop_mode=job.crop_mode, encode_profile=job.encode_profile, job=job)
+        
+        job.status = 'done'
+        job.last_error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'last_error', 'finished_at', 'updated_at'])
+        return True
+        
+    except Exception as e:
+        logger.error(f"Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}): {str(e)}")
+        _fail_or_requeue(job, str(e))
+        return False
+    
+    finally:
+        heartbeat_stop.set()
+        heartbeat.join()
+
+
+def recover_orphaned_jobs():
+    """
+    Odzyskuje zadania i wideo osierocone przez martwe workery.
+    
+    - zadania 'running' bez heartbeatu przez VIDEO_JOB_HEARTBEAT_TIMEOUT sekund
+      oraz zadania nieistniejących już procesów na tym samym hoście są
+      ponawiane (lub oznaczane jako nieudane po wyczerpaniu prób) - zadania
+      innych działających procesów run_workers nie są ruszane,
+    - wideo w stanie 'processing' bez aktywnego zadania trafia z powrotem
+      do kolejki (albo jest oznaczane jako nieudane, gdy brak pliku).
+    
+    Returns:
+        int: Liczba odzyskanych zadań/wideo
+    """
+    now = timezone.now()
+    timeout = getattr(settings, 'VIDEO_JOB_HEARTBEAT_TIMEOUT', 300)
+    recovered = 0
+    
+    running = ProcessingJob.objects.filter(status='running').select_related('video')
+    for job in running:
+        last_seen = job.heartbeat_at or job.claimed_at or job.updated_at
+        dead_local = _is_dead_local_worker(job.worker_id)
+        if not dead_local and last_seen and (now - last_seen).total_seconds() < timeout:
+            continue
+        
+        # Warunkowy UPDATE - inny worker mógł już odzyskać to zadanie
+        if not ProcessingJob.objects.filter(pk=job.pk, status='running', worker_id=job.worker_id).update(updated_at=now):
+            continue
+        logger.warning(f"Recovering orphaned job {job.id} from worker {job.worker_id}")
+        _fail_or_requeue(job, f'Worker {job.worker_id} przestał odpowiadać')
+        recovered += 1
+    
+    active_video_ids = ProcessingJob.objects.filter(
+        status__in=['queued', 'running']
+    ).values_list('video_id', flat=True)
+    orphaned_videos = Video.objects.filter(status='processing').exclude(id__in=active_video_ids)
+    for video in orphaned_videos:
+        if video.video_file and os.path.exists(video.video_file.path):
+            logger.warning(f"Requeueing orphaned video {video.id}")
+            # Tryb kadrowania i plan segmentów z ostatniego zadania wideo
+            crop_mode, segment_plan = ProcessingJob.objects.filter(video=video).order_by('-created_at').values_list(
+                'crop_mode', 'segment_plan'
+            ).first() or ('center', [])
+            ProcessingJob.objects.create(
+                video=video,
+                crop_mode=crop_mode,
+                segment_plan=segment_plan,
+                max_attempts=getattr(settings, 'VIDEO_JOB_MAX_ATTEMPTS', 3),
+            )
+            video.processing_message = 'Wznowiono po awarii - w kolejce...'
+            video.save(update_fields=['processing_message', 'updated_at'])
+        else:
+            logger.warning(f"Failing orphaned video {video.id} - source file is missing")
+            video.status = 'failed'
+            video.processing_message = 'Błąd: przetwarzanie przerwane, brak pliku źródłowego'
+            video.save(update_fields=['status', 'processing_message', 'updated_at'])
+        recovered += 1
+    
+    return recovered
+
+
+def run_worker(worker_id, stop_event, poll_interval=5):
+    """Pętla workera: pobiera i wykonuje zadania aż do ustawienia stop_event"""
+    logger.info(f"Worker {worker_id} started")
+    
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            job = claim_next_job(worker_id)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not claim a job: {str(e)}")
+            job = None
+        
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        
+        run_job(job)
+    
+    close_old_connections()
+    logger.info(f"Worker {worker_id} stopped")
+
+
+def start_workers(count, poll_interval=5):
+    """Uruchamia `count` wątków workerów; zwraca (wątki, stop_event)"""
+    global _pool_size
+    _pool_size = count
+    stop_event = threading.Event()
+    threads = []
+    for index in range(count):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(make_worker_id(index), stop_event, poll_interval),
+            name=f'video-worker-{index}',
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads, stop_event
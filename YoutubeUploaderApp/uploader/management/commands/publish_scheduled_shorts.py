@@ -7,6 +7,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from uploader.models import Short, YTAccount
 from uploader.youtube_service import upload_short_to_youtube
+from uploader import quota
 import logging
 
 logger = logging.getLogger(__name__)
@@ -42,6 +43,7 @@ class Command(BaseCommand):
         
         published_count = 0
         failed_count = 0
+        deferred_count = 0
         
         for short in scheduled_shorts:
             user = short.video.user
@@ -69,6 +71,18 @@ class Command(BaseCommand):
                 failed_count += 1
                 continue
             
+            # Brak dziennego limitu API - short czeka w kolejce do odnowienia
+            if not quota.can_afford(yt_account, 'videos.insert'):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'⏳ Limit YouTube API konta {yt_account.channel_name} wyczerpany. '
+                        f'Short "{short.title}" (ID: {short.id}) zostanie opublikowany po '
+                        f'{quota.next_reset():%d.%m.%Y %H:%M %Z}.'
+                    )
+                )
+                deferred_count += 1
+                continue
+            
             try:
                 # Ustaw status uploading
                 short.upload_status = 'uploading'
@@ -97,6 +111,17 @@ class Command(BaseCommand):
                         )
                     )
                     published_count += 1
+                elif result.get('deferred'):
+                    # Limit wyczerpany w trakcie - spróbuj ponownie po odnowieniu
+                    short.upload_status = 'scheduled'
+                    short.save()
+                    
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'⏳ Odłożono "{short.title}" (ID: {short.id}): {result["error"]}'
+                        )
+                    )
+                    deferred_count += 1
                 else:
                     # Błąd uploadu
                     short.upload_status = 'failed'
@@ -128,6 +153,8 @@ class Command(BaseCommand):
         self.stdout.write(f'Podsumowanie:')
         self.stdout.write(f'  • Znalezionych: {count}')
         self.stdout.write(self.style.SUCCESS(f'  • Opublikowanych: {published_count}'))
+        if deferred_count > 0:
+            self.stdout.write(self.style.WARNING(f'  • Odłożonych (limit quota): {deferred_count}'))
         if failed_count > 0:
             self.stdout.write(self.style.ERROR(f'  • Nieudanych: {failed_count}'))
         self.stdout.write(self.style.SUCCESS('=' * 60))
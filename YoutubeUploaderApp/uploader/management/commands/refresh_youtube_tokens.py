@@ -0,0 +1,35 @@
+"""
+Management command odświeżający z wyprzedzeniem tokeny YouTube
+Uruchom: python manage.py refresh_youtube_tokens
+Lub dodaj do crontab: */5 * * * * cd /path/to/project && python manage.py refresh_youtube_tokens
+(przy działającym run_workers nie jest potrzebny - workery robią to co minutę)
+"""
+from django.core.management.base import BaseCommand
+from uploader.youtube_service import refresh_expiring_tokens
+import time
+
+
+class Command(BaseCommand):
+    help = 'Odświeża tokeny YouTube, które wkrótce wygasną'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--margin',
+            type=int,
+            default=None,
+            help='Odśwież tokeny wygasające w ciągu tylu sekund (domyślnie YT_TOKEN_REFRESH_MARGIN)',
+        )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            default=None,
+            help='Działaj w pętli, sprawdzając co tyle sekund',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = refresh_expiring_tokens(margin=options['margin'])
+            self.stdout.write(self.style.SUCCESS(f'Konta z aktualnym tokenem: {refreshed}'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
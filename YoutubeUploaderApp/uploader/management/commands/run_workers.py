@@ -0,0 +1,86 @@
+"""
+Management command uruchamiający workery kolejki przetwarzania wideo
+Uruchom: python manage.py run_workers --workers 2
+"""
+from django.core.management.base import BaseCommand
+from uploader.job_queue import get_worker_count, start_workers, recover_orphaned_jobs
+from uploader.chunked_upload import purge_expired_sessions
+from uploader.encoder_profiles import calibrate
+from uploader.youtube_service import refresh_expiring_tokens
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Co ile sekund szukać zadań osieroconych przez workery na innych węzłach
+# (i odświeżać wygasające tokeny YouTube)
+RECOVERY_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Uruchamia workery przetwarzające wideo z kolejki zadań'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Liczba równoległych workerów (domyślnie VIDEO_WORKER_COUNT)',
+        )
+        parser.add_argument(
+            '--recalibrate',
+            action='store_true',
+            help='Zmierz szybkość profili kodowania nawet przy aktualnym pomiarze',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='Co ile sekund sprawdzać kolejkę, gdy jest pusta',
+        )
+
+    def handle(self, *args, **options):
+        count = options['workers'] or get_worker_count()
+        poll_interval = options['poll_interval']
+        
+        # Szybkość kodowania na tym węźle - podstawa doboru profilu do kolejki
+        self.stdout.write('Kalibracja profili kodowania...')
+        for profile, fps in calibrate(force=options['recalibrate']).items():
+            self.stdout.write(f'  {profile}: {fps:.1f} fps')
+        
+        # Zadania przerwane przez restart/awarię wracają do kolejki
+        recovered = recover_orphaned_jobs()
+        if recovered:
+            self.stdout.write(self.style.WARNING(f'Odzyskano {recovered} osieroconych zadań/wideo.'))
+        
+        self.stdout.write(self.style.SUCCESS(f'Uruchamianie {count} workerów (Ctrl+C aby zatrzymać)...'))
+        threads, stop_event = start_workers(count, poll_interval=poll_interval)
+        
+        try:
+            last_recovery = time.monotonic()
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+                
+                if time.monotonic() - last_recovery >= RECOVERY_INTERVAL:
+                    last_recovery = time.monotonic()
+                    try:
+                        recover_orphaned_jobs()
+                    except Exception as e:
+                        logger.error(f'Orphaned job recovery failed: {str(e)}')
+                    try:
+                        purge_expired_sessions()
+                    except Exception as e:
+                        logger.error(f'Upload session cleanup failed: {str(e)}')
+                    try:
+                        refresh_expiring_tokens()
+                    except Exception as e:
+                        logger.error(f'Proactive token refresh failed: {str(e)}')
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Zatrzymywanie workerów - kończenie bieżących zadań...'))
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        
+        self.stdout.write(self.style.SUCCESS('Workery zatrzymane.'))
@@ -0,0 +1,49 @@
+"""
+Management command synchronizujący statystyki opublikowanych shortów z YouTube
+Uruchom: python manage.py sync_short_stats
+Lub dodaj do crontab: */30 * * * * cd /path/to/project && python manage.py sync_short_stats
+"""
+from django.core.management.base import BaseCommand, CommandError
+from uploader.models import YTAccount
+from uploader.youtube_service import sync_short_stats
+
+
+class Command(BaseCommand):
+    help = 'Pobiera statystyki opublikowanych shortów (50 wideo na zapytanie do YouTube API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account',
+            type=int,
+            default=None,
+            help='ID konta YouTube (domyślnie wszystkie aktywne konta)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=None,
+            help='Tylko shorty aktualizowane dawniej niż tyle sekund temu',
+        )
+
+    def handle(self, *args, **options):
+        yt_account = None
+        if options['account'] is not None:
+            yt_account = YTAccount.objects.filter(pk=options['account']).first()
+            if not yt_account:
+                raise CommandError(f'Brak konta YouTube o ID {options["account"]}.')
+        
+        totals = sync_short_stats(yt_account=yt_account, stale_after=options['stale_after'])
+        
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write('Podsumowanie:')
+        self.stdout.write(f'  • Kont: {totals["accounts"]}')
+        self.stdout.write(f'  • Zapytań do API: {totals["calls"]}')
+        self.stdout.write(f'  • Pobranych statystyk: {totals["fetched"]}')
+        self.stdout.write(self.style.SUCCESS(f'  • Zaktualizowanych: {totals["updated"]}'))
+        if totals['deferred']:
+            self.stdout.write(self.style.WARNING(f'  • Odłożonych (limit quota): {totals["deferred"]}'))
+        if totals['missing']:
+            self.stdout.write(self.style.WARNING(f'  • Nie znalezionych na YouTube: {totals["missing"]}'))
+        if totals['errors']:
+            self.stdout.write(self.style.ERROR(f'  • Kont z błędem: {totals["errors"]}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
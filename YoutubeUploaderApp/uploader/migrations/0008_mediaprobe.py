@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0007_add_database_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaProbe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Ścieżka pliku')),
+                ('file_size', models.BigIntegerField(verbose_name='Rozmiar pliku (bajty)')),
+                ('mtime', models.FloatField(verbose_name='Czas modyfikacji pliku')),
+                ('metadata', models.JSONField(default=dict, verbose_name='Metadane')),
+                ('keyframes', models.JSONField(blank=True, null=True, verbose_name='Znaczniki czasu klatek kluczowych')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')),
+            ],
+            options={
+                'verbose_name': 'Analiza pliku',
+                'verbose_name_plural': 'Analizy plików',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0008_mediaprobe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crop_mode', models.CharField(default='center', max_length=20, verbose_name='Tryb kadrowania')),
+                ('status', models.CharField(choices=[('queued', 'W kolejce'), ('running', 'W trakcie'), ('done', 'Zakończone'), ('failed', 'Błąd')], db_index=True, default='queued', max_length=20, verbose_name='Status')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Liczba prób')),
+                ('max_attempts', models.IntegerField(default=3, verbose_name='Maksymalna liczba prób')),
+                ('last_error', models.TextField(blank=True, verbose_name='Ostatni błąd')),
+                ('worker_id', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Uruchom po')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Pobrane przez workera')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Zakończone')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processing_jobs', to='uploader.video', verbose_name='Wideo')),
+            ],
+            options={
+                'verbose_name': 'Zadanie przetwarzania',
+                'verbose_name_plural': 'Zadania przetwarzania',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0010_processingjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaprobe',
+            name='analysis',
+            field=models.JSONField(blank=True, null=True, verbose_name='Analiza treści (sceny, cisza)'),
+        ),
+    ]
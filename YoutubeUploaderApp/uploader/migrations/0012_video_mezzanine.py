@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+# Przebudowa tabeli uploader_video przez SQLite (AddField z wartością domyślną)
+# nie przechodzi, gdy istnieją triggery z 0007 odwołujące się do tej tabeli -
+# usuwamy je na czas zmiany i tworzymy ponownie.
+DROP_SHORTS_COUNT_TRIGGERS = """
+DROP TRIGGER IF EXISTS update_video_shorts_count_on_insert;
+DROP TRIGGER IF EXISTS update_video_shorts_count_on_delete;
+"""
+
+CREATE_SHORTS_COUNT_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS update_video_shorts_count_on_insert
+AFTER INSERT ON uploader_short
+FOR EACH ROW
+BEGIN
+    UPDATE uploader_video
+    SET shorts_created = (
+        SELECT COUNT(*) FROM uploader_short WHERE video_id = NEW.video_id
+    )
+    WHERE id = NEW.video_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_video_shorts_count_on_delete
+AFTER DELETE ON uploader_short
+FOR EACH ROW
+BEGIN
+    UPDATE uploader_video
+    SET shorts_created = (
+        SELECT COUNT(*) FROM uploader_short WHERE video_id = OLD.video_id
+    )
+    WHERE id = OLD.video_id;
+END;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0011_mediaprobe_analysis'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_SHORTS_COUNT_TRIGGERS, reverse_sql=CREATE_SHORTS_COUNT_TRIGGERS),
+        migrations.AddField(
+            model_name='video',
+            name='mezzanine_file',
+            field=models.FileField(blank=True, upload_to='mezzanine/', verbose_name='Plik pośredni'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='mezzanine_crop_mode',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Kadrowanie pliku pośredniego'),
+        ),
+        migrations.RunSQL(CREATE_SHORTS_COUNT_TRIGGERS, reverse_sql=DROP_SHORTS_COUNT_TRIGGERS),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0012_video_mezzanine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaprobe',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256 zawartości'),
+        ),
+    ]
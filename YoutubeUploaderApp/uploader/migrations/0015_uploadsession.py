@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:45
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0014_video_source_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Nazwa pliku')),
+                ('stored_name', models.CharField(max_length=500, verbose_name='Nazwa w storage')),
+                ('size', models.BigIntegerField(verbose_name='Rozmiar (bajty)')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Zapisane bajty')),
+                ('video_data', models.JSONField(default=dict, verbose_name='Dane wideo')),
+                ('status', models.CharField(choices=[('uploading', 'Wysyłanie'), ('committing', 'Zatwierdzanie'), ('completed', 'Zakończony'), ('aborted', 'Przerwany')], db_index=True, default='uploading', max_length=20, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Użytkownik')),
+                ('video', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='uploader.video', verbose_name='Wideo')),
+            ],
+            options={
+                'verbose_name': 'Sesja uploadu',
+                'verbose_name_plural': 'Sesje uploadu',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
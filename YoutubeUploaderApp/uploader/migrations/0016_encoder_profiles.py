@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 14:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='encode_profile',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Profil kodowania'),
+        ),
+        migrations.CreateModel(
+            name='EncoderCalibration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255, verbose_name='Węzeł')),
+                ('profile', models.CharField(max_length=20, verbose_name='Profil kodowania')),
+                ('fps', models.FloatField(verbose_name='Klatki na sekundę')),
+                ('measured_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Zmierzono')),
+            ],
+            options={
+                'verbose_name': 'Kalibracja kodera',
+                'verbose_name_plural': 'Kalibracje kodera',
+                'ordering': ['host', 'profile'],
+                'unique_together': {('host', 'profile')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0016_encoder_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytaccount',
+            name='token_refresh_lease',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Odświeżanie tokena do'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0017_ytaccount_token_refresh_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YTQuotaUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dzień (czas pacyficzny)')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Zużyte jednostki')),
+                ('exhausted', models.BooleanField(default=False, verbose_name='Limit wyczerpany')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')),
+                ('yt_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_usage', to='uploader.ytaccount', verbose_name='Konto YouTube')),
+            ],
+            options={
+                'verbose_name': 'Zużycie quota YouTube',
+                'verbose_name_plural': 'Zużycie quota YouTube',
+                'ordering': ['-day'],
+                'unique_together': {('yt_account', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0018_ytquotausage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='segment_plan',
+            field=models.JSONField(blank=True, default=list, verbose_name='Plan segmentów'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -85,6 +86,8 @@ class YTAccount(models.Model):
     access_token = models.TextField(verbose_name='Access Token')
     refresh_token = models.TextField(blank=True, null=True, verbose_name='Refresh Token')
     token_expiry = models.DateTimeField(null=True, blank=True, verbose_name='Wygaśnięcie tokena')
+    # Dzierżawa odświeżania tokena - tylko jeden proces odświeża naraz
+    token_refresh_lease = models.DateTimeField(null=True, blank=True, verbose_name='Odświeżanie tokena do')
     
     # Status połączenia
     is_active = models.BooleanField(default=True, verbose_name='Aktywne połączenie')
@@ -109,6 +112,26 @@ class YTAccount(models.Model):
         return timezone.now() < self.token_expiry
 
 
+class YTQuotaUsage(models.Model):
+    """Zużycie dziennego limitu YouTube Data API przez konto (doba czasu pacyficznego, jak w Google)"""
+    
+    yt_account = models.ForeignKey(YTAccount, on_delete=models.CASCADE, related_name='quota_usage', verbose_name='Konto YouTube')
+    day = models.DateField(verbose_name='Dzień (czas pacyficzny)')
+    units = models.PositiveIntegerField(default=0, verbose_name='Zużyte jednostki')
+    # Google odpowiedział quotaExceeded - limit wyczerpany niezależnie od licznika
+    exhausted = models.BooleanField(default=False, verbose_name='Limit wyczerpany')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')
+    
+    class Meta:
+        verbose_name = 'Zużycie quota YouTube'
+        verbose_name_plural = 'Zużycie quota YouTube'
+        unique_together = [('yt_account', 'day')]
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.yt_account.channel_name} {self.day}: {self.units}"
+
+
 # ============================================================================
 # VIDEO MODEL (źródłowe długie wideo)
 # ============================================================================
@@ -128,6 +151,7 @@ class Video(models.Model):
     title = models.CharField(max_length=150, verbose_name='Tytuł')
     description = models.TextField(blank=True, verbose_name='Opis')
     video_file = models.FileField(upload_to='videos/%Y/%m/%d/', verbose_name='Plik wideo')
+    source_sha256 = models.CharField(max_length=64, blank=True, db_index=True, verbose_name='SHA-256 pliku źródłowego')
     
     # Metadane wideo
     duration = models.IntegerField(null=True, blank=True, verbose_name='Czas trwania (sekundy)')
@@ -147,6 +171,10 @@ class Video(models.Model):
     max_shorts_count = models.IntegerField(default=10, verbose_name='Maksymalna liczba shortów',
                                            validators=[MinValueValidator(1), MaxValueValidator(50)])
     
+    # Plik pośredni (przycięty do 9:16, krótki GOP) do szybkiego ponownego cięcia
+    mezzanine_file = models.FileField(upload_to='mezzanine/', blank=True, verbose_name='Plik pośredni')
+    mezzanine_crop_mode = models.CharField(max_length=20, blank=True, verbose_name='Kadrowanie pliku pośredniego')
+    
     # Timestampy
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')
@@ -164,6 +192,124 @@ class Video(models.Model):
         return self.shorts.count()
 
 
+# ============================================================================
+# PROCESSING JOB MODEL (kolejka przetwarzania wideo)
+# ============================================================================
+class ProcessingJob(models.Model):
+    """Zadanie przetwarzania wideo w kolejce obsługiwanej przez `manage.py run_workers`"""
+    
+    STATUS_CHOICES = [
+        ('queued', 'W kolejce'),
+        ('running', 'W trakcie'),
+        ('done', 'Zakończone'),
+        ('failed', 'Błąd'),
+    ]
+    
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='processing_jobs', verbose_name='Wideo')
+    crop_mode = models.CharField(max_length=20, default='center', verbose_name='Tryb kadrowania')
+    encode_profile = models.CharField(max_length=20, blank=True, verbose_name='Profil kodowania')
+    # Granice shortów [[start, długość], ...] z pierwszej próby - ponowienia tną tak samo
+    segment_plan = models.JSONField(default=list, blank=True, verbose_name='Plan segmentów')
+    
+    # Stan zadania
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', db_index=True, verbose_name='Status')
+    attempts = models.IntegerField(default=0, verbose_name='Liczba prób')
+    max_attempts = models.IntegerField(default=3, verbose_name='Maksymalna liczba prób')
+    last_error = models.TextField(blank=True, verbose_name='Ostatni błąd')
+    
+    # Przydział do workera
+    worker_id = models.CharField(max_length=100, blank=True, verbose_name='Worker')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Uruchom po')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Pobrane przez workera')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='Ostatni sygnał życia workera')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Zakończone')
+    
+    # Timestampy
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')
+    
+    class Meta:
+        verbose_name = 'Zadanie przetwarzania'
+        verbose_name_plural = 'Zadania przetwarzania'
+        ordering = ['created_at']
+    
+    def __str__(self):
+        return f"{self.video} [{self.status}]"
+    
+    def can_retry(self):
+        return self.attempts < self.max_attempts
+
+
+# ============================================================================
+# ENCODER CALIBRATION MODEL (zmierzona szybkość kodowania na węźle)
+# ============================================================================
+class EncoderCalibration(models.Model):
+    """Szybkość kodowania (klatki/s) profilu na danym węźle - wynik `run_workers` przy starcie"""
+    
+    host = models.CharField(max_length=255, verbose_name='Węzeł')
+    profile = models.CharField(max_length=20, verbose_name='Profil kodowania')
+    fps = models.FloatField(verbose_name='Klatki na sekundę')
+    measured_at = models.DateTimeField(default=timezone.now, verbose_name='Zmierzono')
+    
+    class Meta:
+        verbose_name = 'Kalibracja kodera'
+        verbose_name_plural = 'Kalibracje kodera'
+        unique_together = [('host', 'profile')]
+        ordering = ['host', 'profile']
+    
+    def __str__(self):
+        return f"{self.host} {self.profile}: {self.fps:.1f} fps"
+
+
+# ============================================================================
+# UPLOAD SESSION MODEL (wznawialny upload w kawałkach)
+# ============================================================================
+class UploadSession(models.Model):
+    """
+    Sesja wznawialnego uploadu pliku wideo (protokół w stylu tus).
+    Plik jest składany w docelowym miejscu storage, a `offset` to liczba
+    bajtów trwale zapisanych na dysku.
+    """
+    
+    STATUS_CHOICES = [
+        ('uploading', 'Wysyłanie'),
+        ('committing', 'Zatwierdzanie'),
+        ('completed', 'Zakończony'),
+        ('aborted', 'Przerwany'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name='Użytkownik')
+    
+    # Plik
+    filename = models.CharField(max_length=255, verbose_name='Nazwa pliku')
+    stored_name = models.CharField(max_length=500, verbose_name='Nazwa w storage')
+    size = models.BigIntegerField(verbose_name='Rozmiar (bajty)')
+    offset = models.BigIntegerField(default=0, verbose_name='Zapisane bajty')
+    
+    # Parametry wideo tworzonego po zatwierdzeniu
+    video_data = models.JSONField(default=dict, verbose_name='Dane wideo')
+    video = models.ForeignKey(Video, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='upload_sessions', verbose_name='Wideo')
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading', db_index=True, verbose_name='Status')
+    
+    # Timestampy
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')
+    
+    class Meta:
+        verbose_name = 'Sesja uploadu'
+        verbose_name_plural = 'Sesje uploadu'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+    
+    def is_complete(self):
+        return self.offset >= self.size
+
+
 # ============================================================================
 # SHORT MODEL (krótkie wideo - YouTube Short)
 # ============================================================================
@@ -353,3 +499,34 @@ class ShortSuggestion(models.Model):
             'critical': 'fire',
         }
         return icons.get(self.priority, 'info')
+
+
+# ============================================================================
+# MEDIA PROBE MODEL (cache wyników ffprobe)
+# ============================================================================
+class MediaProbe(models.Model):
+    """Cache metadanych ffprobe i indeksu klatek kluczowych dla pliku wideo"""
+    
+    path = models.CharField(max_length=500, unique=True, verbose_name='Ścieżka pliku')
+    file_size = models.BigIntegerField(verbose_name='Rozmiar pliku (bajty)')
+    mtime = models.FloatField(verbose_name='Czas modyfikacji pliku')
+    
+    metadata = models.JSONField(default=dict, verbose_name='Metadane')
+    keyframes = models.JSONField(null=True, blank=True, verbose_name='Znaczniki czasu klatek kluczowych')
+    analysis = models.JSONField(null=True, blank=True, verbose_name='Analiza treści (sceny, cisza)')
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name='SHA-256 zawartości')
+    
+    # Timestampy
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Data aktualizacji')
+    
+    class Meta:
+        verbose_name = 'Analiza pliku'
+        verbose_name_plural = 'Analizy plików'
+    
+    def __str__(self):
+        return self.path
+    
+    def matches(self, file_size, mtime):
+        """Sprawdza czy wpis dotyczy aktualnej wersji pliku"""
+        return self.file_size == file_size and abs(self.mtime - mtime) < 0.001
@@ -0,0 +1,222 @@
+"""
+Cache wyników ffprobe - metadane i indeks klatek kluczowych plików wideo
+
+Wpisy są kluczowane ścieżką pliku i unieważniane, gdy zmieni się jego
+rozmiar lub czas modyfikacji.
+"""
+import bisect
+import hashlib
+import subprocess
+import os
+import json
+import shutil
+import logging
+from .models import MediaProbe
+
+logger = logging.getLogger(__name__)
+
+# FFmpeg nie znika w trakcie działania procesu - wystarczy znaleźć go raz
+_ffmpeg_found = False
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def check_ffmpeg_installed():
+    """Sprawdza czy FFmpeg jest zainstalowany"""
+    global _ffmpeg_found
+    if _ffmpeg_found:
+        return True
+    
+    ffmpeg_path = shutil.which('ffmpeg')
+    ffprobe_path = shutil.which('ffprobe')
+    
+    if not ffmpeg_path or not ffprobe_path:
+        logger.error("FFmpeg or FFprobe not found in PATH")
+        return False
+    
+    logger.info(f"FFmpeg found at: {ffmpeg_path}")
+    logger.info(f"FFprobe found at: {ffprobe_path}")
+    _ffmpeg_found = True
+    return True
+
+
+def _file_signature(path):
+    """Zwraca (rozmiar, mtime) pliku"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def _stream_rotation(stream):
+    """Zwraca obrót strumienia wideo w stopniach (0, 90, 180, 270)"""
+    rotation = stream.get('tags', {}).get('rotate')
+    if rotation is None:
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+                break
+    try:
+        return int(float(rotation or 0)) % 360
+    except (TypeError, ValueError):
+        return 0
+
+
+def _probe_metadata(path):
+    """Uruchamia ffprobe i zwraca słownik metadanych"""
+    if not check_ffmpeg_installed():
+        raise Exception("FFmpeg nie jest zainstalowany! Zobacz FFMPEG_INSTALL.md")
+    
+    try:
+        cmd = [
+            'ffprobe',
+            '-v', 'quiet',
+            '-print_format', 'json',
+            '-show_format',
+            '-show_streams',
+            path
+        ]
+        
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        metadata = json.loads(result.stdout)
+        
+        # Znajdź stream wideo
+        video_stream = next(
+            (s for s in metadata['streams'] if s['codec_type'] == 'video'),
+            None
+        )
+        
+        if not video_stream:
+            raise Exception("Nie znaleziono streamu wideo")
+        
+        audio_stream = next(
+            (s for s in metadata['streams'] if s['codec_type'] == 'audio'),
+            None
+        )
+        
+        duration = float(metadata['format']['duration'])
+        width = video_stream['width']
+        height = video_stream['height']
+        
+        # Telefony zapisują pion jako poziom + metadane obrotu
+        if _stream_rotation(video_stream) in (90, 270):
+            width, height = height, width
+        
+        return {
+            'duration': duration,
+            'width': width,
+            'height': height,
+            'resolution': f"{width}x{height}",
+            'file_size': int(metadata['format']['size']),
+            'video_codec': video_stream.get('codec_name'),
+            'pix_fmt': video_stream.get('pix_fmt'),
+            'audio_codec': audio_stream.get('codec_name') if audio_stream else None,
+        }
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFprobe error: {e.stderr}")
+        raise Exception(f"Błąd analizy wideo: {e.stderr}")
+    except Exception as e:
+        logger.error(f"Metadata extraction error: {str(e)}")
+        raise
+
+
+def _probe_keyframes(path):
+    """Zwraca posortowane znaczniki czasu klatek kluczowych (bez dekodowania)"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        path
+    ]
+    
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFprobe keyframe index error: {e.stderr}")
+        raise Exception(f"Błąd analizy wideo: {e.stderr}")
+    
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(round(float(pts_time), 3))
+    return sorted(keyframes)
+
+
+def get_probe(path):
+    """
+    Zwraca aktualny wpis MediaProbe dla pliku, uruchamiając ffprobe
+    tylko przy braku wpisu lub zmianie pliku.
+    """
+    file_size, mtime = _file_signature(path)
+    
+    probe = MediaProbe.objects.filter(path=path).first()
+    if probe and probe.matches(file_size, mtime) and probe.metadata:
+        return probe
+    
+    metadata = _probe_metadata(path)
+    probe, _ = MediaProbe.objects.update_or_create(
+        path=path,
+        defaults={
+            'file_size': file_size,
+            'mtime': mtime,
+            'metadata': metadata,
+            'keyframes': None,
+            'analysis': None,
+            'content_hash': '',
+        }
+    )
+    logger.debug(f"Probe cache miss for {path}")
+    return probe
+
+
+def get_metadata(path):
+    """Zwraca metadane pliku wideo (z cache)"""
+    return get_probe(path).metadata
+
+
+def get_keyframes(path):
+    """Zwraca indeks klatek kluczowych pliku wideo (z cache)"""
+    probe = get_probe(path)
+    if probe.keyframes is None:
+        probe.keyframes = _probe_keyframes(path)
+        probe.save(update_fields=['keyframes', 'updated_at'])
+    return probe.keyframes
+
+
+def get_analysis(path):
+    """Zwraca zapisaną analizę treści pliku (lub None, jeśli jej nie ma)"""
+    return get_probe(path).analysis
+
+
+def save_analysis(path, analysis):
+    """Zapisuje analizę treści pliku (scalając z już zapisanymi kluczami)"""
+    probe = get_probe(path)
+    probe.analysis = {**(probe.analysis or {}), **analysis}
+    probe.save(update_fields=['analysis', 'updated_at'])
+    return probe.analysis
+
+
+def file_sha256(path):
+    """Liczy SHA-256 zawartości pliku (czytanego kawałkami)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_content_hash(path):
+    """Zwraca SHA-256 zawartości pliku (liczony raz na wersję pliku)"""
+    probe = get_probe(path)
+    if not probe.content_hash:
+        probe.content_hash = file_sha256(path)
+        probe.save(update_fields=['content_hash', 'updated_at'])
+    return probe.content_hash
+
+
+def keyframe_at_or_before(keyframes, timestamp):
+    """Zwraca ostatnią klatkę kluczową nie późniejszą niż timestamp"""
+    index = bisect.bisect_right(keyframes, timestamp + 0.001)
+    return keyframes[index - 1] if index else 0.0
@@ -0,0 +1,154 @@
+"""
+Przetwarzanie progresywne - cięcie shortów w trakcie uploadu w kawałkach
+
+Plik sesji uploadu ma od początku docelowy rozmiar (rzadki plik), więc dla
+MP4 z atomem moov na początku (faststart) ffprobe zwraca pełną mapę pakietów
+z pozycjami bajtów, zanim przyjdą dane. Segment jest kodowany dopiero, gdy
+offset sesji (bajty trwale zapisane na dysku) obejmuje wszystkie jego pakiety.
+"""
+import os
+import struct
+import subprocess
+import time
+import logging
+from django.conf import settings
+from django.core.files.storage import default_storage
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+# Zapas czasu za końcem segmentu - demuxer czyta pakiety z wyprzedzeniem
+LOOKAHEAD_SECONDS = 1.0
+
+# Co ile sekund sprawdzać offset sesji podczas czekania na dane
+POLL_INTERVAL = 1.0
+
+
+class UploadAborted(Exception):
+    """Upload, na który czeka przetwarzanie, został przerwany"""
+
+
+def is_enabled():
+    return getattr(settings, 'VIDEO_PROGRESSIVE_PROCESSING', False)
+
+
+def partial_path(session):
+    return f'{default_storage.path(session.stored_name)}.part'
+
+
+def readable_path(session):
+    """Ścieżka danych sesji: plik `.part` w trakcie uploadu, docelowy po zatwierdzeniu"""
+    path = partial_path(session)
+    if session.status != 'completed' and os.path.exists(path):
+        return path
+    return default_storage.path(session.stored_name)
+
+
+def active_upload_session(video):
+    """Zwraca niezakończoną sesję uploadu wideo (None gdy plik jest kompletny)"""
+    return UploadSession.objects.filter(video=video, status__in=('uploading', 'committing')).first()
+
+
+def moov_available(path, available):
+    """
+    Sprawdza atomy najwyższego poziomu MP4 w pierwszych `available` bajtach.
+
+    Returns:
+        True - moov jest w całości przed mdat (faststart)
+        False - mdat przed moov, przetwarzanie progresywne niemożliwe
+        None - za mało danych, żeby rozstrzygnąć
+    """
+    position = 0
+    with open(path, 'rb') as f:
+        while position + 8 <= available:
+            f.seek(position)
+            header = f.read(16)
+            size, atom = struct.unpack('>I4s', header[:8])
+            if size == 1:
+                if position + 16 > available:
+                    return None
+                size = struct.unpack('>Q', header[8:16])[0]
+            elif size == 0:
+                # Atom do końca pliku
+                size = None
+
+            if atom == b'moov':
+                # Moov jeszcze niekompletny - rozstrzygną kolejne kawałki
+                if size is None or position + size > available:
+                    return None
+                return True
+            if atom == b'mdat' or size is None or size < 8:
+                return False
+            position += size
+    return None
+
+
+def packet_byte_map(path):
+    """
+    Mapa pakietów pliku: posortowane (czas końca pakietu, bajt końca pakietu)
+    dla wszystkich strumieni. Czyta tylko indeks z moov i pozycje pakietów.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'packet=pts_time,duration_time,pos,size',
+        '-of', 'csv=p=0',
+        path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+    packets = []
+    for line in result.stdout.splitlines():
+        fields = line.split(',')
+        if len(fields) < 4 or 'N/A' in (fields[0], fields[2], fields[3]):
+            continue
+        pts_time, duration_time, size, pos = fields[:4]
+        try:
+            end_time = float(pts_time) + (float(duration_time) if duration_time not in ('', 'N/A') else 0)
+            packets.append((end_time, int(pos) + int(size)))
+        except ValueError:
+            continue
+    packets.sort()
+    return packets
+
+
+def bytes_needed(packets, end_time):
+    """Liczba bajtów od początku pliku potrzebna do zakodowania materiału do `end_time`"""
+    limit = end_time + LOOKAHEAD_SECONDS
+    needed = 0
+    for packet_end_time, packet_end_byte in packets:
+        if packet_end_time > limit:
+            break
+        needed = max(needed, packet_end_byte)
+    return needed
+
+
+def wait_for_bytes(session, needed, timeout=None, on_wait=None):
+    """
+    Czeka, aż offset sesji obejmie `needed` bajtów.
+
+    Args:
+        timeout: Maksymalny czas bez przyrostu offsetu (sekundy)
+        on_wait: Opcjonalny callback(offset) wywoływany przy każdym sprawdzeniu
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'VIDEO_PROGRESSIVE_WAIT_TIMEOUT', 600)
+
+    last_offset = None
+    last_progress = time.monotonic()
+    while True:
+        session.refresh_from_db(fields=['offset', 'status'])
+        if session.status == 'aborted':
+            raise UploadAborted(f"Upload session {session.id} was aborted")
+        if session.offset >= needed or session.status == 'completed':
+            return session.offset
+
+        if session.offset != last_offset:
+            last_offset = session.offset
+            last_progress = time.monotonic()
+        elif time.monotonic() - last_progress > timeout:
+            raise TimeoutError(f"Upload session {session.id} stalled at {session.offset}/{session.size} bytes")
+
+        if on_wait:
+            on_wait(session.offset)
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,114 @@
+"""
+Dzienny limit (quota) YouTube Data API per konto
+
+Google rozlicza quota w dobach czasu pacyficznego, koszt zależy od metody
+(videos.insert = 1600 jednostek, przy domyślnym limicie 10 000 to 6 uploadów).
+Każde wywołanie API jest zapisywane w YTQuotaUsage, a schedulery sprawdzają
+pozostały budżet przed pracą - gdy go brakuje, odkładają ją do odnowienia
+limitu zamiast oznaczać shorty jako nieudane.
+"""
+import json
+import logging
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import YTQuotaUsage
+
+logger = logging.getLogger(__name__)
+
+# Koszt metod w jednostkach quota (dokumentacja YouTube Data API v3)
+QUOTA_COSTS = {
+    'videos.insert': 1600,
+    'videos.update': 50,
+    'videos.delete': 50,
+    'videos.list': 1,
+    'channels.list': 1,
+}
+
+# Doba quota kończy się o północy czasu pacyficznego
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+
+def get_daily_limit():
+    return getattr(settings, 'YT_DAILY_QUOTA', 10000)
+
+
+def quota_day(now=None):
+    """Bieżąca doba quota (data w czasie pacyficznym)"""
+    return (now or timezone.now()).astimezone(QUOTA_TIMEZONE).date()
+
+
+def next_reset(now=None):
+    """Moment odnowienia limitu - najbliższa północ czasu pacyficznego"""
+    day = quota_day(now) + timedelta(days=1)
+    return datetime.combine(day, time.min, tzinfo=QUOTA_TIMEZONE)
+
+
+def _update_today(yt_account, **changes):
+    """
+    Upsert dzisiejszego wiersza konta: UPDATE, a gdy wiersza jeszcze nie ma,
+    INSERT ignorujący konflikt (yt_account, day) i ponowny UPDATE - pierwszy
+    zapis doby z kilku procesów naraz nie kończy się IntegrityError.
+    """
+    changes['updated_at'] = timezone.now()
+    usage = YTQuotaUsage.objects.filter(yt_account=yt_account, day=quota_day())
+    if not usage.update(**changes):
+        YTQuotaUsage.objects.bulk_create(
+            [YTQuotaUsage(yt_account=yt_account, day=quota_day())],
+            ignore_conflicts=True
+        )
+        usage.update(**changes)
+
+
+def record(yt_account, method, calls=1):
+    """Dolicza koszt `calls` wywołań metody do dzisiejszego zużycia konta"""
+    # Atomowo - równoległe wywołania nie gubią jednostek
+    _update_today(yt_account, units=F('units') + QUOTA_COSTS.get(method, 1) * calls)
+
+
+def mark_exhausted(yt_account):
+    """Google odrzucił wywołanie z quotaExceeded - do końca doby nic więcej nie wysyłamy"""
+    _update_today(yt_account, exhausted=True)
+    logger.warning(f"YouTube quota exhausted for {yt_account.channel_name} until {next_reset().isoformat()}")
+
+
+def remaining(yt_account):
+    """Pozostałe dziś jednostki konta"""
+    usage = YTQuotaUsage.objects.filter(yt_account=yt_account, day=quota_day()).first()
+    if usage is None:
+        return get_daily_limit()
+    if usage.exhausted:
+        return 0
+    return max(0, get_daily_limit() - usage.units)
+
+
+def can_afford(yt_account, method, calls=1):
+    """Czy dzisiejszy budżet konta wystarczy na `calls` wywołań metody"""
+    return remaining(yt_account) >= QUOTA_COSTS.get(method, 1) * calls
+
+
+def is_quota_error(error):
+    """Czy HttpError to przekroczenie limitu (403 quotaExceeded / dailyLimitExceeded)"""
+    if getattr(error.resp, 'status', None) != 403:
+        return False
+    try:
+        reasons = [e.get('reason') for e in json.loads(error.content).get('error', {}).get('errors', [])]
+    except (ValueError, AttributeError, TypeError):
+        return b'quotaExceeded' in (error.content or b'')
+    return any(reason in ('quotaExceeded', 'dailyLimitExceeded') for reason in reasons)
+
+
+def summary(yt_account):
+    """Stan dzisiejszego limitu konta dla dashboardów"""
+    limit = get_daily_limit()
+    left = remaining(yt_account)
+    return {
+        'limit': limit,
+        'used': limit - left,
+        'remaining': left,
+        'uploads_left': left // QUOTA_COSTS['videos.insert'],
+        'percent_used': round((limit - left) * 100 / limit) if limit else 100,
+        'resets_at': next_reset(),
+    }
@@ -0,0 +1,87 @@
+"""
+Odświeżanie statystyk shortów w tle (stale-while-revalidate)
+
+Statystyki w bazie traktowane są jak cache ważny SHORT_STATS_TTL sekund od
+last_analytics_update. Strona shorta renderuje się od razu z bazy, a gdy dane
+są nieaktualne, odświeżenie trafia do puli wątków w tle; strona odpytuje
+api_short_stats, aż się zakończy.
+"""
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import Short, YTAccount
+
+logger = logging.getLogger(__name__)
+
+# Wątki odświeżające na proces WWW - wywołania API, nie obliczenia
+REFRESH_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='stats-refresh')
+
+# Shorty z odświeżeniem w toku (bez duplikatów przy przeładowaniach strony)
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def get_ttl():
+    return getattr(settings, 'SHORT_STATS_TTL', 900)
+
+
+def is_stale(short, ttl=None):
+    """Statystyki opublikowanego shorta starsze niż TTL (lub nigdy nie pobrane)"""
+    if not short.is_published() or not short.yt_video_id:
+        return False
+    if short.last_analytics_update is None:
+        return True
+    if ttl is None:
+        ttl = get_ttl()
+    return timezone.now() - short.last_analytics_update >= timedelta(seconds=ttl)
+
+
+def is_refreshing(short):
+    with _in_flight_lock:
+        return short.pk in _in_flight
+
+
+def schedule_refresh(short):
+    """
+    Zleca odświeżenie statystyk shorta w tle, jeśli są nieaktualne.
+
+    Returns:
+        bool: True, jeśli odświeżenie jest w toku (nowe lub wcześniejsze)
+    """
+    if not is_stale(short):
+        return False
+
+    with _in_flight_lock:
+        if short.pk in _in_flight:
+            return True
+        _in_flight.add(short.pk)
+
+    _executor.submit(_refresh, short.pk)
+    return True
+
+
+def _refresh(short_id):
+    from .youtube_service import sync_account_stats
+
+    close_old_connections()
+    try:
+        short = Short.objects.select_related('video').get(pk=short_id)
+        # Inne żądanie lub sync_short_stats mogły już odświeżyć dane
+        if not is_stale(short):
+            return
+        yt_account = YTAccount.objects.filter(user_id=short.video.user_id).first()
+        if not yt_account:
+            return
+        sync_account_stats(yt_account, [short])
+    except Exception as e:
+        logger.error(f"Background stats refresh of short {short_id} failed: {str(e)}")
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(short_id)
+        close_old_connections()
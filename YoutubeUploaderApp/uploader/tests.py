@@ -0,0 +1,845 @@
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import UnreadablePostError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import EncoderCalibration, ProcessingJob, Short, UploadSession, User, Video, YTAccount, YTQuotaUsage
+from . import encode_cache, encoder_profiles, job_queue, progressive, quota, stats_refresh, video_analysis, youtube_service
+from .video_processing import VideoProcessingService, plan_encode
+from .upload_handlers import DirectToStorageUploadHandler
+
+
+class TokenRefreshTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokens', email='tokens@example.com', password='pass12345')
+        self.yt_account = YTAccount.objects.create(
+            user=self.user,
+            channel_name='Kanał',
+            channel_id='UC123',
+            client_id='client',
+            client_secret='secret',
+            access_token='old-token',
+            refresh_token='refresh-token',
+            token_expiry=timezone.now() - timedelta(minutes=5),
+        )
+
+    def _fake_refresh(self, credentials, request):
+        # google-auth zwraca naiwną datę wygaśnięcia w UTC
+        credentials.token = 'new-token'
+        credentials.expiry = datetime.now(dt_timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+
+    def test_refreshed_expiry_is_stored_as_utc(self):
+        with mock.patch.object(youtube_service.Credentials, 'refresh', autospec=True,
+                               side_effect=self._fake_refresh) as refresh:
+            self.assertTrue(youtube_service.refresh_credentials_if_needed(self.yt_account))
+            # Kolejne wywołania (ten sam obiekt i świeży z bazy) nie odświeżają ponownie
+            self.assertTrue(youtube_service.refresh_credentials_if_needed(self.yt_account))
+            self.assertTrue(youtube_service.refresh_credentials_if_needed(
+                YTAccount.objects.get(pk=self.yt_account.pk)
+            ))
+            self.assertEqual(youtube_service.refresh_expiring_tokens(margin=600), 0)
+
+        self.assertEqual(refresh.call_count, 1)
+        self.yt_account.refresh_from_db()
+        self.assertEqual(self.yt_account.access_token, 'new-token')
+        self.assertIsNone(self.yt_account.token_refresh_lease)
+        remaining = self.yt_account.token_expiry - timezone.now()
+        self.assertGreater(remaining, timedelta(minutes=55))
+        self.assertLessEqual(remaining, timedelta(hours=1))
+
+    def test_refresh_expiring_tokens_refreshes_ahead_of_expiry(self):
+        self.yt_account.token_expiry = timezone.now() + timedelta(minutes=5)
+        self.yt_account.save()
+
+        with mock.patch.object(youtube_service.Credentials, 'refresh', autospec=True,
+                               side_effect=self._fake_refresh) as refresh:
+            self.assertEqual(youtube_service.refresh_expiring_tokens(margin=600), 1)
+
+        self.assertEqual(refresh.call_count, 1)
+        self.yt_account.refresh_from_db()
+        self.assertEqual(self.yt_account.access_token, 'new-token')
+
+
+class OrphanedJobRecoveryTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'videos'))
+        with open(os.path.join(self.media_root, 'videos', 'source.mp4'), 'wb') as f:
+            f.write(b'data')
+
+        self.user = User.objects.create_user(username='worker', email='worker@example.com', password='pass12345')
+        self.video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4',
+                                          status='processing')
+
+    def _running_job(self, pid):
+        now = timezone.now()
+        return ProcessingJob.objects.create(
+            video=self.video, crop_mode='smart', status='running', attempts=1,
+            worker_id=f'{socket.gethostname()}:{pid}:0', claimed_at=now, heartbeat_at=now,
+        )
+
+    def test_job_of_other_live_process_is_kept(self):
+        job = self._running_job(os.getppid())
+
+        job_queue.recover_orphaned_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(ProcessingJob.objects.count(), 1)
+
+    def test_job_of_dead_local_process_is_requeued(self):
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        job = self._running_job(finished.pid)
+
+        self.assertEqual(job_queue.recover_orphaned_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+
+    def test_orphaned_video_keeps_crop_mode_and_segment_plan(self):
+        ProcessingJob.objects.create(video=self.video, crop_mode='smart', status='failed',
+                                     segment_plan=[[0, 58.5], [58.5, 61]])
+
+        job_queue.recover_orphaned_jobs()
+
+        job = ProcessingJob.objects.get(video=self.video, status='queued')
+        self.assertEqual(job.crop_mode, 'smart')
+        self.assertEqual(job.segment_plan, [[0, 58.5], [58.5, 61]])
+
+
+class LiveWorkerCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pool', email='pool@example.com', password='pass12345')
+        self.video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4')
+
+    def _running_job(self, worker_id, heartbeat_age):
+        ProcessingJob.objects.create(video=self.video, status='running', worker_id=worker_id,
+                                     heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age))
+
+    def test_counts_local_pool_and_remote_workers_with_recent_heartbeat(self):
+        self._running_job(job_queue.make_worker_id(0), 0)
+        self._running_job('encoder-1:100:0', 5)
+        self._running_job('encoder-1:100:1', 10)
+        self._running_job('encoder-2:200:0', 3600)
+
+        with mock.patch.object(job_queue, '_pool_size', 4):
+            self.assertEqual(job_queue.live_worker_count(), 6)
+
+
+class JobRetryStatusTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retry', email='retry@example.com', password='pass12345')
+        self.video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4',
+                                          status='processing')
+
+    def _run_failing_job(self, job):
+        with mock.patch('uploader.video_processing.process_video', side_effect=Exception('ffmpeg exploded')), \
+                mock.patch.object(job_queue, 'check_ffmpeg_installed', return_value=True):
+            self.assertFalse(job_queue.run_job(job))
+        job.refresh_from_db()
+        self.video.refresh_from_db()
+
+    def test_retried_job_does_not_fail_video(self):
+        job = ProcessingJob.objects.create(video=self.video, status='running', attempts=1, max_attempts=3,
+                                           encode_profile='balanced')
+
+        self._run_failing_job(job)
+
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(self.video.status, 'processing')
+        self.assertIn('ffmpeg exploded', self.video.processing_message)
+
+    def test_last_attempt_fails_video(self):
+        job = ProcessingJob.objects.create(video=self.video, status='running', attempts=3, max_attempts=3,
+                                           encode_profile='balanced')
+
+        self._run_failing_job(job)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.video.status, 'failed')
+
+    def test_missing_ffmpeg_fails_without_retry(self):
+        job = ProcessingJob.objects.create(video=self.video, status='running', attempts=1, max_attempts=3)
+
+        with mock.patch('uploader.video_processing.process_video') as process_video, \
+                mock.patch.object(job_queue, 'check_ffmpeg_installed', return_value=False):
+            self.assertFalse(job_queue.run_job(job))
+        job.refresh_from_db()
+        self.video.refresh_from_db()
+
+        process_video.assert_not_called()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.video.status, 'failed')
+        self.assertIn('FFmpeg', self.video.processing_message)
+
+
+class SegmentCheckpointTest(TestCase):
+    METADATA = {'duration': 120.0, 'width': 1920, 'height': 1080, 'video_codec': 'h264', 'pix_fmt': 'yuv420p',
+                'audio_codec': 'aac'}
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, VIDEO_MEZZANINE_ENABLED=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(username='cutter', email='cutter@example.com', password='pass12345')
+        self.video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4',
+                                          duration=120, target_duration=60, max_shorts_count=5)
+        self.shorts_dir = os.path.join(self.media_root, 'shorts', str(self.video.id))
+        os.makedirs(self.shorts_dir)
+
+    def _checkpoint(self, order, start_time, duration):
+        with open(os.path.join(self.shorts_dir, f'short_{order}.mp4'), 'wb') as f:
+            f.write(b'short')
+        return Short.objects.create(video=self.video, title=f'Short {order}', order=order, start_time=start_time,
+                                    duration=duration, short_file=f'shorts/{self.video.id}/short_{order}.mp4')
+
+    def _cut(self, job, plan_segments=None):
+        service = VideoProcessingService(self.video, job=job)
+        service.metadata = self.METADATA
+        encoded = []
+
+        def encode(segments, crop_mode):
+            for segment in segments:
+                encoded.append(segment['order'])
+                yield segment, True
+
+        with mock.patch('uploader.video_processing.check_ffmpeg_installed', return_value=True), \
+                mock.patch.object(service, 'plan_segments', side_effect=plan_segments) as planner, \
+                mock.patch.object(service, '_encode_segments', side_effect=encode):
+            shorts = service.cut_into_shorts()
+        return shorts, encoded, planner
+
+    def test_retry_reuses_segment_plan_of_job(self):
+        job = ProcessingJob.objects.create(video=self.video, segment_plan=[[0, 55.5], [55.5, 64.5]])
+        self._checkpoint(1, 0, 55)
+
+        shorts, encoded, planner = self._cut(job)
+
+        planner.assert_not_called()
+        self.assertEqual(encoded, [2])
+        self.assertEqual([(s.start_time, s.duration) for s in shorts], [(0, 55), (55.5, 64)])
+
+    def test_new_plan_is_saved_and_stale_checkpoints_discarded(self):
+        job = ProcessingJob.objects.create(video=self.video)
+        # Checkpoint z planu stałej długości (poprzednia próba bez analizy treści)
+        self._checkpoint(1, 0, 60)
+        stale = self._checkpoint(2, 60, 60)
+
+        shorts, encoded, _ = self._cut(job, plan_segments=lambda *args: [(0, 60), (58.2, 61.8)])
+
+        job.refresh_from_db()
+        self.assertEqual(job.segment_plan, [[0, 60], [58.2, 61.8]])
+        self.assertEqual(encoded, [2])
+        self.assertFalse(Short.objects.filter(pk=stale.pk).exists())
+        self.assertEqual([(s.start_time, s.duration) for s in shorts], [(0, 60), (58.2, 61)])
+
+
+class ContentAnalysisTest(TestCase):
+    LOG = '\n'.join([
+        '[Parsed_metadata_3 @ 0x1] frame:0    pts:0       pts_time:0.2',
+        '[Parsed_ametadata_9 @ 0x2] frame:0    pts:0       pts_time:0',
+        '[Parsed_metadata_3 @ 0x1] lavfi.scene_score=0.500000',
+        '[Parsed_ametadata_9 @ 0x2] lavfi.astats.Overall.RMS_level=-20.000000',
+        '[Parsed_ametadata_9 @ 0x2] frame:1    pts:800     pts_time:0.1',
+        '[Parsed_ametadata_9 @ 0x2] lavfi.astats.Overall.RMS_level=-30.000000',
+        '[silencedetect @ 0x3] silence_start: 1.2',
+        '[Parsed_ametadata_9 @ 0x2] frame:2    pts:8800    pts_time:1.1',
+        '[Parsed_ametadata_9 @ 0x2] lavfi.astats.Overall.RMS_level=-inf',
+        '[Parsed_metadata_3 @ 0x1] frame:6    pts:6       pts_time:1.4',
+        '[Parsed_metadata_3 @ 0x1] lavfi.scene_score=0.100000',
+    ])
+
+    def test_one_pass_log_yields_scenes_silences_and_loudness(self):
+        analysis = video_analysis.parse_content_analysis(self.LOG, 2.0)
+
+        self.assertEqual(analysis['scene_cuts'], [[0.2, 0.5]])
+        self.assertEqual(analysis['silences'], [[1.2, 2.0]])
+        self.assertEqual(analysis['motion'], [0.5, 0.1])
+        self.assertEqual(analysis['loudness'], [-25.0, video_analysis.HIGHLIGHT_SILENCE_DB])
+        self.assertEqual(analysis['loudness_variance'], [25.0, 0.0])
+
+    def test_failed_analysis_is_not_repeated_for_highlights(self):
+        user = User.objects.create_user(username='analysis', email='analysis@example.com', password='pass12345')
+        video = Video.objects.create(user=user, title='Wideo', video_file='videos/source.mp4')
+        service = VideoProcessingService(video)
+        service.metadata = {'duration': 600.0, 'audio_codec': 'aac'}
+
+        with mock.patch.object(service, 'analyze_content', side_effect=Exception('ffmpeg exploded')) as analyze:
+            segments = service.plan_segments(600, 60, 3)
+
+        analyze.assert_called_once()
+        self.assertEqual(segments, [(0, 60), (60, 60), (120, 60)])
+
+
+class ChunkedUploadTest(TestCase):
+    # Nagłówek MP4 (atom ftyp) + wypełnienie
+    CONTENT = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 40
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, UPLOAD_CHUNK_SIZE=4096,
+                                                   VIDEO_PROGRESSIVE_PROCESSING=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(username='uploader', email='uploader@example.com', password='pass12345')
+        self.client.force_login(self.user)
+
+    def _create(self, size=None):
+        response = self.client.post(reverse('uploader:upload_session_create'), {
+            'title': 'Wideo',
+            'description': '',
+            'target_duration': 60,
+            'max_shorts_count': 5,
+            'crop_mode': 'top',
+            'filename': 'film.mp4',
+            'size': size or len(self.CONTENT),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def _patch(self, session, offset, data):
+        return self.client.generic('PATCH', session['url'], data, content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET=str(offset))
+
+    def _offset(self, session):
+        response = self.client.head(session['url'])
+        self.assertEqual(response.status_code, 200)
+        return int(response['Upload-Offset'])
+
+    def test_create_session(self):
+        session = self._create()
+
+        self.assertEqual(session['offset'], 0)
+        self.assertEqual(session['size'], len(self.CONTENT))
+        self.assertEqual(session['status'], 'uploading')
+        self.assertEqual(self._offset(session), 0)
+
+    def test_chunks_advance_offset(self):
+        session = self._create()
+
+        response = self._patch(session, 0, self.CONTENT[:4096])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '4096')
+        self.assertEqual(self._offset(session), 4096)
+
+    def test_repeated_chunk_is_idempotent(self):
+        session = self._create()
+        self._patch(session, 0, self.CONTENT[:4096])
+        self._patch(session, 4096, self.CONTENT[4096:8192])
+
+        # Ponowienie pierwszego kawałka nie cofa offsetu
+        response = self._patch(session, 0, self.CONTENT[:4096])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._offset(session), 8192)
+
+    def test_gap_is_rejected_with_current_offset(self):
+        session = self._create()
+        self._patch(session, 0, self.CONTENT[:4096])
+
+        response = self._patch(session, 8192, self.CONTENT[8192:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '4096')
+
+    def test_non_video_is_rejected(self):
+        session = self._create()
+
+        response = self._patch(session, 0, b'not a video file at all')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(UploadSession.objects.get().status, 'aborted')
+
+    def test_abort_removes_data_and_stops_client(self):
+        session = self._create()
+        self._patch(session, 0, self.CONTENT[:4096])
+
+        response = self.client.delete(session['url'])
+        self.assertEqual(response.status_code, 204)
+        stored = UploadSession.objects.get()
+        self.assertEqual(stored.status, 'aborted')
+        self.assertFalse(os.listdir(os.path.join(self.media_root, os.path.dirname(stored.stored_name))))
+
+        # Przerwana sesja - 410, nie 409 (klient nie może jej wznowić)
+        for _ in range(2):
+            response = self._patch(session, 4096, self.CONTENT[4096:8192])
+            self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.client.post(session['commit_url']).status_code, 410)
+
+    def test_commit_creates_video(self):
+        session = self._create()
+        for offset in range(0, len(self.CONTENT), 4096):
+            self._patch(session, offset, self.CONTENT[offset:offset + 4096])
+
+        response = self.client.post(session['commit_url'])
+        self.assertEqual(response.status_code, 200)
+        video = Video.objects.get(pk=response.json()['video_id'])
+        self.assertEqual(video.title, 'Wideo')
+        with open(video.video_file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertEqual(ProcessingJob.objects.get(video=video).crop_mode, 'top')
+
+        # Ponowne zatwierdzenie zwraca to samo wideo
+        self.assertEqual(self.client.post(session['commit_url']).json()['video_id'], video.pk)
+
+    def test_commit_of_incomplete_upload_is_rejected(self):
+        session = self._create()
+        self._patch(session, 0, self.CONTENT[:4096])
+
+        response = self.client.post(session['commit_url'])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Video.objects.exists())
+
+
+class ShortStatsSyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stats', email='stats@example.com', password='pass12345')
+        self.yt_account = YTAccount.objects.create(
+            user=self.user, channel_name='Kanał', channel_id='UC123', access_token='token',
+            refresh_token='refresh', token_expiry=timezone.now() + timedelta(hours=1),
+        )
+        video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4')
+        self.shorts = [
+            Short.objects.create(video=video, title=f'Short {i}', short_file=f'shorts/{i}.mp4', start_time=i * 60,
+                                 duration=60, order=i, upload_status='published', yt_video_id=f'yt{i}')
+            for i in range(120)
+        ]
+
+    def test_stats_are_fetched_in_batches_of_50(self):
+        youtube = mock.MagicMock()
+        youtube.videos.return_value.list.side_effect = lambda part, id: mock.MagicMock(**{
+            'execute.return_value': {'items': [
+                {'id': video_id, 'statistics': {'viewCount': '10', 'likeCount': '2', 'commentCount': '1'}}
+                for video_id in id.split(',')
+            ]}
+        })
+
+        with mock.patch.object(youtube_service, 'get_youtube_client', return_value=youtube):
+            totals = youtube_service.sync_short_stats()
+
+        calls = youtube.videos.return_value.list.call_args_list
+        self.assertEqual([len(c.kwargs['id'].split(',')) for c in calls], [50, 50, 20])
+        self.assertEqual(totals['updated'], 120)
+        self.assertEqual(totals['calls'], 3)
+        self.assertFalse(Short.objects.filter(views=0).exists())
+
+    def test_missing_video_is_not_refreshed_again(self):
+        short = self.shorts[0]
+        youtube = mock.MagicMock()
+        youtube.videos.return_value.list.return_value.execute.return_value = {'items': []}
+
+        with mock.patch.object(youtube_service, 'get_youtube_client', return_value=youtube):
+            result = youtube_service.sync_account_stats(self.yt_account, [short])
+
+        short.refresh_from_db()
+        self.assertEqual(result['missing'], 1)
+        self.assertIsNotNone(short.last_analytics_update)
+        self.assertFalse(stats_refresh.is_stale(short))
+
+
+class EncodeCacheEvictionTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.override = override_settings(ENCODE_CACHE_DIR=self.tmp, ENCODE_CACHE_MAX_SIZE_MB=1)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        encode_cache.evict()
+
+    def _output(self, name, size):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+        return path
+
+    def test_store_scans_only_after_threshold(self):
+        with mock.patch.object(encode_cache, 'evict') as evict:
+            encode_cache.store('a' * 64, self._output('small.mp4', 1024))
+            evict.assert_not_called()
+            # 1/10 limitu (1 MB) dopisane od ostatniego skanu
+            encode_cache.store('b' * 64, self._output('large.mp4', 110 * 1024))
+            evict.assert_called_once()
+
+    def test_hard_linked_entries_are_kept(self):
+        linked, unlinked = 'c' * 64, 'd' * 64
+        encode_cache.store(linked, self._output('linked.mp4', 1024))
+        output = self._output('unlinked.mp4', 1024)
+        encode_cache.store(unlinked, output)
+        os.remove(output)
+
+        self.assertEqual(encode_cache.evict(max_bytes=0), 1)
+        self.assertTrue(encode_cache._entry_path(linked).exists())
+        self.assertFalse(encode_cache._entry_path(unlinked).exists())
+
+
+class DirectToStorageUploadTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def _upload(self, content):
+        handler = DirectToStorageUploadHandler()
+        handler.new_file('video_file', 'film.mp4', 'video/mp4', len(content))
+        handler.receive_data_chunk(content, 0)
+        return handler.file_complete(len(content))
+
+    def test_upload_is_enqueued_without_local_ffmpeg(self):
+        user = User.objects.create_user(username='uploader', email='uploader@example.com', password='pass12345')
+        self.client.force_login(user)
+        video_file = SimpleUploadedFile('film.mp4', b'\0\0\0\x18ftypmp42' + b'\0' * 100, content_type='video/mp4')
+
+        with mock.patch('uploader.views.check_ffmpeg_installed', return_value=False):
+            response = self.client.post(reverse('uploader:video_upload'), {
+                'title': 'Film', 'video_file': video_file, 'target_duration': 60, 'max_shorts_count': 5,
+                'crop_mode': 'smart',
+            })
+
+        video = Video.objects.get(user=user)
+        self.assertRedirects(response, reverse('uploader:video_detail', args=[video.pk]), fetch_redirect_response=False)
+        self.assertEqual(ProcessingJob.objects.get(video=video).crop_mode, 'smart')
+
+    def _stored_files(self):
+        return [name for _, _, files in os.walk(os.path.join(self.media, 'videos')) for name in files]
+
+    def _post_upload(self, client):
+        user = User.objects.create_user(username='uploader', email='uploader@example.com', password='pass12345')
+        client.force_login(user)
+        video_file = SimpleUploadedFile('film.mp4', b'\0\0\0\x18ftypmp42' + b'\0' * 100, content_type='video/mp4')
+        return client.post(reverse('uploader:video_upload'), {
+            'title': 'Film', 'video_file': video_file, 'target_duration': 60, 'max_shorts_count': 5,
+        })
+
+    def test_csrf_rejection_removes_stored_file(self):
+        client = Client(enforce_csrf_checks=True)
+        # Z ciasteczkiem CSRF token jest szukany w treści - plik zostaje wczytany
+        client.cookies['csrftoken'] = 'a' * 32
+        response = self._post_upload(client)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Video.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_unreadable_request_removes_stored_file(self):
+        file_complete = DirectToStorageUploadHandler.file_complete
+
+        def broken_file_complete(handler, file_size):
+            file_complete(handler, file_size)
+            raise UnreadablePostError('connection reset')
+
+        with mock.patch.object(DirectToStorageUploadHandler, 'file_complete', broken_file_complete):
+            with self.assertRaises(UnreadablePostError):
+                self._post_upload(self.client)
+
+        self.assertEqual(self._stored_files(), [])
+
+    def test_stored_file_is_opened_lazily(self):
+        content = b'\0\0\0\x18ftypmp42' + b'\0' * 100
+        uploaded = self._upload(content)
+
+        self.assertEqual(uploaded.detected_format, 'mp4')
+        self.assertIsNone(uploaded._file)
+        self.assertTrue(uploaded.closed)
+
+        self.assertEqual(uploaded.read(), content)
+        self.assertFalse(uploaded.closed)
+        uploaded.close()
+        self.assertTrue(uploaded.closed)
+
+
+class QuotaTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='quota', email='quota@example.com', password='pass12345')
+        self.yt_account = YTAccount.objects.create(
+            user=self.user, channel_name='Kanał', channel_id='UC123', access_token='token',
+            refresh_token='refresh', token_expiry=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_record_accumulates_units(self):
+        quota.record(self.yt_account, 'videos.insert')
+        quota.record(self.yt_account, 'videos.list', calls=3)
+
+        self.assertEqual(YTQuotaUsage.objects.get(yt_account=self.yt_account).units, 1603)
+
+    def test_first_record_of_day_survives_concurrent_insert(self):
+        bulk_create = YTQuotaUsage.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Inny proces wstawił wiersz doby między UPDATE a INSERT
+            YTQuotaUsage.objects.create(yt_account=self.yt_account, day=quota.quota_day(), units=50)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(YTQuotaUsage.objects, 'bulk_create', side_effect=racing_bulk_create):
+            quota.record(self.yt_account, 'videos.insert')
+
+        self.assertEqual(YTQuotaUsage.objects.get(yt_account=self.yt_account).units, 1650)
+
+    def test_mark_exhausted_leaves_nothing_to_spend(self):
+        quota.mark_exhausted(self.yt_account)
+
+        self.assertEqual(quota.remaining(self.yt_account), 0)
+        self.assertFalse(quota.can_afford(self.yt_account, 'videos.list'))
+
+
+class ShortDeleteQuotaTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='deleter', email='deleter@example.com', password='pass12345')
+        self.yt_account = YTAccount.objects.create(
+            user=self.user, channel_name='Kanał', channel_id='UC123', access_token='token',
+            refresh_token='refresh', token_expiry=timezone.now() + timedelta(hours=1),
+        )
+        video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4')
+        self.short = Short.objects.create(video=video, title='Short', short_file='shorts/1.mp4', start_time=0,
+                                          duration=60, order=1, upload_status='published', yt_video_id='yt1')
+        self.client.force_login(self.user)
+
+    def _delete(self, youtube):
+        with mock.patch.object(youtube_service, 'get_youtube_client', return_value=youtube):
+            return self.client.post(reverse('uploader:short_delete', args=[self.short.pk]))
+
+    def test_short_is_kept_without_quota(self):
+        quota.mark_exhausted(self.yt_account)
+        youtube = mock.MagicMock()
+
+        response = self._delete(youtube)
+
+        self.assertRedirects(response, reverse('uploader:short_detail', args=[self.short.pk]),
+                             fetch_redirect_response=False)
+        youtube.videos.return_value.delete.assert_not_called()
+        self.assertTrue(Short.objects.filter(pk=self.short.pk).exists())
+
+    def test_quota_exceeded_response_keeps_short_and_marks_exhausted(self):
+        youtube = mock.MagicMock()
+        youtube.videos.return_value.delete.return_value.execute.side_effect = HttpError(
+            httplib2.Response({'status': 403}),
+            b'{"error": {"errors": [{"reason": "quotaExceeded"}]}}',
+        )
+
+        self._delete(youtube)
+
+        self.assertTrue(Short.objects.filter(pk=self.short.pk).exists())
+        self.assertTrue(YTQuotaUsage.objects.get(yt_account=self.yt_account).exhausted)
+
+    def test_published_short_is_deleted_on_youtube(self):
+        youtube = mock.MagicMock()
+
+        self._delete(youtube)
+
+        youtube.videos.return_value.delete.assert_called_once_with(id='yt1')
+        self.assertFalse(Short.objects.filter(pk=self.short.pk).exists())
+        self.assertEqual(YTQuotaUsage.objects.get(yt_account=self.yt_account).units, 50)
+
+
+class PlanEncodeTest(TestCase):
+    @staticmethod
+    def _metadata(width, height, video_codec='h264', audio_codec='aac'):
+        return {'width': width, 'height': height, 'video_codec': video_codec, 'pix_fmt': 'yuv420p',
+                'audio_codec': audio_codec}
+
+    def test_plans(self):
+        cases = [
+            # (metadata, crop_mode, oczekiwane klucze planu)
+            (self._metadata(1920, 1080), 'center',
+             {'crop': (606, 1080, 657, 0), 'output_width': 606, 'output_height': 1080, 'scale': False,
+              'copy_video': False, 'copy_audio': True, 'smart_crop': False, 'maxrate': '3500k'}),
+            (self._metadata(1920, 1080), 'smart', {'crop': (606, 1080, 657, 0), 'smart_crop': True}),
+            (self._metadata(1080, 1920), 'smart',
+             {'crop': None, 'output_width': 1080, 'output_height': 1920, 'copy_video': True, 'smart_crop': False,
+              'maxrate': '8000k', 'bufsize': '16000k'}),
+            (self._metadata(2160, 3840, video_codec='hevc', audio_codec='opus'), 'center',
+             {'crop': None, 'output_width': 1080, 'output_height': 1920, 'scale': True, 'copy_video': False,
+              'copy_audio': False}),
+            (self._metadata(1080, 2400), 'center', {'crop': (1080, 1920, 0, 240), 'scale': False}),
+            (self._metadata(1080, 2400), 'top', {'crop': (1080, 1920, 0, 0)}),
+            (self._metadata(640, 360, audio_codec=None), 'center',
+             {'crop': (202, 360, 219, 0), 'output_height': 360, 'maxrate': '1500k', 'copy_audio': False}),
+        ]
+        for metadata, crop_mode, expected in cases:
+            with self.subTest(size=(metadata['width'], metadata['height']), crop_mode=crop_mode):
+                plan = plan_encode(metadata, crop_mode)
+                self.assertEqual({key: plan[key] for key in expected}, expected)
+
+
+class PlanSegmentBoundariesTest(TestCase):
+    NO_BREAKS = {'silences': [], 'scene_cuts': [], 'motion': [0.0]}
+
+    def test_boundaries(self):
+        cases = [
+            # (duration, target, analysis, max_count, oczekiwane segmenty)
+            ('shorter than one short, fixed', 30, 60, None, None, []),
+            ('shorter than one short, content', 30, 60, self.NO_BREAKS, None, []),
+            ('fixed length', 200, 60, None, None, [(0, 60), (60, 60), (120, 60)]),
+            ('fixed length, max_count', 200, 60, None, 2, [(0, 60), (60, 60)]),
+            ('no silence or scene candidates', 130, 60, self.NO_BREAKS, None, [(0.0, 60.0), (60.0, 60.0)]),
+            ('cut in the middle of a silence', 200, 60, {'silences': [[55, 57]], 'scene_cuts': []}, None,
+             [(0.0, 56.0), (56.0, 60.0), (116.0, 60.0)]),
+            ('silence beats a closer scene cut', 130, 60,
+             {'silences': [[66, 67]], 'scene_cuts': [[60.0, 0.9]]}, 1, [(0.0, 66.5)]),
+            ('silence past the maximum length is ignored', 130, 60,
+             {'silences': [[70, 71]], 'scene_cuts': []}, 1, [(0.0, 60.0)]),
+            ('scene cut when there is no silence', 130, 60,
+             {'silences': [], 'scene_cuts': [[62.0, 0.9]]}, None, [(0.0, 62.0), (62.0, 60.0)]),
+        ]
+        for name, duration, target, analysis, max_count, expected in cases:
+            with self.subTest(name):
+                self.assertEqual(
+                    video_analysis.plan_segment_boundaries(duration, target, analysis, max_count),
+                    expected
+                )
+
+
+class SelectHighlightsTest(TestCase):
+    WINDOWS = [(0, 60), (60, 60), (120, 60)]
+
+    def test_selection(self):
+        loudness = [-60.0] * 60 + [-10.0] * 60 + [-30.0] * 60
+        cases = [
+            # (nazwa, analiza, liczba, oczekiwane okna)
+            ('fewer windows than count', {}, 5, self.WINDOWS),
+            ('no features keeps the first windows', {}, 2, [(0, 60), (60, 60)]),
+            ('loudest windows in chronological order', {'loudness': loudness}, 2, [(60, 60), (120, 60)]),
+            ('motion only', {'motion': [0.0] * 120 + [0.8] * 60}, 1, [(120, 60)]),
+        ]
+        for name, analysis, count, expected in cases:
+            with self.subTest(name):
+                self.assertEqual(video_analysis.select_highlights(self.WINDOWS, analysis, count), expected)
+
+
+class CropXExpressionTest(TestCase):
+    def test_expressions(self):
+        cases = [
+            ([(0.0, 100)], '100'),
+            ([(0.0, 100), (1.0, 100)], '100'),
+            ([(0.0, 100), (1.0, 100), (2.0, 160)], '100+(60)*clip((t-1.0)/1.000,0,1)'),
+            ([(0.0, 200), (0.5, 150), (1.5, 150), (2.0, 180)],
+             '200+(-50)*clip((t-0.0)/0.500,0,1)+(30)*clip((t-1.5)/0.500,0,1)'),
+        ]
+        for points, expected in cases:
+            with self.subTest(points=points):
+                self.assertEqual(video_analysis.crop_x_expression(points), expected)
+
+
+class MoovAvailableTest(TestCase):
+    @staticmethod
+    def _atom(name, payload=0, size=None):
+        return struct.pack('>I4s', 8 + payload if size is None else size, name) + bytes(payload)
+
+    def _check(self, data, available=None):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.remove, f.name)
+        return progressive.moov_available(f.name, len(data) if available is None else available)
+
+    def test_layouts(self):
+        ftyp, moov, mdat = self._atom(b'ftyp', 8), self._atom(b'moov', 100), self._atom(b'mdat', 1000)
+        large_mdat = struct.pack('>I4sQ', 1, b'mdat', 16 + 100) + bytes(100)
+        cases = [
+            # (nazwa, dane, dostępne bajty, oczekiwany wynik)
+            ('faststart', ftyp + moov + mdat, None, True),
+            ('faststart, moov fully received', ftyp + moov + mdat, len(ftyp + moov), True),
+            ('moov partially received', ftyp + moov + mdat, len(ftyp) + 50, None),
+            ('only ftyp header received', ftyp + moov + mdat, 10, None),
+            ('moov atom at the end', ftyp + mdat + moov, None, False),
+            ('64-bit mdat before moov', ftyp + large_mdat + moov, None, False),
+            ('mdat to end of file', ftyp + self._atom(b'mdat', 100, size=0), None, False),
+            ('free atom before moov', ftyp + self._atom(b'free', 20) + moov + mdat, None, True),
+        ]
+        for name, data, available, expected in cases:
+            with self.subTest(name):
+                self.assertIs(self._check(data, available), expected)
+
+
+class QuotaDayTest(TestCase):
+    def test_day_and_reset_follow_pacific_midnight(self):
+        utc = dt_timezone.utc
+        cases = [
+            # (teraz UTC, doba quota, odnowienie UTC)
+            (datetime(2026, 1, 15, 7, 59, 59, tzinfo=utc), '2026-01-14', datetime(2026, 1, 15, 8, 0, tzinfo=utc)),
+            (datetime(2026, 1, 15, 8, 0, tzinfo=utc), '2026-01-15', datetime(2026, 1, 16, 8, 0, tzinfo=utc)),
+            (datetime(2026, 7, 1, 6, 59, tzinfo=utc), '2026-06-30', datetime(2026, 7, 1, 7, 0, tzinfo=utc)),
+            (datetime(2026, 7, 1, 7, 0, tzinfo=utc), '2026-07-01', datetime(2026, 7, 2, 7, 0, tzinfo=utc)),
+            # Zmiana czasu 8 marca - doba ma 23 godziny
+            (datetime(2026, 3, 7, 12, 0, tzinfo=utc), '2026-03-07', datetime(2026, 3, 8, 8, 0, tzinfo=utc)),
+            (datetime(2026, 3, 8, 12, 0, tzinfo=utc), '2026-03-08', datetime(2026, 3, 9, 7, 0, tzinfo=utc)),
+        ]
+        for now, day, reset in cases:
+            with self.subTest(now=now):
+                self.assertEqual(quota.quota_day(now).isoformat(), day)
+                self.assertEqual(quota.next_reset(now), reset)
+
+
+@override_settings(VIDEO_ENCODE_PROFILE='auto', VIDEO_ENCODE_LATENCY_TARGET=1800)
+class SelectProfileTest(TestCase):
+    # Klatki/s profili - czas opróżnienia = backlog * 30 / (fps * workery)
+    CALIBRATION = {'quality': 10, 'balanced': 30, 'fast': 90, 'fastest': 300}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='encoder', email='encoder@example.com', password='pass12345')
+        patcher = mock.patch.object(encoder_profiles, '_current_profile', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _calibrate(self):
+        for profile, fps in self.CALIBRATION.items():
+            EncoderCalibration.objects.create(host=encoder_profiles._host(), profile=profile, fps=fps)
+
+    def _queue(self, jobs):
+        # Każde zadanie to 300 s materiału (5 shortów po 60 s)
+        for _ in range(jobs):
+            video = Video.objects.create(user=self.user, title='Wideo', video_file='videos/source.mp4',
+                                         duration=600, target_duration=60, max_shorts_count=5)
+            ProcessingJob.objects.create(video=video)
+
+    def test_fixed_profile_setting(self):
+        for configured, expected in [('fast', 'fast'), ('turbo', encoder_profiles.DEFAULT_PROFILE)]:
+            with self.subTest(configured=configured), override_settings(VIDEO_ENCODE_PROFILE=configured):
+                self.assertEqual(encoder_profiles.select_profile(), expected)
+
+    def test_without_calibration_uses_default(self):
+        self._queue(1)
+        self.assertEqual(encoder_profiles.select_profile(), encoder_profiles.DEFAULT_PROFILE)
+
+    def test_profile_follows_backlog_and_parallelism(self):
+        self._calibrate()
+        cases = [
+            # (zadania w kolejce, workery, bieżący profil, oczekiwany profil)
+            (0, 1, None, 'quality'),
+            (1, 1, None, 'quality'),
+            (10, 1, None, 'fast'),
+            (10, 4, None, 'balanced'),
+            (100, 1, None, 'fastest'),
+            # Histereza: balanced mieści się w limicie, ale nie w zapasie
+            (5, 1, None, 'balanced'),
+            (5, 1, 'fast', 'fast'),
+        ]
+        queued = 0
+        for jobs, parallelism, current, expected in sorted(cases, key=lambda case: case[0]):
+            self._queue(jobs - queued)
+            queued = jobs
+            with self.subTest(jobs=jobs, parallelism=parallelism, current=current):
+                encoder_profiles._current_profile = current
+                self.assertEqual(encoder_profiles.select_profile(parallelism=parallelism), expected)
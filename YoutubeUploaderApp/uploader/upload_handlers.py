@@ -0,0 +1,193 @@
+"""
+Handlery uploadu plików wideo
+"""
+import hashlib
+import io
+import os
+import logging
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from .models import Video
+
+logger = logging.getLogger(__name__)
+
+# Bajty nagłówka potrzebne do rozpoznania kontenera
+HEADER_SIZE = 12
+
+# Atomy, od których zaczynają się pliki MP4/MOV (bajty 4-8)
+_ISO_BMFF_ATOMS = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip')
+
+
+def detect_video_format(header):
+    """Rozpoznaje kontener wideo po nagłówku pliku (None gdy nieznany)"""
+    if header[4:8] in _ISO_BMFF_ATOMS:
+        return 'mp4'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'avi'
+    if header[:4] == b'\x1a\x45\xdf\xa3':
+        return 'mkv'
+    if header[:3] == b'FLV':
+        return 'flv'
+    if header[:8] == b'\x30\x26\xb2\x75\x8e\x66\xcf\x11':
+        return 'wmv'
+    return None
+
+
+def reserve_video_path(file_name):
+    """
+    Rezerwuje nazwę pliku źródłowego w `videos/%Y/%m/%d/` pustym plikiem,
+    żeby równoległy upload nie wybrał tej samej.
+
+    Returns:
+        tuple: (nazwa w storage, ścieżka na dysku)
+    """
+    field = Video._meta.get_field('video_file')
+    name = field.generate_filename(None, file_name)
+    os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+
+    while True:
+        stored_name = default_storage.get_available_name(name)
+        path = default_storage.path(stored_name)
+        try:
+            open(path, 'x').close()
+            return stored_name, path
+        except FileExistsError:
+            continue
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    Plik zapisany już w docelowym miejscu storage.
+
+    Plik na dysku jest otwierany dopiero przy pierwszym odczycie - widok
+    przypisuje do modelu samą nazwę, więc zwykle deskryptor nie powstaje.
+
+    Atrybuty:
+        stored_name: Nazwa w storage (do przypisania do FileField)
+        sha256: SHA-256 zawartości
+        detected_format: Kontener rozpoznany po nagłówku (None = nie wideo)
+    """
+
+    def __init__(self, file, name, content_type, size, charset, stored_name, sha256, detected_format, path=None):
+        self.path = path
+        super().__init__(file, name, content_type, size, charset)
+        self.stored_name = stored_name
+        self.sha256 = sha256
+        self.detected_format = detected_format
+
+    @property
+    def file(self):
+        if self._file is None and self.path:
+            self._file = open(self.path, 'rb')
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    @property
+    def closed(self):
+        return self._file is None or self._file.closed
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class DirectToStorageUploadHandler(FileUploadHandler):
+    """
+    Zapisuje upload wideo od razu w docelowym katalogu `videos/%Y/%m/%d/`
+    (bez pliku tymczasowego i kopiowania), licząc w tym samym przebiegu
+    SHA-256 i rozpoznając kontener po nagłówku. Plik jest pisany jako
+    `.part` i pojawia się pod docelową nazwą atomowo po zakończeniu.
+
+    Pliki, które nie wyglądają na wideo, nie są zapisywane dalej niż
+    nagłówek. Wymaga FileSystemStorage i ustawienia przed pierwszym
+    odczytem request.POST/FILES.
+    """
+
+    stored_name = None
+    uploaded = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.stored_name, self.final_path = reserve_video_path(self.file_name)
+        self.partial_path = f'{self.final_path}.part'
+
+        self.file = open(self.partial_path, 'wb')
+        self.digest = hashlib.sha256()
+        self.header = b''
+        self.detected_format = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) >= HEADER_SIZE:
+                self.detected_format = detect_video_format(self.header)
+                if self.detected_format is None:
+                    logger.warning(f'Upload {self.file_name} is not a recognized video container')
+                    self._discard()
+
+        if self.file is not None:
+            self.digest.update(raw_data)
+            self.file.write(raw_data)
+        # Dane nie trafiają do kolejnych handlerów
+        return None
+
+    def file_complete(self, file_size):
+        if self.file is None:
+            # Odrzucony po nagłówku - formularz zgłosi błąd formatu
+            return StoredUploadedFile(
+                io.BytesIO(), self.file_name, self.content_type, file_size, self.charset,
+                stored_name='', sha256='', detected_format=None
+            )
+
+        if self.detected_format is None:
+            # Plik krótszy niż nagłówek
+            self.detected_format = detect_video_format(self.header)
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.partial_path, self.final_path)
+        self.file = None
+
+        self.uploaded = StoredUploadedFile(
+            None, self.file_name, self.content_type, file_size, self.charset,
+            stored_name=self.stored_name,
+            sha256=self.digest.hexdigest(),
+            detected_format=self.detected_format,
+            path=self.final_path
+        )
+        return self.uploaded
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def discard_unclaimed(self):
+        """Usuwa zapisany plik (i .part), jeśli żadne Video na niego nie wskazuje"""
+        if self.stored_name is None:
+            return
+        if Video.objects.filter(video_file=self.stored_name).exists():
+            return
+        if self.uploaded is not None:
+            self.uploaded.close()
+        self._discard()
+
+    def _discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for path in (self.partial_path, self.final_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def discard_stored_upload(uploaded):
+    """Usuwa plik zapisany przez DirectToStorageUploadHandler (odrzucony lub duplikat)"""
+    if uploaded is not None:
+        uploaded.close()
+    stored_name = getattr(uploaded, 'stored_name', '')
+    if stored_name and default_storage.exists(stored_name):
+        default_storage.delete(stored_name)
@@ -26,7 +26,11 @@ urlpatterns = [
     # Wideo
     path('videos/', views.VideoListView.as_view(), name='video_list'),
     path('videos/upload/', views.VideoUploadView.as_view(), name='video_upload'),
+    path('videos/upload/sessions/', views.upload_session_create, name='upload_session_create'),
+    path('videos/upload/sessions/<uuid:session_id>/', views.upload_session_detail, name='upload_session_detail'),
+    path('videos/upload/sessions/<uuid:session_id>/commit/', views.upload_session_commit, name='upload_session_commit'),
     path('videos/<int:pk>/', views.VideoDetailView.as_view(), name='video_detail'),
+    path('videos/<int:pk>/recut/', views.video_recut, name='video_recut'),
     path('videos/<int:pk>/delete/', views.video_delete, name='video_delete'),
     
     # Shorty
@@ -48,6 +52,7 @@ urlpatterns = [
     # API Endpoints
     path('api/video/<int:pk>/status/', views.api_video_status, name='api_video_status'),
     path('api/video/<int:pk>/progress/', views.api_video_progress, name='api_video_progress'),
+    path('api/short/<int:pk>/stats/', views.api_short_stats, name='api_short_stats'),
     
     # Zarządzanie użytkownikami (Moderator & Admin)
     path('users/', views.user_management_list, name='user_management_list'),
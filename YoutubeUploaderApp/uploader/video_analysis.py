@@ -0,0 +1,394 @@
+"""
+Analiza treści wideo na klatkach niskiej rozdzielczości (NumPy)
+
+Klatki są pobierane jednym potokiem FFmpeg (rawvideo, skala szarości,
+~160px szerokości), więc analiza kosztuje ułamek czasu kodowania.
+"""
+import re
+import subprocess
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Szerokość klatek analizy i liczba klatek na sekundę
+ANALYSIS_WIDTH = 160
+SMART_CROP_FPS = 2
+
+# Co ile sekund punkt ścieżki kadru przekazywany do FFmpeg
+SMART_CROP_KEYPOINT_INTERVAL = 1.0
+
+# Maksymalna prędkość przesuwania kadru (szerokości kadru na sekundę)
+SMART_CROP_MAX_SPEED = 0.5
+
+# Analiza granic segmentów: próbkowanie obrazu i parametry wykrywania ciszy
+CONTENT_ANALYSIS_FPS = 5
+CONTENT_ANALYSIS_AUDIO_RATE = 8000
+SCENE_CUT_THRESHOLD = 0.3
+SILENCE_NOISE_LEVEL = '-35dB'
+SILENCE_MIN_DURATION = 0.4
+
+# Granice długości shorta względem target_duration i limit YouTube Shorts
+SEGMENT_MIN_RATIO = 0.75
+SEGMENT_MAX_RATIO = 1.15
+SHORTS_MAX_DURATION = 180
+
+# Ocena fragmentów (highlights): bloki głośności i wagi cech
+HIGHLIGHT_BLOCK_SECONDS = 0.1
+HIGHLIGHT_SILENCE_DB = -90.0
+HIGHLIGHT_WEIGHTS = {'energy': 0.4, 'variance': 0.3, 'motion': 0.3}
+
+_METADATA_FRAME_RE = re.compile(r'pts_time:(-?[\d.]+)')
+_SCENE_SCORE_RE = re.compile(r'lavfi\.scene_score=([\d.]+)')
+_SILENCE_START_RE = re.compile(r'silence_start: (-?[\d.]+)')
+_SILENCE_END_RE = re.compile(r'silence_end: (-?[\d.]+)')
+_RMS_LEVEL_RE = re.compile(r'lavfi\.astats\.Overall\.RMS_level=(-?inf|-?[\d.]+)')
+# Prefiks logu filtra ([Parsed_metadata_4 @ 0x...]) - ramki obrazu i dźwięku się przeplatają
+_FILTER_PREFIX_RE = re.compile(r'^\[(\w+) @ ')
+
+
+def _analysis_size(width, height, analysis_width=ANALYSIS_WIDTH):
+    """Rozmiar klatek analizy z zachowaniem proporcji (parzyste wymiary)"""
+    analysis_height = max(2, int(round(analysis_width * height / width)) // 2 * 2)
+    return analysis_width, analysis_height
+
+
+def read_gray_frames(path, start_time, duration, width, height, fps=SMART_CROP_FPS,
+                     analysis_width=ANALYSIS_WIDTH, timeout=None):
+    """
+    Pobiera klatki fragmentu wideo jako tablicę (klatki, wysokość, szerokość) uint8.
+    
+    Args:
+        path: Ścieżka do pliku wideo
+        start_time, duration: Fragment w sekundach
+        width, height: Wymiary źródła (do zachowania proporcji)
+        fps: Liczba próbkowanych klatek na sekundę
+    """
+    frame_w, frame_h = _analysis_size(width, height, analysis_width)
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-ss', str(start_time),
+        '-i', path,
+        '-t', str(duration),
+        '-an',
+        '-vf', f'fps={fps},scale={frame_w}:{frame_h},format=gray',
+        '-f', 'rawvideo',
+        'pipe:1'
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True, timeout=timeout)
+    
+    frame_size = frame_w * frame_h
+    frame_count = len(result.stdout) // frame_size
+    frames = np.frombuffer(result.stdout[:frame_count * frame_size], dtype=np.uint8)
+    return frames.reshape(frame_count, frame_h, frame_w)
+
+
+def _normalize(values):
+    """Skaluje każdy wiersz do zakresu 0-1"""
+    low = values.min(axis=1, keepdims=True)
+    high = values.max(axis=1, keepdims=True)
+    return (values - low) / np.maximum(high - low, 1e-6)
+
+
+def column_saliency(frames):
+    """
+    Zwraca istotność kolumn (klatki, szerokość): ruch między klatkami
+    plus energia krawędzi, zsumowane w pionie.
+    """
+    frames = frames.astype(np.float32)
+    
+    # Ruch - różnica z poprzednią klatką (pierwsza klatka porównywana z samą sobą)
+    previous = np.concatenate([frames[:1], frames[:-1]])
+    motion = np.abs(frames - previous).sum(axis=1)
+    
+    # Krawędzie - gradient poziomy i pionowy
+    grad_x = np.abs(np.diff(frames, axis=2, prepend=frames[:, :, :1]))
+    grad_y = np.abs(np.diff(frames, axis=1, prepend=frames[:, :1, :]))
+    edges = (grad_x + grad_y).sum(axis=1)
+    
+    return _normalize(motion) + 0.5 * _normalize(edges)
+
+
+def best_window_positions(saliency, window):
+    """Dla każdej klatki lewa krawędź okna o szerokości `window` z największą sumą istotności"""
+    cumulative = np.cumsum(np.pad(saliency, ((0, 0), (1, 0))), axis=1)
+    window_sums = cumulative[:, window:] - cumulative[:, :-window]
+    return window_sums.argmax(axis=1).astype(np.float32)
+
+
+def smooth_path(positions, fps, max_step, smoothing_seconds=2.0):
+    """
+    Wygładza ścieżkę kadru: średnia ruchoma (bez przesunięcia fazy) i
+    ograniczenie prędkości, żeby kadr nie skakał między obiektami.
+    """
+    if len(positions) < 2:
+        return positions
+    
+    radius = max(1, int(smoothing_seconds * fps / 2))
+    padded = np.pad(positions, radius, mode='edge')
+    kernel = np.ones(2 * radius + 1, dtype=np.float32) / (2 * radius + 1)
+    smoothed = np.convolve(padded, kernel, mode='valid')
+    
+    # Ograniczenie prędkości w obu kierunkach czasu
+    for order in (slice(None), slice(None, None, -1)):
+        path = smoothed[order]
+        for i in range(1, len(path)):
+            path[i] = np.clip(path[i], path[i - 1] - max_step, path[i - 1] + max_step)
+    return smoothed
+
+
+def smart_crop_path(path, start_time, duration, width, height, crop_width, timeout=None):
+    """
+    Wyznacza ścieżkę poziomego kadru 9:16 dla fragmentu wideo.
+    
+    Returns:
+        list: Punkty (czas od początku fragmentu, x w pikselach źródła)
+    """
+    frames = read_gray_frames(path, start_time, duration, width, height, timeout=timeout)
+    if len(frames) == 0:
+        return [(0.0, (width - crop_width) // 2)]
+    
+    frame_w = frames.shape[2]
+    scale = width / frame_w
+    window = max(1, min(frame_w, int(round(crop_width / scale))))
+    
+    positions = best_window_positions(column_saliency(frames), window)
+    max_step = SMART_CROP_MAX_SPEED * window / SMART_CROP_FPS
+    positions = smooth_path(positions, SMART_CROP_FPS, max_step)
+    
+    # Punkty co SMART_CROP_KEYPOINT_INTERVAL sekund, w pikselach źródła
+    step = max(1, int(SMART_CROP_KEYPOINT_INTERVAL * SMART_CROP_FPS))
+    max_x = width - crop_width
+    points = []
+    for index in list(range(0, len(positions), step)) + [len(positions) - 1]:
+        x = int(np.clip(round(positions[index] * scale), 0, max_x))
+        t = round(index / SMART_CROP_FPS, 3)
+        if not points or points[-1][0] < t:
+            points.append((t, x))
+    return points
+
+
+def crop_x_expression(points):
+    """
+    Zamienia punkty ścieżki na wyrażenie FFmpeg dla parametru x filtra crop:
+    interpolacja liniowa jako suma odcinków (bez zagnieżdżonych if).
+    """
+    expression = str(points[0][1])
+    for (t0, x0), (t1, x1) in zip(points, points[1:]):
+        if x1 == x0:
+            continue
+        expression += f"+({x1 - x0})*clip((t-{t0})/{t1 - t0:.3f},0,1)"
+    return expression
+
+
+def content_analysis_command(path, has_audio):
+    """
+    Komenda FFmpeg dla jednego przejścia analizy treści: wskaźnik zmiany
+    sceny na klatkach ~160px (metadata=print), a na audio mono 8 kHz
+    silencedetect i poziom RMS bloków 100 ms (astats). Wyniki trafiają
+    do logu (stderr).
+    """
+    filters = [
+        f"[0:v:0]fps={CONTENT_ANALYSIS_FPS},scale={ANALYSIS_WIDTH}:-2,"
+        f"select='gte(scene,0)',metadata=print:key=lavfi.scene_score[v]"
+    ]
+    maps = ['-map', '[v]']
+    if has_audio:
+        filters.append(
+            f"[0:a:0]aresample={CONTENT_ANALYSIS_AUDIO_RATE},aformat=channel_layouts=mono,"
+            f"silencedetect=n={SILENCE_NOISE_LEVEL}:d={SILENCE_MIN_DURATION},"
+            f"asetnsamples=n={int(CONTENT_ANALYSIS_AUDIO_RATE * HIGHLIGHT_BLOCK_SECONDS)},"
+            f"astats=metadata=1:reset=1,ametadata=print:key=lavfi.astats.Overall.RMS_level[a]"
+        )
+        maps += ['-map', '[a]']
+    
+    return [
+        'ffmpeg',
+        '-v', 'info',
+        '-i', path,
+        '-filter_complex', ';'.join(filters),
+    ] + maps + ['-f', 'null', '-']
+
+
+def parse_content_analysis(log, duration):
+    """
+    Parsuje log z content_analysis_command.
+    
+    Returns:
+        dict: scene_cuts [[czas, wynik]], silences [[początek, koniec]],
+              motion (średni wskaźnik zmiany sceny w każdej sekundzie),
+              loudness i loudness_variance (średni poziom bloków 100 ms
+              w dBFS i jego wariancja w każdej sekundzie; tylko z audio)
+    """
+    seconds = max(1, int(np.ceil(duration)))
+    motion_sum = np.zeros(seconds, dtype=np.float64)
+    motion_count = np.zeros(seconds, dtype=np.int64)
+    level_sum = np.zeros(seconds, dtype=np.float64)
+    level_square_sum = np.zeros(seconds, dtype=np.float64)
+    level_count = np.zeros(seconds, dtype=np.int64)
+    scene_cuts = []
+    silences = []
+    
+    # Czas ostatniej ramki każdego filtra metadata/ametadata
+    frame_times = {}
+    silence_start = None
+    for line in log.splitlines():
+        prefix = _FILTER_PREFIX_RE.match(line)
+        source = prefix.group(1) if prefix else None
+        
+        match = _METADATA_FRAME_RE.search(line)
+        if match and 'frame:' in line:
+            frame_times[source] = float(match.group(1))
+            continue
+        frame_time = frame_times.get(source)
+        
+        match = _RMS_LEVEL_RE.search(line)
+        if match and frame_time is not None:
+            level = max(float(match.group(1)), HIGHLIGHT_SILENCE_DB)
+            second = min(seconds - 1, max(0, int(frame_time)))
+            level_sum[second] += level
+            level_square_sum[second] += level * level
+            level_count[second] += 1
+            continue
+        
+        match = _SCENE_SCORE_RE.search(line)
+        if match and frame_time is not None:
+            score = float(match.group(1))
+            second = min(seconds - 1, max(0, int(frame_time)))
+            motion_sum[second] += score
+            motion_count[second] += 1
+            if score >= SCENE_CUT_THRESHOLD:
+                scene_cuts.append([round(frame_time, 3), round(score, 3)])
+            continue
+        
+        match = _SILENCE_START_RE.search(line)
+        if match:
+            silence_start = max(0.0, float(match.group(1)))
+            continue
+        
+        match = _SILENCE_END_RE.search(line)
+        if match and silence_start is not None:
+            silences.append([round(silence_start, 3), round(float(match.group(1)), 3)])
+            silence_start = None
+    
+    # Cisza trwająca do końca pliku nie ma silence_end
+    if silence_start is not None:
+        silences.append([round(silence_start, 3), round(duration, 3)])
+    
+    motion = np.divide(motion_sum, np.maximum(motion_count, 1))
+    analysis = {
+        'scene_cuts': scene_cuts,
+        'silences': silences,
+        'motion': [round(float(value), 4) for value in motion],
+    }
+    
+    if level_count.any():
+        counts = np.maximum(level_count, 1)
+        loudness = np.where(level_count > 0, level_sum / counts, HIGHLIGHT_SILENCE_DB)
+        variance = np.maximum(level_square_sum / counts - (level_sum / counts) ** 2, 0)
+        analysis['loudness'] = [round(float(value), 2) for value in loudness]
+        analysis['loudness_variance'] = [round(float(value), 2) for value in variance]
+    return analysis
+
+
+def _break_candidates(analysis, window_start, window_end):
+    """Kandydaci na punkt cięcia w oknie: (czas, wartość naturalnej przerwy)"""
+    candidates = []
+    for silence_start, silence_end in analysis.get('silences', []):
+        middle = (silence_start + silence_end) / 2
+        if window_start <= middle <= window_end:
+            # Cisza to najlepsze miejsce - nie przecina zdania
+            candidates.append((middle, 1.0 + min(silence_end - silence_start, 2.0) / 2))
+    for cut_time, score in analysis.get('scene_cuts', []):
+        if window_start <= cut_time <= window_end:
+            candidates.append((cut_time, 0.8 * score))
+    return candidates
+
+
+def plan_segment_boundaries(duration, target_duration, analysis=None, max_count=None):
+    """
+    Planuje segmenty o długości zbliżonej do target_duration, kończące się
+    w naturalnych przerwach (cisza, zmiana sceny) z analizy treści.
+    Bez analizy zwraca pełne segmenty o stałej długości target_duration.
+    
+    Returns:
+        list: Pary (start, długość) w sekundach
+    """
+    if not analysis:
+        count = int(duration / target_duration)
+        if max_count is not None:
+            count = min(count, max_count)
+        return [(i * target_duration, target_duration) for i in range(count)]
+    
+    min_length = target_duration * SEGMENT_MIN_RATIO
+    max_length = min(target_duration * SEGMENT_MAX_RATIO, SHORTS_MAX_DURATION)
+    
+    segments = []
+    start = 0.0
+    while start + min_length <= duration:
+        if max_count is not None and len(segments) >= max_count:
+            break
+        
+        ideal_end = start + target_duration
+        end = min(ideal_end, duration)
+        
+        window_end = min(start + max_length, duration)
+        candidates = _break_candidates(analysis, start + min_length, window_end)
+        if candidates:
+            # Wartość przerwy minus kara za odejście od docelowej długości
+            end, _ = max(
+                candidates,
+                key=lambda c: c[1] - 2 * abs(c[0] - ideal_end) / target_duration
+            )
+        
+        # Ostatni segment bez przerwy w oknie - nie krótszy niż min_length
+        if end - start < min_length:
+            break
+        
+        segments.append((round(start, 3), round(end - start, 3)))
+        start = end
+    
+    return segments
+
+
+def _window_means(series, windows):
+    """Średnia serii na sekundę w każdym oknie (start, długość)"""
+    values = np.asarray(series or [0.0], dtype=np.float64)
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    means = []
+    for start, length in windows:
+        first = min(int(start), len(values) - 1)
+        last = max(first + 1, min(int(np.ceil(start + length)), len(values)))
+        means.append((cumulative[last] - cumulative[first]) / (last - first))
+    return np.array(means)
+
+
+def _standardize(values):
+    """Z-score cechy między oknami (stała cecha daje zera)"""
+    spread = values.std()
+    if spread < 1e-9:
+        return np.zeros_like(values)
+    return (values - values.mean()) / spread
+
+
+def score_windows(windows, analysis):
+    """
+    Ocena atrakcyjności okien (start, długość): energia dźwięku, zmienność
+    głośności i ruch w obrazie, standaryzowane między oknami i ważone.
+    """
+    features = {
+        'energy': _window_means(analysis.get('loudness'), windows),
+        'variance': _window_means(analysis.get('loudness_variance'), windows),
+        'motion': _window_means(analysis.get('motion'), windows),
+    }
+    return sum(HIGHLIGHT_WEIGHTS[name] * _standardize(values) for name, values in features.items())
+
+
+def select_highlights(windows, analysis, count):
+    """Wybiera `count` najlepiej ocenionych okien, zachowując kolejność chronologiczną"""
+    if len(windows) <= count:
+        return list(windows)
+    scores = score_windows(windows, analysis)
+    best = np.sort(np.argsort(-scores, kind='stable')[:count])
+    return [windows[index] for index in best]
@@ -3,86 +3,366 @@ Serwis do cięcia wideo na shorty używając FFmpeg
 """
 import subprocess
 import os
-import json
-import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from pathlib import Path
 from django.conf import settings
 from .models import Video, Short
+from . import probe_cache
+from . import encode_cache
+from . import progressive
+from .encoder_profiles import DEFAULT_PROFILE, get_profile_args
+from . import video_analysis
+from .probe_cache import check_ffmpeg_installed
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Dostępne silniki cięcia (VIDEO_PROCESSING_ENGINE)
+PROCESSING_ENGINES = ('segments', 'single_pass')
+SEGMENT_PLANNERS = ('content', 'fixed')
 
-def check_ffmpeg_installed():
-    """Sprawdza czy FFmpeg jest zainstalowany"""
-    ffmpeg_path = shutil.which('ffmpeg')
-    ffprobe_path = shutil.which('ffprobe')
+# Co ile sekund watchdog sprawdza proces FFmpeg i raportuje postęp
+FFMPEG_POLL_INTERVAL = 0.5
+
+# Maksymalna liczba shortów (wejść FFmpeg) na jedno wywołanie generate_thumbnails
+THUMBNAIL_BATCH_SIZE = 50
+
+# Format docelowy YouTube Shorts
+SHORTS_ASPECT_RATIO = 9 / 16
+SHORTS_MAX_HEIGHT = 1920
+
+# Górny limit bitrate wideo (kbps) wg wysokości wyjścia: (min. wysokość, bitrate)
+ENCODE_BITRATE_CEILINGS = (
+    (1920, 8000),
+    (1280, 5000),
+    (960, 3500),
+    (720, 2500),
+    (0, 1500),
+)
+
+
+class FFmpegTimeout(Exception):
+    """FFmpeg przerwany przez watchdog (brak postępu lub przekroczony limit czasu)"""
+
+
+def run_ffmpeg(cmd, media_duration=None, on_progress=None):
+    """
+    Uruchamia FFmpeg pod nadzorem watchdoga.
+    
+    Postęp jest czytany z `-progress pipe:1`. Proces jest zabijany, gdy przez
+    FFMPEG_STALL_TIMEOUT sekund nie przesunie się czas wyjścia albo gdy całość
+    przekroczy FFMPEG_TIMEOUT_BASE + FFMPEG_TIMEOUT_FACTOR * media_duration.
     
-    if not ffmpeg_path or not ffprobe_path:
-        logger.error("FFmpeg or FFprobe not found in PATH")
+    Args:
+        cmd: Komenda FFmpeg (lista, pierwszy element to 'ffmpeg')
+        media_duration: Długość przetwarzanego materiału w sekundach
+        on_progress: Opcjonalny callback(out_time_seconds)
+    
+    Returns:
+        str: stderr FFmpeg
+    
+    Raises:
+        subprocess.CalledProcessError: FFmpeg zakończył się błędem
+        FFmpegTimeout: proces zawiesił się i został zabity
+    """
+    stall_timeout = getattr(settings, 'FFMPEG_STALL_TIMEOUT', 120)
+    deadline = (
+        getattr(settings, 'FFMPEG_TIMEOUT_BASE', 300)
+        + getattr(settings, 'FFMPEG_TIMEOUT_FACTOR', 10) * (media_duration or 0)
+    )
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+    
+    state = {'out_time': 0.0, 'last_progress': time.monotonic()}
+    reported_time = 0.0
+    
+    def read_progress(stream):
+        for line in stream:
+            key, _, value = line.strip().partition('=')
+            # out_time_ms to w rzeczywistości mikrosekundy (jak out_time_us)
+            if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                out_time = int(value) / 1_000_000
+                if out_time > state['out_time']:
+                    state['out_time'] = out_time
+                    state['last_progress'] = time.monotonic()
+            elif key == 'progress':
+                state['last_progress'] = time.monotonic()
+    
+    # stderr do pliku - pełny bufor potoku mógłby zablokować FFmpeg
+    with tempfile.TemporaryFile() as stderr_file:
+        started = time.monotonic()
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True
+        )
+        reader = threading.Thread(target=read_progress, args=(process.stdout,), daemon=True)
+        reader.start()
+        
+        while True:
+            try:
+                process.wait(timeout=FFMPEG_POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                # Callback wywoływany w wątku wywołującym, nie w wątku czytającym
+                if on_progress and state['out_time'] > reported_time:
+                    reported_time = state['out_time']
+                    on_progress(reported_time)
+                
+                now = time.monotonic()
+                if now - state['last_progress'] > stall_timeout:
+                    reason = f"no progress for {stall_timeout}s"
+                elif now - started > deadline:
+                    reason = f"exceeded {deadline:.0f}s deadline"
+                else:
+                    continue
+                process.kill()
+                process.wait()
+                reader.join(timeout=5)
+                logger.error(f"FFmpeg killed by watchdog ({reason}): {' '.join(cmd)}")
+                raise FFmpegTimeout(f"FFmpeg przerwany: {reason}")
+        
+        reader.join(timeout=5)
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors='replace')
+    
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    return stderr
+
+
+class ProgressReporter:
+    """
+    Agreguje postęp kodowania segmentów (w sekundach materiału) i zapisuje
+    go do Video co najwyżej raz na VIDEO_PROGRESS_WRITE_INTERVAL sekund.
+    
+    Postęp można zgłaszać z dowolnego wątku, ale zapis do bazy wykonuje
+    tylko wątek, który utworzył reporter - wątki puli tylko aktualizują stan.
+    """
+    
+    def __init__(self, video, total_seconds, interval=None):
+        self.video = video
+        self.total_seconds = max(total_seconds, 0.001)
+        self.interval = interval or getattr(settings, 'VIDEO_PROGRESS_WRITE_INTERVAL', 2)
+        self._owner = threading.current_thread()
+        self._lock = threading.Lock()
+        self._in_progress = {}
+        self._done_seconds = 0.0
+        self._message = video.processing_message
+        self._last_write = 0.0
+        self._written = None
+    
+    def update(self, key, seconds):
+        """Zgłasza postęp segmentu `key` (sekundy już zakodowane)"""
+        with self._lock:
+            self._in_progress[key] = seconds
+        self.flush()
+    
+    def finish(self, key, seconds):
+        """Oznacza segment `key` jako zakończony (`seconds` jego długości)"""
+        with self._lock:
+            self._in_progress.pop(key, None)
+            self._done_seconds += seconds
+    
+    def set_message(self, message):
+        with self._lock:
+            self._message = message
+    
+    def percent(self):
+        with self._lock:
+            done = self._done_seconds + sum(self._in_progress.values())
+        # 100% ustawia dopiero zakończenie całego przetwarzania
+        return min(99, int(done / self.total_seconds * 100))
+    
+    def flush(self, force=False):
+        """Zapisuje postęp, jeśli minął interwał (lub force) i coś się zmieniło"""
+        if threading.current_thread() is not self._owner:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_write < self.interval:
+            return
+        
+        state = (self.percent(), self._message, self.video.shorts_created)
+        if state == self._written:
+            return
+        
+        self.video.processing_progress, self.video.processing_message, _ = state
+        self.video.save(update_fields=['processing_progress', 'processing_message', 'shorts_created'])
+        self._written = state
+        self._last_write = now
+
+
+def get_processing_workers():
+    """Zwraca liczbę równoległych procesów FFmpeg z ustawień (domyślnie liczba rdzeni)"""
+    workers = getattr(settings, 'VIDEO_PROCESSING_WORKERS', None) or os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def get_processing_engine():
+    """Zwraca silnik cięcia z ustawień: 'segments' (domyślnie) lub 'single_pass'"""
+    engine = getattr(settings, 'VIDEO_PROCESSING_ENGINE', 'segments')
+    if engine not in PROCESSING_ENGINES:
+        logger.warning(f"Unknown VIDEO_PROCESSING_ENGINE '{engine}', falling back to 'segments'")
+        return 'segments'
+    return engine
+
+
+def get_segment_planner():
+    """Zwraca sposób wyznaczania granic shortów z ustawień: 'content' (domyślnie) lub 'fixed'"""
+    planner = getattr(settings, 'VIDEO_SEGMENT_PLANNER', 'content')
+    if planner not in SEGMENT_PLANNERS:
+        logger.warning(f"Unknown VIDEO_SEGMENT_PLANNER '{planner}', falling back to 'fixed'")
+        return 'fixed'
+    return planner
+
+
+def is_shorts_compatible(metadata):
+    """
+    Sprawdza czy źródło można pociąć bez ponownego kodowania obrazu:
+    pionowe 9:16, H.264 yuv420p, nie większe niż 1080x1920, audio AAC lub brak.
+    """
+    width, height = metadata['width'], metadata['height']
+    if not width or not height or width >= height:
+        return False
+    if abs(width / height - SHORTS_ASPECT_RATIO) > 0.01:
+        return False
+    if height > SHORTS_MAX_HEIGHT:
         return False
+    if metadata.get('video_codec') != 'h264' or metadata.get('pix_fmt') not in ('yuv420p', 'yuvj420p'):
+        return False
+    return metadata.get('audio_codec') in ('aac', None)
+
+
+def _even(value):
+    """Zaokrągla w dół do liczby parzystej (wymóg yuv420p)"""
+    return max(2, int(value) // 2 * 2)
+
+
+def plan_encode(metadata, crop_mode='center'):
+    """
+    Planuje kodowanie shortów dla danego źródła.
+    
+    Na podstawie metadanych z get_video_metadata wybiera geometrię kadru 9:16,
+    rozdzielczość wyjściową (bez skalowania w górę ponad wysokość kadru) i
+    górny limit bitrate. Źródła już pionowe nie są kadrowane.
+    
+    Returns:
+        dict: copy_video, copy_audio, crop (w, h, x, y lub None), smart_crop,
+              scale, output_width, output_height, maxrate, bufsize
+    """
+    width, height = metadata['width'], metadata['height']
+    
+    # Geometria kadru 9:16
+    if abs(width / height - SHORTS_ASPECT_RATIO) <= 0.01:
+        crop = None
+        crop_w, crop_h = _even(width), _even(height)
+    elif width / height > SHORTS_ASPECT_RATIO:
+        # Obraz szerszy niż 9:16 - tnij po bokach
+        crop_w, crop_h = _even(height * SHORTS_ASPECT_RATIO), _even(height)
+        crop = (crop_w, crop_h, (width - crop_w) // 2, 0)
+    else:
+        # Obraz węższy niż 9:16 - tnij górę/dół
+        crop_w, crop_h = _even(width), _even(width / SHORTS_ASPECT_RATIO)
+        crop_y = 0 if crop_mode == 'top' else (height - crop_h) // 2
+        crop = (crop_w, crop_h, 0, crop_y)
+    
+    # Nie skaluj w górę - wysokość wyjścia to min(kadr, 1920)
+    output_height = min(crop_h, SHORTS_MAX_HEIGHT)
+    if output_height == crop_h:
+        output_width = crop_w
+    else:
+        output_width = _even(output_height * SHORTS_ASPECT_RATIO)
+    
+    maxrate_kbps = next(
+        rate for min_height, rate in ENCODE_BITRATE_CEILINGS if output_height >= min_height
+    )
+    
+    copy_video = is_shorts_compatible(metadata)
+    
+    return {
+        'copy_video': copy_video,
+        'copy_audio': metadata.get('audio_codec') == 'aac',
+        'crop': crop,
+        # Dynamiczny kadr ma sens tylko przy cięciu po bokach
+        'smart_crop': crop_mode == 'smart' and not copy_video and crop is not None and crop_w < width,
+        'scale': output_height != crop_h,
+        'output_width': output_width,
+        'output_height': output_height,
+        'maxrate': f'{maxrate_kbps}k',
+        'bufsize': f'{maxrate_kbps * 2}k',
+    }
+
+
+def _partial_path(output_path):
+    """Ścieżka tymczasowa, pod którą FFmpeg zapisuje segment (short_1.part.mp4)"""
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}.part{path.suffix}"))
+
+
+def _commit_output(partial_path, output_path):
+    """
+    Checkpoint segmentu: fsync pliku tymczasowego i atomowa zmiana nazwy.
+    Plik pod docelową nazwą istnieje więc tylko jeśli jest kompletny.
+    """
+    with open(partial_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(partial_path, output_path)
     
-    logger.info(f"FFmpeg found at: {ffmpeg_path}")
-    logger.info(f"FFprobe found at: {ffprobe_path}")
-    return True
+    # Utrwal również wpis w katalogu (niedostępne na Windows)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(output_path), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _segments_are_contiguous(segments):
+    """Sprawdza czy segmenty następują bezpośrednio po sobie (bez przerw)"""
+    for previous, current in zip(segments, segments[1:]):
+        if abs(previous['start_time'] + previous['duration'] - current['start_time']) > 0.001:
+            return False
+    return bool(segments)
 
 
 class VideoProcessingService:
     """Serwis do przetwarzania wideo"""
     
-    def __init__(self, video: Video):
+    def __init__(self, video: Video, encode_profile=None, job=None):
         self.video = video
-        self.video_path = video.video_file.path
+        # Zadanie kolejki - przechowuje plan segmentów między próbami
+        self.job = job
+        # Preset i CRF kodowania shortów (encoder_profiles.ENCODE_PROFILES)
+        self.encode_profile = encode_profile or DEFAULT_PROFILE
+        # Upload w toku (przetwarzanie progresywne) - dane czytane z pliku sesji
+        self.upload_session = progressive.active_upload_session(video)
+        if self.upload_session is not None:
+            self.video_path = progressive.readable_path(self.upload_session)
+        else:
+            self.video_path = video.video_file.path
+        # Plik, z którego cięte są shorty (źródło albo plik pośredni)
+        self.source_path = self.video_path
+        # SHA-256 pliku source_path (klucz cache kodowania)
+        self.source_hash = None
+        self.metadata = None
+        self.plan = None
+        self.progress = None
+        # Wynik analizy treści w tym przetwarzaniu (także błąd - bez drugiej próby)
+        self._content_analysis = None
+        self._content_analysis_error = None
         
     def get_video_metadata(self):
-        """Pobiera metadane wideo używając ffprobe"""
-        if not check_ffmpeg_installed():
-            raise Exception("FFmpeg nie jest zainstalowany! Zobacz FFMPEG_INSTALL.md")
-        
-        try:
-            cmd = [
-                'ffprobe',
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format',
-                '-show_streams',
-                self.video_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            metadata = json.loads(result.stdout)
-            
-            # Znajdź stream wideo
-            video_stream = next(
-                (s for s in metadata['streams'] if s['codec_type'] == 'video'),
-                None
-            )
-            
-            if not video_stream:
-                raise Exception("Nie znaleziono streamu wideo")
-            
-            duration = float(metadata['format']['duration'])
-            width = video_stream['width']
-            height = video_stream['height']
-            
-            return {
-                'duration': duration,
-                'width': width,
-                'height': height,
-                'resolution': f"{width}x{height}",
-                'file_size': int(metadata['format']['size'])
-            }
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"FFprobe error: {e.stderr}")
-            raise Exception(f"Błąd analizy wideo: {e.stderr}")
-        except Exception as e:
-            logger.error(f"Metadata extraction error: {str(e)}")
-            raise
+        """Pobiera metadane wideo używając ffprobe (wynik jest cache'owany w MediaProbe)"""
+        return probe_cache.get_metadata(self.video_path)
     
     def update_video_metadata(self):
         """Aktualizuje metadane wideo w bazie danych"""
         metadata = self.get_video_metadata()
+        self.metadata = metadata
         self.video.duration = int(metadata['duration'])
         self.video.resolution = metadata['resolution']
         self.video.file_size = metadata['file_size']
@@ -96,10 +376,8 @@ class VideoProcessingService:
         Args:
             crop_mode: Tryb kadrowania (center, smart, top)
         """
+        # Status 'failed' ustawia kolejka zadań dopiero po wyczerpaniu prób
         if not check_ffmpeg_installed():
-            self.video.status = 'failed'
-            self.video.processing_message = 'FFmpeg nie jest zainstalowany'
-            self.video.save()
             raise Exception("FFmpeg nie jest zainstalowany! Zobacz plik FFMPEG_INSTALL.md w głównym katalogu projektu.")
         
         # Aktualizuj status
@@ -112,15 +390,41 @@ class VideoProcessingService:
             # Pobierz metadane jeśli nie ma
             if not self.video.duration:
                 self.video.processing_message = 'Analiza wideo...'
-                self.video.save()
+                self.video.save(update_fields=['processing_message'])
                 self.update_video_metadata()
             
+            if self.metadata is None:
+                self.metadata = self.get_video_metadata()
+            
+            # Dobierz kadrowanie, rozdzielczość i bitrate do źródła
+            self.plan = plan_encode(self.metadata, crop_mode)
+            if self.plan['copy_video']:
+                logger.info(f"Video {self.video.id} is Shorts-compatible, using stream copy")
+            else:
+                logger.info(
+                    f"Video {self.video.id} encode plan: crop={self.plan['crop']}, "
+                    f"output={self.plan['output_width']}x{self.plan['output_height']}, "
+                    f"maxrate={self.plan['maxrate']}"
+                )
+            
+            # Plik pośredni: kolejne cięcia tego wideo to tylko kopiowanie strumienia
+            self.use_mezzanine(crop_mode)
+            
             duration = self.video.duration
             target_duration = self.video.target_duration
             max_shorts = self.video.max_shorts_count
             
-            # Oblicz liczbę shortów
-            num_shorts = min(int(duration / target_duration), max_shorts)
+            # Wyznacz granice shortów (naturalne przerwy albo stała długość);
+            # ponowienie tnie według planu z pierwszej próby, żeby checkpointy pasowały
+            if self.job is not None and self.job.segment_plan:
+                boundaries = [tuple(segment) for segment in self.job.segment_plan]
+                logger.info(f"Video {self.video.id}: reusing segment plan of job {self.job.id}")
+            else:
+                boundaries = self.plan_segments(duration, target_duration, max_shorts)
+                if self.job is not None:
+                    self.job.segment_plan = [list(segment) for segment in boundaries]
+                    self.job.save(update_fields=['segment_plan', 'updated_at'])
+            num_shorts = len(boundaries)
             
             if num_shorts == 0:
                 raise Exception("Wideo jest zbyt krótkie do pocięcia")
@@ -128,58 +432,73 @@ class VideoProcessingService:
             # Ustaw całkowitą liczbę shortów
             self.video.shorts_total = num_shorts
             self.video.processing_message = f'Tworzenie {num_shorts} shortów...'
-            self.video.save()
+            self.video.save(update_fields=['shorts_total', 'processing_message'])
             
             # Utwórz folder na shorty
             shorts_dir = Path(settings.MEDIA_ROOT) / 'shorts' / str(self.video.id)
             shorts_dir.mkdir(parents=True, exist_ok=True)
             
-            # Generuj shorty
-            shorts_created = []
-            for i in range(num_shorts):
-                start_time = i * target_duration
-                
-                # Nie przekraczaj długości wideo
-                if start_time + target_duration > duration:
-                    actual_duration = duration - start_time
-                else:
-                    actual_duration = target_duration
-                
-                # Nazwa pliku wyjściowego
+            # Zaplanuj segmenty
+            segments = []
+            for i, (start_time, segment_duration) in enumerate(boundaries):
                 output_filename = f"short_{i+1}.mp4"
-                output_path = shorts_dir / output_filename
-                
-                # Aktualizuj progress
-                self.video.processing_message = f'Tworzenie shorta {i+1}/{num_shorts}...'
-                self.video.processing_progress = int((i / num_shorts) * 100)
-                self.video.save()
-                
-                # Wywołaj FFmpeg
-                success = self._create_short_segment(
-                    start_time=start_time,
-                    duration=actual_duration,
-                    output_path=str(output_path),
-                    crop_mode=crop_mode
-                )
+                segments.append({
+                    'order': i + 1,
+                    'start_time': start_time,
+                    'duration': segment_duration,
+                    'output_filename': output_filename,
+                    'output_path': str(shorts_dir / output_filename),
+                })
+            
+            # Przy kopiowaniu strumienia cięcia wypadają na klatkach kluczowych
+            if self.plan['copy_video']:
+                segments = self._align_segments_to_keyframes(segments)
+            
+            # Wznowienie: segmenty z gotowym plikiem (checkpoint) nie są kodowane ponownie
+            existing_shorts = {short.order: short for short in self.video.shorts.all()}
+            self._discard_stale_checkpoints(segments, existing_shorts)
+            finished = [s for s in segments if os.path.exists(s['output_path'])]
+            pending = [s for s in segments if not os.path.exists(s['output_path'])]
+            if finished:
+                logger.info(f"Resuming video {self.video.id}: {len(finished)}/{num_shorts} segments already done")
+            
+            def results():
+                for segment in finished:
+                    yield segment, True
+                if pending:
+                    yield from self._encode_segments(pending, crop_mode)
+            
+            # Postęp liczony w sekundach materiału, zapisywany z ograniczoną częstotliwością
+            self.progress = ProgressReporter(self.video, sum(s['duration'] for s in segments))
+            
+            # Generuj shorty (wyniki przychodzą w kolejności segmentów)
+            shorts_created = []
+            for segment, success in results():
+                i = segment['order'] - 1
+                self.progress.finish(segment['order'], segment['duration'])
                 
                 if success:
-                    # Utwórz Short w bazie
-                    short = Short.objects.create(
-                        video=self.video,
-                        title=f"{self.video.title} - Część {i+1}",
-                        description=self.video.description,
-                        short_file=f'shorts/{self.video.id}/{output_filename}',
-                        start_time=start_time,
-                        duration=int(actual_duration),
-                        order=i+1
-                    )
+                    # Utwórz Short w bazie (przy wznowieniu może już istnieć)
+                    short = existing_shorts.get(i + 1)
+                    if short is None:
+                        short = Short.objects.create(
+                            video=self.video,
+                            title=f"{self.video.title} - Część {i+1}",
+                            description=self.video.description,
+                            short_file=f'shorts/{self.video.id}/{segment["output_filename"]}',
+                            start_time=segment['start_time'],
+                            duration=int(segment['duration']),
+                            order=i+1
+                        )
+                        logger.info(f"Created short {i+1}/{num_shorts}")
                     shorts_created.append(short)
                     
                     # Aktualizuj licznik utworzonych
-                    self.video.shorts_created = i + 1
-                    self.video.save()
-                    
-                    logger.info(f"Created short {i+1}/{num_shorts}")
+                    self.video.shorts_created = len(shorts_created)
+                
+                # Aktualizuj progress
+                self.progress.set_message(f'Utworzono shorta {i+1}/{num_shorts}...')
+                self.progress.flush()
             
             # Aktualizuj status - zakończono
             self.video.status = 'completed'
@@ -191,12 +510,527 @@ class VideoProcessingService:
             
         except Exception as e:
             logger.error(f"Error cutting video: {str(e)}")
-            self.video.status = 'failed'
-            self.video.processing_message = f'Błąd: {str(e)}'
-            self.video.save()
             raise
     
-    def _create_short_segment(self, start_time, duration, output_path, crop_mode='center'):
+    def _discard_stale_checkpoints(self, segments, existing_shorts):
+        """
+        Usuwa checkpointy i shorty z innego planu segmentów (np. stałe
+        segmenty po nieudanej analizie treści), żeby nie zostały użyte
+        ponownie z niewłaściwym start_time/duration.
+        """
+        for segment in segments:
+            short = existing_shorts.get(segment['order'])
+            if short is None:
+                continue
+            if (abs(short.start_time - segment['start_time']) <= 0.001
+                    and short.duration == int(segment['duration'])):
+                continue
+            logger.warning(
+                f"Video {self.video.id}: short {segment['order']} was cut at {short.start_time}s "
+                f"for {short.duration}s, plan says {segment['start_time']}s, discarding checkpoint"
+            )
+            for field in (short.short_file, short.thumbnail):
+                if field and os.path.exists(field.path):
+                    os.remove(field.path)
+            if os.path.exists(segment['output_path']):
+                os.remove(segment['output_path'])
+            short.delete()
+            del existing_shorts[segment['order']]
+    
+    def ensure_mezzanine(self, crop_mode='center'):
+        """
+        Zwraca ścieżkę pliku pośredniego: źródło przycięte i przeskalowane
+        do 9:16, z klatką kluczową co VIDEO_MEZZANINE_GOP sekund. Kodowany
+        raz na wideo i tryb kadrowania; zmiana długości lub liczby shortów
+        nie wymaga ponownego kodowania.
+        
+        Returns:
+            str lub None: None gdy plik pośredni nie ma zastosowania
+        """
+        if not getattr(settings, 'VIDEO_MEZZANINE_ENABLED', False) or self.upload_session is not None:
+            return None
+        # Tryb smart kadruje każdy fragment osobno, źródła 9:16 już są kopiowane
+        if self.plan['smart_crop'] or self.plan['copy_video']:
+            return None
+        
+        if self.video.mezzanine_file and self.video.mezzanine_crop_mode == crop_mode:
+            if os.path.exists(self.video.mezzanine_file.path):
+                return self.video.mezzanine_file.path
+        
+        # Ten sam plik źródłowy mógł już zostać przygotowany dla innego wideo
+        if self.video.source_sha256:
+            duplicates = Video.objects.filter(
+                source_sha256=self.video.source_sha256,
+                mezzanine_crop_mode=crop_mode
+            ).exclude(pk=self.video.pk).exclude(mezzanine_file='')
+            for duplicate in duplicates:
+                if os.path.exists(duplicate.mezzanine_file.path):
+                    self.video.mezzanine_file = duplicate.mezzanine_file.name
+                    self.video.mezzanine_crop_mode = crop_mode
+                    self.video.save(update_fields=['mezzanine_file', 'mezzanine_crop_mode'])
+                    logger.info(f"Video {self.video.id} reuses mezzanine of video {duplicate.id}")
+                    return duplicate.mezzanine_file.path
+        
+        mezzanine_name = f'mezzanine/{self.video.id}/mezzanine_{crop_mode}.mp4'
+        output_path = Path(settings.MEDIA_ROOT) / mezzanine_name
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.video.processing_message = 'Przygotowanie pliku pośredniego...'
+        self.video.save(update_fields=['processing_message'])
+        
+        gop = getattr(settings, 'VIDEO_MEZZANINE_GOP', 1)
+        cmd = [
+            'ffmpeg',
+            '-y',
+            '-i', self.video_path,
+            '-map', '0:v:0',
+            '-map', '0:a:0?',
+            '-vf', self._build_video_filter(),
+            '-c:v', 'libx264',
+            '-preset', 'medium',
+            # Wyższa jakość niż shorty - plik pośredni nie jest kodowany ponownie
+            '-crf', '18',
+            '-pix_fmt', 'yuv420p',
+            '-force_key_frames', f'expr:gte(t,n_forced*{gop})',
+        ]
+        if self.plan['copy_audio']:
+            cmd += ['-c:a', 'copy']
+        else:
+            cmd += ['-c:a', 'aac', '-b:a', '192k']
+        partial_path = _partial_path(str(output_path))
+        cmd += ['-movflags', '+faststart', partial_path]
+        
+        run_ffmpeg(cmd, media_duration=self.metadata['duration'])
+        _commit_output(partial_path, str(output_path))
+        
+        self.video.mezzanine_file = mezzanine_name
+        self.video.mezzanine_crop_mode = crop_mode
+        self.video.save(update_fields=['mezzanine_file', 'mezzanine_crop_mode'])
+        logger.info(f"Created mezzanine for video {self.video.id} ({crop_mode})")
+        return str(output_path)
+    
+    def use_mezzanine(self, crop_mode='center'):
+        """
+        Przełącza cięcie na plik pośredni (jeśli włączony). Plik jest zgodny
+        z Shorts, więc plan kodowania sprowadza się do kopiowania strumienia.
+        Przy błędzie cięcie odbywa się ze źródła.
+        """
+        try:
+            mezzanine_path = self.ensure_mezzanine(crop_mode)
+        except Exception as e:
+            logger.error(f"Mezzanine encode failed, cutting from source: {getattr(e, 'stderr', None) or str(e)}")
+            return False
+        if mezzanine_path is None:
+            return False
+        
+        self.source_path = mezzanine_path
+        self.source_hash = None
+        self.plan = plan_encode(probe_cache.get_metadata(mezzanine_path), crop_mode)
+        return True
+    
+    def analyze_content(self):
+        """
+        Analiza treści do planowania granic i oceny shortów: zmiany scen,
+        cisza i głośność w jednym przejściu FFmpeg. Wynik jest zapisywany
+        w MediaProbe, więc ponowne planowanie (np. z inną długością shorta)
+        nie dekoduje pliku.
+        """
+        has_audio = bool(self.metadata.get('audio_codec'))
+        analysis = probe_cache.get_analysis(self.video_path) or {}
+        if 'scene_cuts' in analysis and ('loudness' in analysis or not has_audio):
+            return analysis
+        
+        cmd = video_analysis.content_analysis_command(self.video_path, has_audio=has_audio)
+        log = run_ffmpeg(cmd, media_duration=self.metadata['duration'])
+        content = video_analysis.parse_content_analysis(log, self.metadata['duration'])
+        logger.info(
+            f"Content analysis for video {self.video.id}: {len(content['scene_cuts'])} scene cuts, "
+            f"{len(content['silences'])} silences"
+        )
+        return probe_cache.save_analysis(self.video_path, content)
+    
+    def content_analysis(self):
+        """
+        analyze_content najwyżej raz na przetwarzanie: planowanie granic
+        i wybór fragmentów korzystają z tego samego wyniku, a błąd analizy
+        jest zgłaszany ponownie bez kolejnego dekodowania pliku.
+        """
+        if self._content_analysis_error is not None:
+            raise self._content_analysis_error
+        if self._content_analysis is None:
+            try:
+                self._content_analysis = self.analyze_content()
+            except Exception as e:
+                self._content_analysis_error = e
+                raise
+        return self._content_analysis
+    
+    def plan_segments(self, duration, target_duration, max_count):
+        """
+        Zwraca listę (start, długość) segmentów. W trybie 'content' shorty
+        kończą się w ciszy lub na zmianie sceny; przy błędzie analizy
+        wraca do segmentów o stałej długości.
+        
+        Jeśli segmentów jest więcej niż max_count, kodowane są tylko
+        najlepiej ocenione (głośność, jej zmienność i ruch), a nie pierwsze.
+        """
+        if self.upload_session is not None:
+            # Analiza treści wymaga całego pliku - w trakcie uploadu stałe segmenty
+            return video_analysis.plan_segment_boundaries(duration, target_duration, None, max_count)
+        
+        analysis = None
+        if get_segment_planner() == 'content':
+            self.video.processing_message = 'Analiza scen i dźwięku...'
+            self.video.save(update_fields=['processing_message'])
+            try:
+                analysis = self.content_analysis()
+            except Exception as e:
+                logger.error(f"Content analysis failed, using fixed segments: {str(e)}")
+        
+        segments = video_analysis.plan_segment_boundaries(
+            self.metadata['duration'] if analysis else duration,
+            target_duration,
+            analysis
+        )
+        if len(segments) <= max_count:
+            return segments
+        
+        self.video.processing_message = 'Wybieranie najlepszych fragmentów...'
+        self.video.save(update_fields=['processing_message'])
+        try:
+            analysis = self.content_analysis()
+        except Exception as e:
+            logger.error(f"Highlight analysis failed, keeping first {max_count} segments: {str(e)}")
+            return segments[:max_count]
+        
+        selected = video_analysis.select_highlights(segments, analysis, max_count)
+        logger.info(
+            f"Video {self.video.id}: selected {len(selected)}/{len(segments)} segments "
+            f"starting at {[start for start, _ in selected]}"
+        )
+        return selected
+    
+    def _align_segments_to_keyframes(self, segments):
+        """
+        Przesuwa początki segmentów na klatki kluczowe (z indeksu w cache),
+        tak żeby start_time shorta odpowiadał faktycznemu miejscu cięcia.
+        """
+        keyframes = probe_cache.get_keyframes(self.source_path)
+        if not keyframes:
+            return segments
+        
+        aligned_starts = [
+            probe_cache.keyframe_at_or_before(keyframes, segment['start_time'])
+            for segment in segments
+        ]
+        for index, segment in enumerate(segments):
+            end = segment['start_time'] + segment['duration']
+            next_segment = segments[index + 1] if index + 1 < len(segments) else None
+            if next_segment and abs(next_segment['start_time'] - end) <= 0.001:
+                # Segmenty styczne - koniec to początek następnego
+                end = aligned_starts[index + 1]
+            segment['start_time'] = aligned_starts[index]
+            segment['duration'] = end - aligned_starts[index]
+        return segments
+    
+    def _smart_crop_x(self, start_time, duration):
+        """
+        Wyznacza dynamiczną pozycję kadru dla trybu 'smart' (wyrażenie FFmpeg).
+        Przy błędzie analizy wraca do kadru centralnego (None).
+        """
+        crop_w = self.plan['crop'][0]
+        try:
+            points = video_analysis.smart_crop_path(
+                self.video_path,
+                start_time,
+                duration,
+                self.metadata['width'],
+                self.metadata['height'],
+                crop_w,
+                timeout=getattr(settings, 'FFMPEG_TIMEOUT_BASE', 300)
+            )
+            return video_analysis.crop_x_expression(points)
+        except Exception as e:
+            logger.error(f"Smart crop analysis failed, using center crop: {str(e)}")
+            return None
+    
+    def _build_video_filter(self, crop_x=None):
+        """
+        Zwraca filtr FFmpeg kadrujący do 9:16 i skalujący według planu.
+        
+        Args:
+            crop_x: Opcjonalne wyrażenie pozycji x kadru (tryb smart)
+        """
+        filters = []
+        if self.plan['crop']:
+            crop_w, crop_h, default_x, crop_y = self.plan['crop']
+            # Wyrażenie w apostrofach - przecinki nie rozdzielają wtedy filtrów
+            crop_x = f"'{crop_x}'" if crop_x else default_x
+            filters.append(f"crop={crop_w}:{crop_h}:{crop_x}:{crop_y}")
+        if self.plan['scale']:
+            filters.append(f"scale={self.plan['output_width']}:{self.plan['output_height']}")
+        # Pusty graf nie jest dozwolony - null przepuszcza klatki bez zmian
+        return ','.join(filters) or 'null'
+    
+    def _codec_args(self, crop_mode='center', crop_x=None):
+        """
+        Zwraca argumenty FFmpeg dla wideo i audio według planu kodowania.
+        
+        Źródła zgodne z Shorts (pion 9:16, H.264) są kopiowane bez kodowania -
+        cięcie wypada wtedy na klatkach kluczowych. Audio AAC jest kopiowane
+        zawsze, pozostałe kodeki audio są kodowane do AAC.
+        """
+        if self.plan is None:
+            self.plan = plan_encode(self.metadata or self.get_video_metadata(), crop_mode)
+        
+        if self.plan['copy_video']:
+            args = ['-c:v', 'copy']
+        else:
+            preset, crf = get_profile_args(self.encode_profile)
+            args = [
+                '-vf', self._build_video_filter(crop_x),  # Crop i scale do 9:16
+                '-c:v', 'libx264',  # Video codec
+                '-preset', preset,  # Encoding preset (profil dobrany do kolejki)
+                '-crf', str(crf),  # Quality
+                '-maxrate', self.plan['maxrate'],  # Górny limit bitrate dla rozdzielczości
+                '-bufsize', self.plan['bufsize'],
+            ]
+        
+        if self.plan['copy_audio']:
+            args += ['-c:a', 'copy']
+        else:
+            args += [
+                '-c:a', 'aac',  # Audio codec
+                '-b:a', '128k',  # Audio bitrate
+            ]
+        
+        if self.plan['copy_video'] or self.plan['copy_audio']:
+            # Kopiowane pakiety zaczynają się przed punktem cięcia
+            args += ['-avoid_negative_ts', 'make_zero']
+        return args
+    
+    def _segment_progress_callback(self, key):
+        """Callback dla run_ffmpeg zgłaszający postęp segmentu do reportera"""
+        if self.progress is None:
+            return None
+        return lambda seconds: self.progress.update(key, seconds)
+    
+    def _encode_segments(self, segments, crop_mode):
+        """
+        Koduje segmenty silnikiem wybranym w VIDEO_PROCESSING_ENGINE.
+        
+        'segments' - osobny FFmpeg na segment, równolegle na ograniczonej
+        puli wątków, jeśli VIDEO_PROCESSING_WORKERS > 1.
+        'single_pass' - jedno dekodowanie źródła i muxer segmentów.
+        
+        Zwraca pary (segment, success) zawsze w kolejności segmentów,
+        niezależnie od kolejności kończenia FFmpeg.
+        """
+        if self.upload_session is not None:
+            yield from self._encode_segments_progressive(segments, crop_mode)
+            return
+        
+        self._prepare_encode_cache()
+        
+        # Ścieżka kadru smart liczona jest per segment - wymaga osobnych procesów
+        if get_processing_engine() == 'single_pass' and not self.plan['smart_crop']:
+            # Segmenty z cache nie wchodzą do wspólnego przejścia
+            remaining = []
+            for segment in segments:
+                key = self._encode_cache_key(segment['start_time'], segment['duration'], crop_mode, 'single_pass')
+                if key and encode_cache.fetch(key, segment['output_path']):
+                    yield segment, True
+                else:
+                    remaining.append(segment)
+            if not remaining:
+                return
+            segments = remaining
+            if _segments_are_contiguous(segments):
+                yield from self._encode_segments_single_pass(segments, crop_mode)
+                return
+        
+        workers = min(get_processing_workers(), len(segments))
+        
+        if workers <= 1:
+            for segment in segments:
+                self.progress.set_message(f'Tworzenie shorta {segment["order"]}/{self.video.shorts_total}...')
+                self.progress.flush(force=True)
+                success = self._create_short_segment(
+                    start_time=segment['start_time'],
+                    duration=segment['duration'],
+                    output_path=segment['output_path'],
+                    crop_mode=crop_mode,
+                    on_progress=self._segment_progress_callback(segment['order'])
+                )
+                yield segment, success
+            return
+        
+        # Każdy proces FFmpeg dostaje swoją część rdzeni, żeby nie przeciążać CPU
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        
+        self.progress.set_message(f'Tworzenie {len(segments)} shortów ({workers} równolegle)...')
+        self.progress.flush(force=True)
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'ffmpeg-{self.video.id}') as executor:
+            futures = [
+                executor.submit(
+                    self._create_short_segment,
+                    start_time=segment['start_time'],
+                    duration=segment['duration'],
+                    output_path=segment['output_path'],
+                    crop_mode=crop_mode,
+                    threads=threads,
+                    on_progress=self._segment_progress_callback(segment['order'])
+                )
+                for segment in segments
+            ]
+            try:
+                for segment, future in zip(segments, futures):
+                    # Czekając na segment, zapisuj postęp zgłaszany przez wątki puli
+                    while True:
+                        try:
+                            success = future.result(timeout=self.progress.interval)
+                            break
+                        except FuturesTimeout:
+                            self.progress.flush()
+                    yield segment, success
+            finally:
+                # Przy błędzie nie uruchamiaj kolejnych segmentów
+                for future in futures:
+                    future.cancel()
+    
+    def _encode_segments_single_pass(self, segments, crop_mode):
+        """
+        Tworzy wszystkie segmenty jednym procesem FFmpeg.
+        
+        Źródło jest demuksowane i dekodowane raz, graf filtrów crop/scale
+        budowany raz, a muxer segmentów dzieli zakodowany strumień na pliki
+        short_N.mp4. Klatki kluczowe są wymuszane na granicach segmentów,
+        więc cięcia wypadają dokładnie w zaplanowanych miejscach.
+        """
+        first_start = segments[0]['start_time']
+        total_duration = sum(segment['duration'] for segment in segments)
+        
+        # Granice segmentów liczone od początku wyjścia (po -ss)
+        boundaries = []
+        elapsed = 0
+        for segment in segments[:-1]:
+            elapsed += segment['duration']
+            boundaries.append(f"{elapsed:.3f}")
+        
+        output_dir = Path(segments[0]['output_path']).parent
+        first_order = segments[0]['order']
+        
+        self.progress.set_message(f'Tworzenie {len(segments)} shortów (jedno przejście)...')
+        self.progress.flush(force=True)
+        
+        cmd = [
+            'ffmpeg',
+            '-y',
+            '-ss', str(first_start),
+            '-i', self.source_path,
+            '-t', str(total_duration),
+        ]
+        cmd += self._codec_args(crop_mode)
+        if boundaries:
+            if not self.plan['copy_video']:
+                cmd += ['-force_key_frames', ','.join(boundaries)]
+            cmd += ['-segment_times', ','.join(boundaries)]
+        else:
+            # Jeden segment - muxer segmentów i tak wymaga -segment_time
+            cmd += ['-segment_time', str(total_duration + 1)]
+        cmd += [
+            '-f', 'segment',
+            '-reset_timestamps', '1',
+            '-segment_start_number', str(first_order),
+            '-segment_format', 'mp4',
+            '-segment_format_options', 'movflags=+faststart',
+            str(output_dir / 'short_%d.part.mp4'),
+        ]
+        
+        try:
+            run_ffmpeg(
+                cmd,
+                media_duration=total_duration,
+                on_progress=self._segment_progress_callback('single_pass')
+            )
+            completed = True
+        except subprocess.CalledProcessError as e:
+            logger.error(f"FFmpeg single-pass error: {e.stderr}")
+            completed = False
+        except FFmpegTimeout as e:
+            logger.error(f"FFmpeg single-pass error: {str(e)}")
+            completed = False
+        self.progress.finish('single_pass', 0)
+        
+        for segment in segments:
+            partial_path = _partial_path(segment['output_path'])
+            if completed and os.path.exists(partial_path):
+                _commit_output(partial_path, segment['output_path'])
+                key = self._encode_cache_key(segment['start_time'], segment['duration'], crop_mode, 'single_pass')
+                if key:
+                    encode_cache.store(key, segment['output_path'])
+            yield segment, os.path.exists(segment['output_path'])
+    
+    def _encode_segments_progressive(self, segments, crop_mode):
+        """
+        Koduje segmenty w trakcie uploadu: każdy dopiero wtedy, gdy trwale
+        zapisane bajty sesji obejmują wszystkie jego pakiety (według mapy
+        pakietów z indeksu MP4). Kolejność segmentów = kolejność danych.
+        """
+        session = self.upload_session
+        packets = progressive.packet_byte_map(self.video_path)
+        
+        for segment in segments:
+            needed = progressive.bytes_needed(packets, segment['start_time'] + segment['duration'])
+            session.refresh_from_db(fields=['offset', 'status'])
+            if session.status != 'completed' and session.offset < needed:
+                self.progress.set_message(f'Czekanie na dane shorta {segment["order"]} (upload w toku)...')
+                self.progress.flush(force=True)
+                progressive.wait_for_bytes(session, needed, on_wait=lambda offset: self.progress.flush())
+            
+            self.progress.set_message(f'Tworzenie shorta {segment["order"]}/{self.video.shorts_total}...')
+            self.progress.flush(force=True)
+            
+            for attempt in range(2):
+                # Po zatwierdzeniu uploadu plik `.part` jest przenoszony pod docelową nazwę
+                self.source_path = self.video_path = progressive.readable_path(session)
+                success = self._create_short_segment(
+                    start_time=segment['start_time'],
+                    duration=segment['duration'],
+                    output_path=segment['output_path'],
+                    crop_mode=crop_mode,
+                    on_progress=self._segment_progress_callback(segment['order'])
+                )
+                session.refresh_from_db(fields=['offset', 'status'])
+                if success or progressive.readable_path(session) == self.source_path:
+                    break
+            yield segment, success
+    
+    def _prepare_encode_cache(self):
+        """Liczy hash pliku źródłowego raz, przed rozesłaniem segmentów do wątków"""
+        # Hash niekompletnego pliku nie identyfikuje źródła
+        if not encode_cache.is_enabled() or self.source_hash or self.upload_session is not None:
+            return
+        # Skrót policzony przy uploadzie - bez ponownego czytania źródła
+        if self.source_path == self.video_path and self.video.source_sha256:
+            self.source_hash = self.video.source_sha256
+            return
+        try:
+            self.source_hash = probe_cache.get_content_hash(self.source_path)
+        except OSError as e:
+            logger.warning(f"Cannot hash source for encode cache: {str(e)}")
+    
+    def _encode_cache_key(self, start_time, duration, crop_mode, engine='segments'):
+        """Klucz cache kodowania segmentu (None gdy cache jest wyłączony)"""
+        if not encode_cache.is_enabled() or not self.source_hash:
+            return None
+        # Profil bez ścieżki kadru smart - wynika ona deterministycznie ze źródła i fragmentu
+        profile = [engine] + self._codec_args(crop_mode)
+        return encode_cache.make_key(self.source_hash, start_time, duration, crop_mode, profile)
+    
+    def _create_short_segment(self, start_time, duration, output_path, crop_mode='center', threads=None,
+                              on_progress=None):
         """
         Tworzy pojedynczy segment shorta z kadr
 
@@ -207,42 +1041,38 @@ owaniem do 9:16
             duration: Długość segmentu w sekundach
             output_path: Ścieżka do pliku wyjściowego
             crop_mode: Tryb kadrowania
+            threads: Limit wątków FFmpeg (None = automatycznie)
+            on_progress: Opcjonalny callback(sekundy) z postępem kodowania
         """
         try:
-            # Filtry do kadrowania 9:16
-            if crop_mode == 'center':
-                # Wykadruj na środek
-                crop_filter = "crop=ih*9/16:ih:x=(iw-oh)/2:y=0"
-            elif crop_mode == 'top':
-                # Wykadruj górę
-                crop_filter = "crop=ih*9/16:ih:x=(iw-oh)/2:y=0"
-            else:  # smart - można rozbudować o wykrywanie twarzy
-                crop_filter = "crop=ih*9/16:ih:x=(iw-oh)/2:y=0"
+            # Ten sam fragment tego samego materiału był już kodowany
+            cache_key = self._encode_cache_key(start_time, duration, crop_mode)
+            if cache_key and encode_cache.fetch(cache_key, output_path):
+                return True
             
             # Komenda FFmpeg
             cmd = [
                 'ffmpeg',
                 '-y',  # Nadpisz plik wyjściowy
                 '-ss', str(start_time),  # Start time
-                '-i', self.video_path,  # Input file
+                '-i', self.source_path,  # Input file
                 '-t', str(duration),  # Duration
-                '-vf', f"{crop_filter},scale=-2:1920",  # Crop i scale do 1080x1920
-                '-c:v', 'libx264',  # Video codec
-                '-preset', 'medium',  # Encoding preset
-                '-crf', '23',  # Quality
-                '-c:a', 'aac',  # Audio codec
-                '-b:a', '128k',  # Audio bitrate
-                '-movflags', '+faststart',  # Optimize for streaming
-                output_path
             ]
+            crop_x = self._smart_crop_x(start_time, duration) if self.plan['smart_crop'] else None
+            cmd += self._codec_args(crop_mode, crop_x=crop_x)
+            cmd += ['-movflags', '+faststart']  # Optimize for streaming
+            if threads:
+                cmd += ['-threads', str(threads)]
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            # Zapis do pliku tymczasowego - gotowy plik pojawia się atomowo
+            partial_path = _partial_path(output_path)
+            cmd.append(partial_path)
+            
+            run_ffmpeg(cmd, media_duration=duration, on_progress=on_progress)
             
+            _commit_output(partial_path, output_path)
+            if cache_key:
+                encode_cache.store(cache_key, output_path)
             return os.path.exists(output_path)
             
         except subprocess.CalledProcessError as e:
@@ -252,61 +1082,122 @@ owaniem do 9:16
             logger.error(f"Error creating short segment: {str(e)}")
             return False
     
-    def generate_thumbnail(self, short: Short, time_offset=1):
-        """Generuje miniaturkę dla shorta"""
-        try:
-            thumbnail_dir = Path(settings.MEDIA_ROOT) / 'thumbnails' / str(self.video.id)
-            thumbnail_dir.mkdir(parents=True, exist_ok=True)
-            
+    def generate_thumbnails(self, shorts, time_offset=1):
+        """
+        Generuje miniatury wielu shortów jednym wywołaniem FFmpeg.
+        
+        Klatki są pobierane z już zakodowanych shortów (mały plik, gotowy kadr
+        9:16), każdy jako osobne wejście z szybkim -ss, a pole thumbnail jest
+        aktualizowane jednym bulk_update.
+        
+        Returns:
+            int: Liczba shortów z miniaturą
+        """
+        thumbnail_dir = Path(settings.MEDIA_ROOT) / 'thumbnails' / str(self.video.id)
+        thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        
+        to_update = []
+        pending = []
+        for short in shorts:
             thumbnail_filename = f"thumb_{short.order}.jpg"
             thumbnail_path = thumbnail_dir / thumbnail_filename
+            thumbnail_name = f'thumbnails/{self.video.id}/{thumbnail_filename}'
             
-            # Wygeneruj miniaturkę z FFmpeg
-            cmd = [
-                'ffmpeg',
-                '-y',
-                '-ss', str(short.start_time + time_offset),
-                '-i', self.video_path,
-                '-vframes', '1',
-                '-vf', 'scale=-2:1920',
-                str(thumbnail_path)
-            ]
+            # Wznowienie: miniatura już istnieje
+            if thumbnail_path.exists():
+                if short.thumbnail.name != thumbnail_name:
+                    short.thumbnail = thumbnail_name
+                    to_update.append(short)
+                continue
             
-            subprocess.run(cmd, capture_output=True, check=True)
+            if not short.short_file or not os.path.exists(short.short_file.path):
+                logger.warning(f"Short {short.id} has no file, skipping thumbnail")
+                continue
+            pending.append((short, str(thumbnail_path), thumbnail_name))
+        
+        for batch_start in range(0, len(pending), THUMBNAIL_BATCH_SIZE):
+            batch = pending[batch_start:batch_start + THUMBNAIL_BATCH_SIZE]
             
-            # Aktualizuj short
-            short.thumbnail = f'thumbnails/{self.video.id}/{thumbnail_filename}'
-            short.save()
+            cmd = ['ffmpeg', '-y']
+            for short, _, _ in batch:
+                # Nie wychodź poza krótkie shorty
+                offset = min(time_offset, short.duration / 2)
+                cmd += ['-ss', f"{offset:.3f}", '-i', short.short_file.path]
+            for index, (_, thumbnail_path, _) in enumerate(batch):
+                cmd += [
+                    '-map', f'{index}:v:0',
+                    '-frames:v', '1',
+                    '-update', '1',
+                    _partial_path(thumbnail_path),
+                ]
             
-            return True
+            try:
+                run_ffmpeg(cmd)
+            except (subprocess.CalledProcessError, FFmpegTimeout) as e:
+                logger.error(f"Error generating thumbnails: {getattr(e, 'stderr', None) or str(e)}")
             
-        except Exception as e:
-            logger.error(f"Error generating thumbnail: {str(e)}")
-            return False
+            for short, thumbnail_path, thumbnail_name in batch:
+                partial_path = _partial_path(thumbnail_path)
+                if os.path.exists(partial_path):
+                    os.replace(partial_path, thumbnail_path)
+                    short.thumbnail = thumbnail_name
+                    to_update.append(short)
+        
+        if to_update:
+            Short.objects.bulk_update(to_update, ['thumbnail'])
+        
+        return sum(1 for short in shorts if short.thumbnail)
 
 
-def process_video_async(video_id, crop_mode='center'):
+def find_duplicate_source(sha256):
     """
-    Funkcja do asynchronicznego przetwarzania wideo
-    Używana w tle (threading/celery)
+    Zwraca wideo z tym samym plikiem źródłowym (po SHA-256), którego plik
+    nadal istnieje - nowy upload może współdzielić jego plik oraz cache
+    ffprobe, analizy i kodowania.
     """
-    try:
-        video = Video.objects.get(id=video_id)
-        service = VideoProcessingService(video)
-        
-        # Pobierz metadane
-        service.update_video_metadata()
-        
-        # Pociąj na shorty
-        shorts = service.cut_into_shorts(crop_mode=crop_mode)
-        
-        # Wygeneruj miniatury
-        for short in shorts:
-            service.generate_thumbnail(short)
-        
-        logger.info(f"Video {video_id} processed successfully. Created {len(shorts)} shorts.")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error processing video {video_id}: {str(e)}")
-        return False
+    if not sha256:
+        return None
+    candidates = Video.objects.filter(source_sha256=sha256).exclude(video_file='').order_by('created_at')
+    for candidate in candidates:
+        if candidate.video_file.storage.exists(candidate.video_file.name):
+            return candidate
+    return None
+
+
+def reset_shorts(video):
+    """
+    Usuwa shorty wideo (rekordy, pliki i miniatury) przed ponownym cięciem,
+    żeby wznawianie nie podjęło plików z poprzednich ustawień.
+    Plik pośredni zostaje - z niego powstaną nowe shorty.
+    """
+    for short in video.shorts.all():
+        for field in (short.short_file, short.thumbnail):
+            if field and os.path.exists(field.path):
+                os.remove(field.path)
+        short.delete()
+    
+    video.shorts_total = 0
+    video.shorts_created = 0
+    video.processing_progress = 0
+    video.save(update_fields=['shorts_total', 'shorts_created', 'processing_progress'])
+
+
+def process_video(video_id, crop_mode='center', encode_profile=None, job=None):
+    """
+    Przetwarza wideo: metadane, cięcie na shorty, miniatury.
+    Propaguje wyjątki - kolejka zadań decyduje o ponowieniu.
+    """
+    video = Video.objects.get(id=video_id)
+    service = VideoProcessingService(video, encode_profile=encode_profile, job=job)
+    
+    # Pobierz metadane
+    service.update_video_metadata()
+    
+    # Pociąj na shorty
+    shorts = service.cut_into_shorts(crop_mode=crop_mode)
+    
+    # Wygeneruj miniatury (jedno wywołanie FFmpeg dla wszystkich shortów)
+    service.generate_thumbnails(shorts)
+    
+    logger.info(f"Video {video_id} processed successfully. Created {len(shorts)} shorts.")
+    return shorts
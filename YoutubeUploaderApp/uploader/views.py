@@ -10,14 +10,20 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, DetailView, UpdateView
 from django.urls import reverse_lazy, reverse
 from django.db.models import Q, Sum
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
-import threading
+from django.utils.formats import date_format, number_format
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from googleapiclient.errors import HttpError
 import logging
 
-from .models import User, Role, Video, Short, YTAccount
-from .forms import UserRegistrationForm, UserLoginForm, VideoUploadForm, ShortEditForm, UserProfileForm, ModeratorUserEditForm, AdminUserEditForm, ModeratorUserCreateForm, AdminUserCreateForm
-from .video_processing import process_video_async, check_ffmpeg_installed
+from .models import User, Role, Video, Short, YTAccount, YTQuotaUsage, UploadSession
+from .forms import UserRegistrationForm, UserLoginForm, VideoUploadForm, UploadSessionForm, VideoRecutForm, ShortEditForm, UserProfileForm, ModeratorUserEditForm, AdminUserEditForm, ModeratorUserCreateForm, AdminUserCreateForm
+from .video_processing import check_ffmpeg_installed, find_duplicate_source, reset_shorts
+from .upload_handlers import DirectToStorageUploadHandler, discard_stored_upload
+from . import chunked_upload, quota, stats_refresh
+from .job_queue import enqueue_video_processing
 
 logger = logging.getLogger(__name__)
 
@@ -350,6 +356,7 @@ def user_dashboard(request):
             'recent_videos': recent_videos,
             'recent_shorts': recent_shorts,
             'yt_account': yt_account,
+            'quota': quota.summary(yt_account) if yt_account else None,
         }
         
         return render(request, 'uploader/dashboard.html', context)
@@ -455,6 +462,11 @@ def admin_dashboard(request):
             'avg_views_per_short': all_shorts.filter(upload_status='published').aggregate(Avg('views'))['views__avg'] or 0,
             'total_yt_accounts': all_yt_accounts.count(),
             'active_yt_accounts': all_yt_accounts.filter(is_active=True).count(),
+            'quota_blocked_yt_accounts': YTQuotaUsage.objects.filter(
+                Q(exhausted=True) | Q(units__gt=quota.get_daily_limit() - quota.QUOTA_COSTS['videos.insert']),
+                day=quota.quota_day(),
+                yt_account__is_active=True
+            ).count(),
         }
         
         # Top użytkownicy
@@ -511,6 +523,7 @@ class VideoListView(LoginRequiredMixin, ListView):
         return queryset.order_by('-created_at')
 
 
+@method_decorator(csrf_exempt, name='dispatch')
 class VideoUploadView(LoginRequiredMixin, CreateView):
     model = Video
     form_class = VideoUploadForm
@@ -521,7 +534,15 @@ class VideoUploadView(LoginRequiredMixin, CreateView):
         if request.user.is_moderator():
             messages.error(request, '❌ Moderatorzy i administratorzy nie mogą uploadować wideo.')
             return redirect('uploader:dashboard')
-        return super().dispatch(request, *args, **kwargs)
+        # Upload zapisywany od razu w MEDIA_ROOT (z SHA-256) - handler musi być
+        # ustawiony przed odczytem request.POST, więc CSRF sprawdzany jest dopiero tutaj
+        handler = DirectToStorageUploadHandler(request)
+        request.upload_handlers = [handler]
+        try:
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        finally:
+            # Odrzucenie CSRF, błąd odczytu żądania itp. - plik bez Video nie zostaje na dysku
+            handler.discard_unclaimed()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -529,26 +550,159 @@ class VideoUploadView(LoginRequiredMixin, CreateView):
         return context
     
     def form_valid(self, form):
+        video = None
         try:
             video = form.save(commit=False)
             video.user = self.request.user
             video.status = 'uploaded'
+            
+            # Plik jest już w docelowym miejscu - FileField nie zapisuje go ponownie
+            uploaded = form.cleaned_data['video_file']
+            if getattr(uploaded, 'stored_name', ''):
+                video.video_file = uploaded.stored_name
+            
+            # Ten sam plik już jest na dysku - współdziel go zamiast trzymać kopię
+            video.source_sha256 = getattr(uploaded, 'sha256', '')
+            duplicate = find_duplicate_source(video.source_sha256)
+            if duplicate:
+                discard_stored_upload(uploaded)
+                video.video_file = duplicate.video_file.name
+                logger.info(f'Upload is a duplicate of video {duplicate.id}, sharing {duplicate.video_file.name}')
             video.save()
             
-            if not check_ffmpeg_installed():
-                messages.warning(self.request, '⚠️ Wideo zostało wgrane, ale FFmpeg nie jest zainstalowany. Shorty nie zostaną wygenerowane. Zobacz FFMPEG_INSTALL.md')
-            else:
-                messages.success(self.request, '✅ Wideo zostało wgrane! Rozpoczynam przetwarzanie...')
-                crop_mode = self.request.POST.get('crop_mode', 'center')
-                thread = threading.Thread(target=process_video_async, args=(video.id, crop_mode))
-                thread.daemon = True
-                thread.start()
+            # FFmpeg sprawdza worker, który pobierze zadanie - web może go nie mieć
+            crop_mode = self.request.POST.get('crop_mode', 'center')
+            enqueue_video_processing(video, crop_mode)
+            messages.success(self.request, '✅ Wideo zostało wgrane i dodane do kolejki przetwarzania!')
             
             return redirect('uploader:video_detail', pk=video.pk)
         except Exception as e:
             logger.error(f'Error uploading video: {str(e)}')
             messages.error(self.request, f'❌ Błąd podczas wgrywania wideo: {str(e)}')
+            if video is None or video.pk is None:
+                discard_stored_upload(form.cleaned_data.get('video_file'))
             return redirect('uploader:video_upload')
+    
+    def form_invalid(self, form):
+        # Odrzucony upload nie może zostać w MEDIA_ROOT
+        for uploaded in self.request.FILES.values():
+            discard_stored_upload(uploaded)
+        return super().form_invalid(form)
+
+
+# ============================================================================
+# UPLOAD W KAWAŁKACH (wznawialny, w stylu tus)
+# ============================================================================
+
+def _upload_session_response(session, status=200, **extra):
+    """Odpowiedź JSON ze stanem sesji i nagłówkami Upload-Offset / Upload-Length"""
+    data = {
+        'id': str(session.id),
+        'offset': session.offset,
+        'size': session.size,
+        'status': session.status,
+        'chunk_size': chunked_upload.get_chunk_size(),
+        'url': reverse('uploader:upload_session_detail', args=[session.id]),
+        'commit_url': reverse('uploader:upload_session_commit', args=[session.id]),
+        **extra,
+    }
+    response = JsonResponse(data, status=status)
+    response['Upload-Offset'] = str(session.offset)
+    response['Upload-Length'] = str(session.size)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _upload_error_response(error):
+    response = JsonResponse({'error': str(error), 'offset': error.offset}, status=error.status)
+    if error.offset is not None:
+        response['Upload-Offset'] = str(error.offset)
+    return response
+
+
+@login_required
+def upload_session_create(request):
+    """POST: rozpoczyna upload w kawałkach (dane wideo + nazwa i rozmiar pliku)"""
+    if request.user.is_moderator():
+        return JsonResponse({'error': 'Moderatorzy i administratorzy nie mogą uploadować wideo.'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Metoda niedozwolona.'}, status=405)
+    
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Nieprawidłowe dane.', 'errors': form.errors}, status=400)
+    
+    data = form.cleaned_data
+    crop_mode = request.POST.get('crop_mode', 'center')
+    session = chunked_upload.create_session(
+        request.user,
+        data['filename'],
+        data['size'],
+        {
+            'title': data['title'],
+            'description': data['description'],
+            'target_duration': data['target_duration'],
+            'max_shorts_count': data['max_shorts_count'],
+            'crop_mode': crop_mode,
+        }
+    )
+    response = _upload_session_response(session, status=201)
+    response['Location'] = reverse('uploader:upload_session_detail', args=[session.id])
+    return response
+
+
+@login_required
+def upload_session_detail(request, session_id):
+    """
+    HEAD/GET: bieżący offset (do wznowienia po zerwaniu połączenia)
+    PATCH/PUT: kawałek pliku od pozycji z nagłówka Upload-Offset
+    DELETE: przerwanie uploadu
+    """
+    session = get_object_or_404(UploadSession, pk=session_id, user=request.user)
+    
+    if request.method in ('HEAD', 'GET'):
+        return _upload_session_response(session)
+    
+    if request.method in ('PATCH', 'PUT'):
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Wymagane nagłówki Upload-Offset i Content-Length.'}, status=400)
+        try:
+            chunked_upload.write_chunk(session, offset, request, length)
+        except chunked_upload.UploadError as e:
+            return _upload_error_response(e)
+        return _upload_session_response(session)
+    
+    if request.method == 'DELETE':
+        if session.status in ('uploading', 'committing'):
+            chunked_upload.abort_session(session)
+        return HttpResponse(status=204)
+    
+    return JsonResponse({'error': 'Metoda niedozwolona.'}, status=405)
+
+
+@login_required
+def upload_session_commit(request, session_id):
+    """POST: kończy upload - tworzy Video i dodaje je do kolejki przetwarzania"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Metoda niedozwolona.'}, status=405)
+    session = get_object_or_404(UploadSession, pk=session_id, user=request.user)
+    
+    try:
+        video = chunked_upload.commit_session(session)
+    except chunked_upload.UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f'Error committing upload session {session_id}: {str(e)}')
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return _upload_session_response(
+        session,
+        video_id=video.pk,
+        redirect_url=reverse('uploader:video_detail', args=[video.pk])
+    )
 
 
 class VideoDetailView(LoginRequiredMixin, DetailView):
@@ -568,9 +722,44 @@ class VideoDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['shorts'] = self.object.shorts.all().order_by('order')
+        context['recut_form'] = VideoRecutForm(instance=self.object)
         return context
 
 
+@login_required
+def video_recut(request, pk):
+    """Ponowne cięcie wideo z nowymi parametrami (z pliku pośredniego, jeśli istnieje)"""
+    if request.user.is_moderator():
+        messages.error(request, '❌ Brak dostępu do tej funkcji.')
+        return redirect('uploader:dashboard')
+    video = get_object_or_404(Video, pk=pk, user=request.user)
+    if request.method != 'POST':
+        return redirect('uploader:video_detail', pk=pk)
+    
+    if video.status in ('uploaded', 'processing'):
+        messages.error(request, '❌ Wideo jest w trakcie przetwarzania.')
+        return redirect('uploader:video_detail', pk=pk)
+    if video.shorts.exclude(upload_status='pending').exists():
+        messages.error(request, '❌ Nie można ponownie pociąć wideo, którego shorty zostały już wysłane na YouTube.')
+        return redirect('uploader:video_detail', pk=pk)
+    
+    form = VideoRecutForm(request.POST, instance=video)
+    if not form.is_valid():
+        messages.error(request, '❌ Nieprawidłowe parametry cięcia.')
+        return redirect('uploader:video_detail', pk=pk)
+    
+    try:
+        video = form.save()
+        reset_shorts(video)
+        crop_mode = request.POST.get('crop_mode', video.mezzanine_crop_mode or 'center')
+        enqueue_video_processing(video, crop_mode)
+        messages.success(request, '✅ Wideo zostało dodane do kolejki ponownego cięcia!')
+    except Exception as e:
+        logger.error(f'Error re-cutting video {pk}: {str(e)}')
+        messages.error(request, f'❌ Błąd podczas ponownego cięcia: {str(e)}')
+    return redirect('uploader:video_detail', pk=pk)
+
+
 @login_required
 def video_delete(request, pk):
     if request.user.is_moderator():
@@ -654,49 +843,8 @@ class ShortDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         short = self.object
         
-        # Automatycznie odśwież statystyki jeśli short jest opublikowany
-        if short.is_published() and short.yt_video_id:
-            from googleapiclient.discovery import build
-            from google.oauth2.credentials import Credentials
-            import os
-            
-            # Wyłącz wymóg HTTPS w developmencie
-            os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
-            
-            yt_account = YTAccount.objects.filter(user=self.request.user).first()
-            if yt_account:
-                try:
-                    # Utwórz credentials z zapisanych tokenów
-                    credentials = Credentials(
-                        token=yt_account.access_token,
-                        refresh_token=yt_account.refresh_token,
-                        token_uri="https://oauth2.googleapis.com/token",
-                        client_id=yt_account.client_id,
-                        client_secret=yt_account.client_secret
-                    )
-                    
-                    # Utwórz YouTube service
-                    youtube = build('youtube', 'v3', credentials=credentials)
-                    
-                    # Pobierz statystyki wideo
-                    video_response = youtube.videos().list(
-                        part='statistics',
-                        id=short.yt_video_id
-                    ).execute()
-                    
-                    if video_response.get('items'):
-                        # Zaktualizuj statystyki
-                        stats = video_response['items'][0]['statistics']
-                        short.views = int(stats.get('viewCount', 0))
-                        short.likes = int(stats.get('likeCount', 0))
-                        short.comments = int(stats.get('commentCount', 0))
-                        
-                        # Oblicz metryki
-                        short.calculate_engagement_rate()
-                        short.last_analytics_update = timezone.now()
-                        short.save()
-                except Exception as e:
-                    logger.error(f'Error auto-refreshing stats: {str(e)}')
+        # Statystyki z bazy; nieaktualne odświeżane w tle (strona odpytuje API)
+        context['stats_refreshing'] = stats_refresh.schedule_refresh(short)
         
         # Generuj sugestie tylko dla opublikowanych shortów
         if short.is_published():
@@ -796,6 +944,17 @@ class ShortEditView(LoginRequiredMixin, UpdateView):
                         self.request,
                         mark_safe(f'✅ Short został opublikowany na YouTube! <a href="{result["video_url"]}" target="_blank" class="underline">Zobacz na YouTube</a>')
                     )
+                elif result.get('deferred'):
+                    # Limit API wyczerpany - publikacja automatycznie po jego odnowieniu
+                    short.upload_status = 'scheduled'
+                    short.scheduled_at = quota.next_reset()
+                    short.save()
+                    
+                    messages.warning(
+                        self.request,
+                        f'⏳ Dzienny limit YouTube API został wyczerpany. Short zostanie opublikowany automatycznie: '
+                        f'{timezone.localtime(short.scheduled_at).strftime("%d.%m.%Y %H:%M")}'
+                    )
                 else:
                     # Błąd uploadu
                     short.upload_status = 'failed'
@@ -860,8 +1019,7 @@ def short_delete(request, pk):
             
             # Jeśli short jest opublikowany na YouTube, usuń go tam również
             if short.is_published() and yt_video_id:
-                from googleapiclient.discovery import build
-                from google.oauth2.credentials import Credentials
+                from .youtube_service import get_youtube_client
                 import os
                 
                 # Wyłącz wymóg HTTPS w developmencie
@@ -869,23 +1027,25 @@ def short_delete(request, pk):
                 
                 yt_account = YTAccount.objects.filter(user=request.user).first()
                 if yt_account:
+                    # Bez budżetu short zostaje - inaczej wideo na YouTube straciłoby powiązanie
+                    if not quota.can_afford(yt_account, 'videos.delete'):
+                        messages.warning(request, '⏳ Dzienny limit YouTube API został wyczerpany. Spróbuj usunąć shorta jutro.')
+                        return redirect('uploader:short_detail', pk=pk)
                     try:
-                        # Utwórz credentials
-                        credentials = Credentials(
-                            token=yt_account.access_token,
-                            refresh_token=yt_account.refresh_token,
-                            token_uri="https://oauth2.googleapis.com/token",
-                            client_id=yt_account.client_id,
-                            client_secret=yt_account.client_secret
-                        )
-                        
-                        # Utwórz YouTube service
-                        youtube = build('youtube', 'v3', credentials=credentials)
+                        # Klient YouTube konta (z cache)
+                        youtube = get_youtube_client(yt_account)
                         
                         # Usuń wideo z YouTube
+                        quota.record(yt_account, 'videos.delete')
                         youtube.videos().delete(id=yt_video_id).execute()
                         logger.info(f'Successfully deleted video {yt_video_id} from YouTube')
                         
+                    except HttpError as e:
+                        if quota.is_quota_error(e):
+                            quota.mark_exhausted(yt_account)
+                            messages.warning(request, '⏳ Dzienny limit YouTube API został wyczerpany. Spróbuj usunąć shorta jutro.')
+                            return redirect('uploader:short_detail', pk=pk)
+                        logger.error(f'Error deleting video from YouTube: {str(e)}')
                     except Exception as e:
                         logger.error(f'Error deleting video from YouTube: {str(e)}')
                         # Kontynuuj usuwanie z bazy danych nawet jeśli usunięcie z YouTube nie powiodło się
@@ -908,8 +1068,7 @@ def short_refresh_stats(request, pk):
         messages.error(request, '❌ Brak dostępu do tej funkcji.')
         return redirect('uploader:dashboard')
         
-    from googleapiclient.discovery import build
-    from google.oauth2.credentials import Credentials
+    from .youtube_service import get_youtube_client
     import os
     
     # Wyłącz wymóg HTTPS w developmencie
@@ -928,20 +1087,16 @@ def short_refresh_stats(request, pk):
         messages.error(request, '❌ Musisz najpierw połączyć konto YouTube!')
         return redirect('uploader:connect_youtube')
     
+    if not quota.can_afford(yt_account, 'videos.list'):
+        messages.warning(request, '⏳ Dzienny limit YouTube API został wyczerpany. Spróbuj ponownie jutro.')
+        return redirect('uploader:short_detail', pk=pk)
+    
     try:
-        # Utwórz credentials z zapisanych tokenów
-        credentials = Credentials(
-            token=yt_account.access_token,
-            refresh_token=yt_account.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=yt_account.client_id,
-            client_secret=yt_account.client_secret
-        )
-        
-        # Utwórz YouTube service
-        youtube = build('youtube', 'v3', credentials=credentials)
+        # Klient YouTube konta (z cache)
+        youtube = get_youtube_client(yt_account)
         
         # Pobierz statystyki wideo
+        quota.record(yt_account, 'videos.list')
         video_response = youtube.videos().list(
             part='statistics',
             id=short.yt_video_id
@@ -1081,7 +1236,7 @@ def youtube_oauth_callback(request):
         messages.error(request, '❌ Brak dostępu do tej funkcji.')
         return redirect('uploader:dashboard')
     from google_auth_oauthlib.flow import Flow
-    from googleapiclient.discovery import build
+    from .youtube_service import build_youtube_client, token_expiry_from_credentials
     import os
     
     # Wyłącz wymóg HTTPS w developmencie
@@ -1124,7 +1279,7 @@ def youtube_oauth_callback(request):
         credentials = flow.credentials
         
         # Pobierz informacje o kanale
-        youtube = build('youtube', 'v3', credentials=credentials)
+        youtube = build_youtube_client(credentials)
         channel_response = youtube.channels().list(
             part='snippet,contentDetails,statistics',
             mine=True
@@ -1148,10 +1303,12 @@ def youtube_oauth_callback(request):
                 'client_secret': client_secret,
                 'access_token': credentials.token,
                 'refresh_token': credentials.refresh_token or '',
-                'token_expiry': credentials.expiry,
+                'token_expiry': token_expiry_from_credentials(credentials),
                 'is_active': True,
             }
         )
+        # channels.list powyżej - konto istnieje dopiero teraz
+        quota.record(yt_account, 'channels.list')
         
         # Wyczyść dane z sesji
         request.session.pop('oauth_state', None)
@@ -1231,6 +1388,26 @@ def api_video_status(request, pk):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required
+def api_short_stats(request, pk):
+    """API endpoint zwracający statystyki shorta (odświeżane w tle, gdy nieaktualne)"""
+    try:
+        short = get_object_or_404(Short, pk=pk, video__user=request.user)
+        last_update = short.last_analytics_update
+        data = {
+            'views': short.views,
+            'likes': short.likes,
+            'comments': short.comments,
+            'engagement_rate': number_format(short.engagement_rate, 1),
+            'last_analytics_update': date_format(timezone.localtime(last_update), 'd.m.Y H:i') if last_update else None,
+            'refreshing': stats_refresh.is_refreshing(short),
+        }
+        return JsonResponse(data)
+    except Exception as e:
+        logger.error(f'Error getting short stats {pk}: {str(e)}')
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @login_required
 def api_video_progress(request, pk):
     """API endpoint zwracający postęp przetwarzania wideo"""
@@ -2,14 +2,21 @@
 Serwis do integracji z YouTube Data API v3
 """
 import os
+import threading
+import time
 import logging
+from datetime import timedelta, timezone as dt_timezone
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
+from .models import Short, YTAccount
+from . import quota
 
 logger = logging.getLogger(__name__)
 
@@ -20,57 +27,209 @@ SCOPES = [
     "https://www.googleapis.com/auth/youtube.force-ssl"
 ]
 
+TOKEN_URI = "https://oauth2.googleapis.com/token"
 
-def refresh_credentials_if_needed(yt_account):
+# Dokument discovery YouTube Data API v3 dołączony do google-api-python-client
+# (wczytywany raz, klient nie pobiera go z sieci)
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+# Maksymalny czas odświeżania tokena przez jeden proces - po nim dzierżawę
+# może przejąć inny (np. gdy proces odświeżający zginął)
+TOKEN_REFRESH_LEASE_SECONDS = 30
+# Co ile sekund sprawdzać, czy inny proces już odświeżył token
+TOKEN_REFRESH_POLL_INTERVAL = 0.2
+
+# Blokady odświeżania tokenów w procesie: id konta -> Lock
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
+
+# Maksymalna liczba ID w jednym wywołaniu videos.list
+VIDEOS_LIST_MAX_IDS = 50
+
+# Klienty per wątek (httplib2 nie jest bezpieczny wątkowo): id konta -> (odcisk credentials, klient)
+_clients = threading.local()
+
+
+def _refresh_lock(account_id):
+    with _refresh_locks_guard:
+        lock = _refresh_locks.get(account_id)
+        if lock is None:
+            lock = _refresh_locks[account_id] = threading.Lock()
+        return lock
+
+
+def token_expiry_from_credentials(credentials):
+    """Data wygaśnięcia z google-auth (naiwna, w UTC) jako aware datetime do zapisu w bazie"""
+    expiry = credentials.expiry
+    if expiry is not None and timezone.is_naive(expiry):
+        expiry = timezone.make_aware(expiry, dt_timezone.utc)
+    return expiry
+
+
+def _token_fresh(yt_account, margin):
+    """Token ważny jeszcze co najmniej `margin` sekund (brak daty wygaśnięcia = ważny)"""
+    if not yt_account.token_expiry:
+        return True
+    return timezone.now() + timedelta(seconds=margin) < yt_account.token_expiry
+
+
+def _claim_refresh_lease(yt_account):
+    """Atomowo przejmuje dzierżawę odświeżania (wolną lub przeterminowaną)"""
+    now = timezone.now()
+    return YTAccount.objects.filter(
+        Q(token_refresh_lease__isnull=True) | Q(token_refresh_lease__lt=now),
+        pk=yt_account.pk
+    ).update(token_refresh_lease=now + timedelta(seconds=TOKEN_REFRESH_LEASE_SECONDS)) == 1
+
+
+def _refresh_token(yt_account):
+    """Wywołuje endpoint tokenów Google i zapisuje nowy token (przy przejętej dzierżawie)"""
+    # Utwórz credentials z danymi użytkownika
+    credentials = Credentials(
+        token=yt_account.access_token,
+        refresh_token=yt_account.refresh_token,
+        token_uri=TOKEN_URI,
+        client_id=yt_account.client_id,
+        client_secret=yt_account.client_secret,
+        scopes=SCOPES
+    )
+    
+    try:
+        # Odśwież token
+        credentials.refresh(Request())
+    except Exception:
+        YTAccount.objects.filter(pk=yt_account.pk).update(token_refresh_lease=None)
+        raise
+    
+    # Zapisz nowy token i zwolnij dzierżawę
+    yt_account.access_token = credentials.token
+    yt_account.token_expiry = token_expiry_from_credentials(credentials)
+    yt_account.token_refresh_lease = None
+    yt_account.save(update_fields=['access_token', 'token_expiry', 'token_refresh_lease', 'updated_at'])
+
+
+def _wait_for_refresh(yt_account, margin):
+    """Czeka na token odświeżony przez inny proces (do końca jego dzierżawy)"""
+    deadline = time.monotonic() + TOKEN_REFRESH_LEASE_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(TOKEN_REFRESH_POLL_INTERVAL)
+        yt_account.refresh_from_db(fields=['access_token', 'token_expiry', 'token_refresh_lease'])
+        if _token_fresh(yt_account, margin):
+            return True
+        if yt_account.token_refresh_lease is None:
+            # Tamten proces się poddał
+            return False
+    return False
+
+
+def refresh_credentials_if_needed(yt_account, margin=0):
     """
     Odświeża credentials jeśli wygasły - używa credentials dostarczone przez użytkownika
     
+    Naraz odświeża tylko jeden wywołujący na konto: w procesie pilnuje tego
+    blokada, między procesami dzierżawa w bazie (token_refresh_lease).
+    Pozostali czekają i dostają token odświeżony przez niego.
+    
     Args:
         yt_account: Obiekt YTAccount z credentials użytkownika
+        margin: Odśwież, jeśli token wygasa w ciągu tylu sekund
         
     Returns:
         bool: True jeśli token jest ważny lub został odświeżony
     """
     try:
-        # Sprawdź czy token wygasł
-        if yt_account.token_expiry and timezone.now() >= yt_account.token_expiry:
-            logger.info(f"Token expired for {yt_account.channel_name}, refreshing...")
+        if _token_fresh(yt_account, margin):
+            return True
+        
+        with _refresh_lock(yt_account.pk):
+            # Inny wątek lub proces mógł właśnie odświeżyć token
+            yt_account.refresh_from_db(fields=['access_token', 'refresh_token', 'token_expiry', 'token_refresh_lease'])
+            if _token_fresh(yt_account, margin):
+                return True
             
             if not yt_account.refresh_token:
                 logger.error("No refresh token available")
                 return False
             
-            # Utwórz credentials z danymi użytkownika
-            credentials = Credentials(
-                token=yt_account.access_token,
-                refresh_token=yt_account.refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=yt_account.client_id,
-                client_secret=yt_account.client_secret,
-                scopes=SCOPES
-            )
-            
-            # Odśwież token
-            credentials.refresh(Request())
-            
-            # Zapisz nowy token
-            yt_account.access_token = credentials.token
-            yt_account.token_expiry = credentials.expiry
-            yt_account.save()
+            if not _claim_refresh_lease(yt_account):
+                logger.info(f"Token refresh for {yt_account.channel_name} in progress elsewhere, waiting...")
+                return _wait_for_refresh(yt_account, margin)
             
+            logger.info(f"Token expiring for {yt_account.channel_name}, refreshing...")
+            _refresh_token(yt_account)
             logger.info(f"Token refreshed successfully for {yt_account.channel_name}")
             return True
         
-        return True
-        
     except Exception as e:
         logger.error(f"Error refreshing credentials: {str(e)}")
         return False
 
 
-def get_authenticated_service(yt_account):
+def refresh_expiring_tokens(margin=None):
     """
-    Tworzy authenticated YouTube service - używa credentials użytkownika
+    Odświeża z wyprzedzeniem tokeny aktywnych kont wygasające w ciągu
+    YT_TOKEN_REFRESH_MARGIN sekund, żeby uploady i widoki nie czekały na Google.
+    
+    Returns:
+        int: Liczba kont z tokenem ważnym po odświeżeniu
+    """
+    if margin is None:
+        margin = getattr(settings, 'YT_TOKEN_REFRESH_MARGIN', 600)
+    
+    expiring = YTAccount.objects.filter(
+        is_active=True,
+        token_expiry__lte=timezone.now() + timedelta(seconds=margin)
+    ).exclude(refresh_token__isnull=True).exclude(refresh_token='')
+    
+    refreshed = 0
+    for yt_account in expiring:
+        if refresh_credentials_if_needed(yt_account, margin=margin):
+            refreshed += 1
+    return refreshed
+
+
+def get_discovery_document():
+    """Dokument discovery YouTube Data API v3 z pakietu biblioteki (bez zapytania sieciowego)"""
+    global _discovery_document
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                _discovery_document = discovery_cache.get_static_doc('youtube', 'v3')
+    return _discovery_document
+
+
+def build_youtube_client(credentials):
+    """
+    Buduje klienta YouTube Data API z dołączonego dokumentu discovery
+    
+    Args:
+        credentials: google.oauth2.credentials.Credentials
+    
+    Returns:
+        googleapiclient.discovery.Resource: YouTube service object
+    """
+    document = get_discovery_document()
+    if document is None:
+        # Starsza biblioteka bez dokumentów w pakiecie
+        return build('youtube', 'v3', credentials=credentials, cache_discovery=False)
+    return build_from_document(document, credentials=credentials)
+
+
+def _credentials_fingerprint(yt_account):
+    """Zmiana tokenów lub danych klienta OAuth unieważnia zbudowanego klienta"""
+    return (
+        yt_account.access_token,
+        yt_account.refresh_token,
+        yt_account.client_id,
+        yt_account.client_secret,
+    )
+
+
+def get_youtube_client(yt_account):
+    """
+    Zwraca klienta YouTube dla konta - jeden na konto i wątek, budowany
+    ponownie tylko po zmianie credentials (np. odświeżeniu tokena)
     
     Args:
         yt_account: Obiekt YTAccount z tokenami OAuth i credentials użytkownika
@@ -82,21 +241,42 @@ def get_authenticated_service(yt_account):
     if not refresh_credentials_if_needed(yt_account):
         raise Exception("Nie udało się odświeżyć tokena. Połącz konto ponownie.")
     
+    cache = getattr(_clients, 'by_account', None)
+    if cache is None:
+        cache = _clients.by_account = {}
+    
+    fingerprint = _credentials_fingerprint(yt_account)
+    cached = cache.get(yt_account.pk)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+    
     # Utwórz credentials z danych użytkownika
     credentials = Credentials(
         token=yt_account.access_token,
         refresh_token=yt_account.refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
+        token_uri=TOKEN_URI,
         client_id=yt_account.client_id,
         client_secret=yt_account.client_secret,
         scopes=SCOPES
     )
-    
-    # Zbuduj service
-    youtube = build('youtube', 'v3', credentials=credentials)
+    youtube = build_youtube_client(credentials)
+    cache[yt_account.pk] = (fingerprint, youtube)
     return youtube
 
 
+def get_authenticated_service(yt_account):
+    """
+    Tworzy authenticated YouTube service - używa credentials użytkownika
+    
+    Args:
+        yt_account: Obiekt YTAccount z tokenami OAuth i credentials użytkownika
+    
+    Returns:
+        googleapiclient.discovery.Resource: YouTube service object
+    """
+    return get_youtube_client(yt_account)
+
+
 def upload_short_to_youtube(short, yt_account, tags=''):
     """
     Upload shorta na YouTube
@@ -109,6 +289,15 @@ def upload_short_to_youtube(short, yt_account, tags=''):
     Returns:
         dict: {'success': bool, 'video_id': str, 'error': str}
     """
+    if not quota.can_afford(yt_account, 'videos.insert'):
+        logger.warning(f"Not enough YouTube quota to upload short {short.id}, deferring")
+        return {
+            'success': False,
+            'video_id': None,
+            'error': 'Dzienny limit YouTube API wyczerpany.',
+            'deferred': True
+        }
+    
     try:
         youtube = get_authenticated_service(yt_account)
         
@@ -178,6 +367,7 @@ def upload_short_to_youtube(short, yt_account, tags=''):
             media_body=media_file
         )
         
+        quota.record(yt_account, 'videos.insert')
         response = None
         while response is None:
             status, response = request.next_chunk()
@@ -199,10 +389,14 @@ def upload_short_to_youtube(short, yt_account, tags=''):
     except HttpError as e:
         error_msg = f"HTTP Error {e.resp.status}: {e.error_details}"
         logger.error(f"YouTube API error: {error_msg}")
+        deferred = quota.is_quota_error(e)
+        if deferred:
+            quota.mark_exhausted(yt_account)
         return {
             'success': False,
             'video_id': None,
-            'error': error_msg
+            'error': error_msg,
+            'deferred': deferred
         }
     except Exception as e:
         error_msg = str(e)
@@ -245,6 +439,7 @@ def get_channel_info(yt_account):
             part="snippet,contentDetails,statistics",
             mine=True
         )
+        quota.record(yt_account, 'channels.list')
         response = request.execute()
         
         if response['items']:
@@ -264,6 +459,7 @@ def get_video_analytics(yt_account, video_id):
             part="statistics",
             id=video_id
         )
+        quota.record(yt_account, 'videos.list')
         response = request.execute()
         
         if response['items']:
@@ -277,3 +473,140 @@ def get_video_analytics(yt_account, video_id):
     except Exception as e:
         logger.error(f"Error getting video analytics: {str(e)}")
         return None
+
+
+def _apply_statistics(short, stats):
+    """Ustawia statystyki z videos.list na shorcie; zwraca True, gdy coś się zmieniło"""
+    views = int(stats.get('viewCount', 0))
+    likes = int(stats.get('likeCount', 0))
+    comments = int(stats.get('commentCount', 0))
+    if (short.views, short.likes, short.comments) == (views, likes, comments):
+        return False
+    short.views = views
+    short.likes = likes
+    short.comments = comments
+    short.calculate_engagement_rate()
+    return True
+
+
+def sync_account_stats(yt_account, shorts):
+    """
+    Pobiera statystyki shortów konta po VIDEOS_LIST_MAX_IDS ID na wywołanie
+    videos.list i zapisuje zmienione wiersze jednym bulk_update na paczkę.
+    
+    Args:
+        yt_account: YTAccount właściciela shortów
+        shorts: Lista opublikowanych shortów z yt_video_id
+    
+    Paczki, na które brakuje dziennego limitu quota, są pomijane (deferred)
+    i zostaną pobrane przy następnej synchronizacji.
+    
+    Returns:
+        dict: {'fetched': int, 'updated': int, 'missing': int, 'calls': int, 'deferred': int}
+    """
+    youtube = get_youtube_client(yt_account)
+    result = {'fetched': 0, 'updated': 0, 'missing': 0, 'calls': 0, 'deferred': 0}
+    
+    for start in range(0, len(shorts), VIDEOS_LIST_MAX_IDS):
+        batch = shorts[start:start + VIDEOS_LIST_MAX_IDS]
+        if not quota.can_afford(yt_account, 'videos.list'):
+            result['deferred'] = len(shorts) - start
+            logger.warning(f"Stats sync {yt_account.channel_name}: quota exhausted, "
+                           f"{result['deferred']} shorts deferred")
+            break
+        
+        quota.record(yt_account, 'videos.list')
+        try:
+            response = youtube.videos().list(
+                part='statistics',
+                id=','.join(short.yt_video_id for short in batch)
+            ).execute()
+        except HttpError as e:
+            if not quota.is_quota_error(e):
+                raise
+            quota.mark_exhausted(yt_account)
+            result['deferred'] = len(shorts) - start
+            break
+        result['calls'] += 1
+        
+        stats_by_id = {item['id']: item.get('statistics', {}) for item in response.get('items', [])}
+        now = timezone.now()
+        changed = []
+        unchanged = []
+        for short in batch:
+            stats = stats_by_id.get(short.yt_video_id)
+            if stats is None:
+                # Usunięte lub niedostępne na YouTube - zapisz sam czas sprawdzenia,
+                # żeby odświeżanie w tle nie pytało o nie przy każdym wyświetleniu
+                logger.warning(f"Short {short.pk}: video {short.yt_video_id} not returned by YouTube")
+                result['missing'] += 1
+                short.last_analytics_update = now
+                unchanged.append(short.pk)
+                continue
+            result['fetched'] += 1
+            short.last_analytics_update = now
+            if _apply_statistics(short, stats):
+                changed.append(short)
+            else:
+                unchanged.append(short.pk)
+        
+        if changed:
+            Short.objects.bulk_update(
+                changed, ['views', 'likes', 'comments', 'engagement_rate', 'last_analytics_update']
+            )
+            result['updated'] += len(changed)
+        if unchanged:
+            # Niezmienione (lub niedostępne) statystyki - tylko czas sprawdzenia
+            Short.objects.filter(pk__in=unchanged).update(last_analytics_update=now)
+    
+    yt_account.last_sync = timezone.now()
+    yt_account.save(update_fields=['last_sync', 'updated_at'])
+    return result
+
+
+def sync_short_stats(yt_account=None, stale_after=None):
+    """
+    Synchronizuje statystyki opublikowanych shortów, konto po koncie.
+    
+    Args:
+        yt_account: Tylko shorty tego konta (domyślnie wszystkie aktywne konta)
+        stale_after: Tylko shorty aktualizowane dawniej niż tyle sekund temu
+    
+    Returns:
+        dict: Sumy {'accounts', 'fetched', 'updated', 'missing', 'calls', 'deferred', 'errors'}
+    """
+    accounts = [yt_account] if yt_account else YTAccount.objects.filter(is_active=True).select_related('user')
+    totals = {'accounts': 0, 'fetched': 0, 'updated': 0, 'missing': 0, 'calls': 0, 'deferred': 0, 'errors': 0}
+    seen_users = set()
+    
+    for account in accounts:
+        # Shorty należą do użytkownika - jego pierwsze aktywne konto je publikuje
+        if account.user_id in seen_users:
+            continue
+        seen_users.add(account.user_id)
+        
+        shorts = Short.objects.filter(
+            video__user_id=account.user_id,
+            upload_status='published',
+            yt_video_id__isnull=False
+        ).exclude(yt_video_id='')
+        if stale_after is not None:
+            cutoff = timezone.now() - timedelta(seconds=stale_after)
+            shorts = shorts.filter(Q(last_analytics_update__isnull=True) | Q(last_analytics_update__lt=cutoff))
+        shorts = list(shorts.order_by('last_analytics_update', 'pk'))
+        if not shorts:
+            continue
+        
+        totals['accounts'] += 1
+        try:
+            result = sync_account_stats(account, shorts)
+        except Exception as e:
+            logger.error(f"Stats sync failed for {account.channel_name}: {str(e)}")
+            totals['errors'] += 1
+            continue
+        for key, value in result.items():
+            totals[key] += value
+        logger.info(f"Stats sync {account.channel_name}: {result['fetched']} fetched, "
+                    f"{result['updated']} updated in {result['calls']} calls")
+    
+    return totals